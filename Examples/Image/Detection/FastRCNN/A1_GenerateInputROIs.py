@@ -8,13 +8,15 @@ from __future__ import print_function
 from builtins import input
 import os, sys, datetime
 import numpy as np
-import shutil, time
+import shutil, time, multiprocessing
+import cv2
+from easydict import EasyDict
 import PARAMETERS
 
 from cntk_helpers import makeDirectory, getFilesInDirectory, imread, imWidth, imHeight, imWidthHeight,\
-                         getSelectiveSearchRois, imArrayWidthHeight, getGridRois, filterRois, imArrayWidth,\
-                         imArrayHeight, getCntkInputPaths, getCntkRoiCoordsLine, getCntkRoiLabelsLine, roiTransformPadScaleParams,\
-                         roiTransformPadScale, cntkPadInputs
+                         getSelectiveSearchRoisCached, imArrayWidthHeight, imresizeMaxDim, getGridRois, filterRois, imArrayWidth,\
+                         imArrayHeight, getCntkInputPaths, roiTransformPadScaleParams, getCntkRoiCoordsAndLabels,\
+                         getCntkRoiCoordsString, getCntkRoiLabelsString, cntkPadInputs, createCntkRoiStore, saveRois
 
 ####################################
 # Parameters
@@ -27,63 +29,86 @@ image_sets = ["train", "test"]
 boAddSelectiveSearchROIs = True
 boAddRoisOnGrid = True
 
+def _generate_image_rois(args):
+    # computes the rois of one image in original image coordinates. Runs in a worker process,
+    # hence the log messages are returned instead of printed.
+    imgPath, p = args
+    log = []
+    tstart = datetime.datetime.now()
+    imgOrig = imread(imgPath)
+    if imArrayWidth(imgOrig) > imArrayHeight(imgOrig):
+        log.append(str((imArrayWidth(imgOrig), imArrayHeight(imgOrig))))
+
+    # get rois
+    if boAddSelectiveSearchROIs:
+        rects, imgWidth, imgHeight, scale, cached = getSelectiveSearchRoisCached(imgPath, imgOrig, p.ss_scale, p.ss_sigma,
+                                                                                 p.ss_minSize, p.roi_maxImgDim, p.roiCacheDir)
+        log.append("   Number of rois detected using selective search: " + str(len(rects)) + (" (cached)" if cached else ""))
+    else:
+        rects = []
+        img, scale = imresizeMaxDim(imgOrig, p.roi_maxImgDim, boUpscale=True, interpolation=cv2.INTER_AREA)
+        imgWidth, imgHeight = imArrayWidthHeight(img)
+
+    # add grid rois
+    if boAddRoisOnGrid:
+        rectsGrid = getGridRois(imgWidth, imgHeight, p.grid_nrScales, p.grid_aspectRatios)
+        log.append("   Number of rois on grid added: " + str(len(rectsGrid)))
+        rects += rectsGrid
+
+    # run filter
+    log.append("   Number of rectangles before filtering  = " + str(len(rects)))
+    rois = filterRois(rects, imgWidth, imgHeight, p.roi_minNrPixels, p.roi_maxNrPixels, p.roi_minDim, p.roi_maxDim, p.roi_maxAspectRatio)
+    if len(rois) == 0: #make sure at least one roi returned per image
+        rois = [[5, 5, imgWidth-5, imgHeight-5]]
+    log.append("   Number of rectangles after filtering  = " + str(len(rois)))
+
+    # scale up to original size
+    # note: each rectangle is in original image format with [x,y,x2,y2]
+    rois = np.int32(np.array(rois) / scale)
+    assert (np.min(rois) >= 0)
+    assert (np.max(rois[:, [0,2]]) < imArrayWidth(imgOrig))
+    assert (np.max(rois[:, [1,3]]) < imArrayHeight(imgOrig))
+    log.append("   Time [ms]: " + str((datetime.datetime.now() - tstart).total_seconds() * 1000))
+    return rois, log
+
+
 def generate_input_rois(testing=False):
     p = PARAMETERS.get_parameters_for_dataset()
     if not p.datasetName.startswith("pascalVoc"):
         # init
         makeDirectory(p.roiDir)
-        roi_minDim = p.roi_minDimRel * p.roi_maxImgDim
-        roi_maxDim = p.roi_maxDimRel * p.roi_maxImgDim
-        roi_minNrPixels = p.roi_minNrPixelsRel * p.roi_maxImgDim*p.roi_maxImgDim
-        roi_maxNrPixels = p.roi_maxNrPixelsRel * p.roi_maxImgDim*p.roi_maxImgDim
-
-        for subdir in subDirs:
-            makeDirectory(os.path.join(p.roiDir, subdir))
-            imgFilenames = getFilesInDirectory(os.path.join(p.imgDir, subdir), ".jpg")
-
-            # loop over all images
-            for imgIndex,imgFilename in enumerate(imgFilenames):
-                roiPath = "{}/{}/{}.roi.txt".format(p.roiDir, subdir, imgFilename[:-4])
-
-                # load image
-                print (imgIndex, len(imgFilenames), subdir, imgFilename)
-                tstart = datetime.datetime.now()
-                imgPath = os.path.join(p.imgDir, subdir, imgFilename)
-                imgOrig = imread(imgPath)
-                if imWidth(imgPath) > imHeight(imgPath):
-                    print (imWidth(imgPath) , imHeight(imgPath))
-
-                # get rois
-                if boAddSelectiveSearchROIs:
-                    print ("Calling selective search..")
-                    rects, img, scale = getSelectiveSearchRois(imgOrig, p.ss_scale, p.ss_sigma, p.ss_minSize, p.roi_maxImgDim) #interpolation=cv2.INTER_AREA
-                    print ("   Number of rois detected using selective search: " + str(len(rects)))
-                else:
-                    rects = []
-                    img, scale = imresizeMaxDim(imgOrig, p.roi_maxImgDim, boUpscale=True, interpolation=cv2.INTER_AREA)
-                imgWidth, imgHeight = imArrayWidthHeight(img)
-
-                # add grid rois
-                if boAddRoisOnGrid:
-                    rectsGrid = getGridRois(imgWidth, imgHeight, p.grid_nrScales, p.grid_aspectRatios)
-                    print ("   Number of rois on grid added: " + str(len(rectsGrid)))
-                    rects += rectsGrid
-
-                # run filter
-                print ("   Number of rectangles before filtering  = " + str(len(rects)))
-                rois = filterRois(rects, imgWidth, imgHeight, roi_minNrPixels, roi_maxNrPixels, roi_minDim, roi_maxDim, p.roi_maxAspectRatio)
-                if len(rois) == 0: #make sure at least one roi returned per image
-                    rois = [[5, 5, imgWidth-5, imgHeight-5]]
-                print ("   Number of rectangles after filtering  = " + str(len(rois)))
-
-                # scale up to original size and save to disk
-                # note: each rectangle is in original image format with [x,y,x2,y2]
-                rois = np.int32(np.array(rois) / scale)
-                assert (np.min(rois) >= 0)
-                assert (np.max(rois[:, [0,2]]) < imArrayWidth(imgOrig))
-                assert (np.max(rois[:, [1,3]]) < imArrayHeight(imgOrig))
-                np.savetxt(roiPath, rois, fmt='%d')
-                print ("   Time [ms]: " + str((datetime.datetime.now() - tstart).total_seconds() * 1000))
+        makeDirectory(p.roiCacheDir)
+
+        # the parameters the workers need, without the imdbs which are expensive to send
+        roiParams = EasyDict(
+            ss_scale = p.ss_scale, ss_sigma = p.ss_sigma, ss_minSize = p.ss_minSize,
+            roi_maxImgDim = p.roi_maxImgDim, roiCacheDir = p.roiCacheDir,
+            grid_nrScales = p.grid_nrScales, grid_aspectRatios = p.grid_aspectRatios,
+            roi_minDim = p.roi_minDimRel * p.roi_maxImgDim,
+            roi_maxDim = p.roi_maxDimRel * p.roi_maxImgDim,
+            roi_minNrPixels = p.roi_minNrPixelsRel * p.roi_maxImgDim*p.roi_maxImgDim,
+            roi_maxNrPixels = p.roi_maxNrPixelsRel * p.roi_maxImgDim*p.roi_maxImgDim,
+            roi_maxAspectRatio = p.roi_maxAspectRatio)
+
+        nrWorkers = p.roi_nrWorkers or multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(nrWorkers) if nrWorkers > 1 else None
+        try:
+            for subdir in subDirs:
+                makeDirectory(os.path.join(p.roiDir, subdir))
+                imgFilenames = getFilesInDirectory(os.path.join(p.imgDir, subdir), ".jpg")
+                jobs = [(os.path.join(p.imgDir, subdir, imgFilename), roiParams) for imgFilename in imgFilenames]
+                results = pool.imap(_generate_image_rois, jobs) if pool else map(_generate_image_rois, jobs)
+
+                # save to disk in image order as the results arrive
+                for imgIndex, (imgFilename, (rois, log)) in enumerate(zip(imgFilenames, results)):
+                    print (imgIndex, len(imgFilenames), subdir, imgFilename)
+                    for line in log:
+                        print (line)
+                    saveRois(p.roiDir, subdir, imgFilename, rois)
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
 
     # clear imdb cache and other files
     if os.path.exists(p.cntkFilesDir):
@@ -102,8 +127,10 @@ def generate_input_rois(testing=False):
         print ("Number of images in set {} = {}".format(image_set, imdb.num_images))
         makeDirectory(p.cntkFilesDir)
 
-        # open files for writing
+        # open files for writing. The rois and labels are written both to the binary store, which
+        # the python scripts load, and to the cntk text files read by the cntk minibatch sources.
         cntkImgsPath, cntkRoiCoordsPath, cntkRoiLabelsPath, nrRoisPath = getCntkInputPaths(p.cntkFilesDir, image_set)
+        roiCoordsStore, roiLabelsStore, nrRoisStore = createCntkRoiStore(p.cntkFilesDir, image_set, imdb.num_images, p.cntk_nrRois)
         with open(nrRoisPath, 'w')        as nrRoisFile, \
              open(cntkImgsPath, 'w')      as cntkImgsFile, \
              open(cntkRoiCoordsPath, 'w') as cntkRoiCoordsFile, \
@@ -121,18 +148,18 @@ def generate_input_rois(testing=False):
                     # all rois need to be scaled + padded to cntk input image size
                     targetw, targeth, w_offset, h_offset, scale = roiTransformPadScaleParams(imgWidth, imgHeight,
                                                                                p.cntk_padWidth, p.cntk_padHeight)
-                    boxesStr = ""
-                    labelsStr = ""
+                    relCoords, labels = getCntkRoiCoordsAndLabels(currBoxes, currGtOverlaps, w_offset, h_offset, scale,
+                                                                  p.cntk_padWidth, p.cntk_padHeight, p.train_posOverlapThres)
                     nrBoxes = len(currBoxes)
-                    for boxIndex, box in enumerate(currBoxes):
-                        rect = roiTransformPadScale(box, w_offset, h_offset, scale)
-                        boxesStr += getCntkRoiCoordsLine(rect, p.cntk_padWidth, p.cntk_padHeight)
-                        labelsStr += getCntkRoiLabelsLine(currGtOverlaps[boxIndex, :].toarray()[0],
-                                                       p.train_posOverlapThres,
-                                                       p.nrClasses)
 
                     # if less than e.g. 2000 rois per image, then fill in the rest using 'zero-padding'.
-                    boxesStr, labelsStr = cntkPadInputs(nrBoxes, p.cntk_nrRois, p.nrClasses, boxesStr, labelsStr)
+                    boxesStr, labelsStr = cntkPadInputs(nrBoxes, p.cntk_nrRois, p.nrClasses, getCntkRoiCoordsString(relCoords),
+                                                        getCntkRoiLabelsString(labels, p.nrClasses))
+
+                    # update binary store, its zero-initialized entries already hold the zero-padded rois
+                    roiCoordsStore[imgIndex, :nrBoxes] = relCoords
+                    roiLabelsStore[imgIndex, :nrBoxes] = labels
+                    nrRoisStore[imgIndex] = nrBoxes
 
                     # update cntk data
                     nrRoisFile.write("{}\n".format(nrBoxes))
@@ -140,6 +167,9 @@ def generate_input_rois(testing=False):
                     cntkRoiCoordsFile.write("{} |rois{}\n".format(imgIndex, boxesStr))
                     cntkRoiLabelsFile.write("{} |roiLabels{}\n".format(imgIndex, labelsStr))
 
+        for store in [roiCoordsStore, roiLabelsStore, nrRoisStore]:
+            store.flush()
+
     print ("DONE.")
     return True
 
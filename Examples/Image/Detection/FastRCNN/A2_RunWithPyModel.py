@@ -15,6 +15,7 @@ from cntk.learners import momentum_sgd, learning_rate_schedule, momentum_as_time
 from cntk.logging import log_number_of_parameters, ProgressPrinter
 from cntk.logging.graph import find_by_name, plot
 import PARAMETERS
+from cntk_helpers import makeDirectory, createCntkOutputStore
 import numpy as np
 import os, sys
 
@@ -189,17 +190,22 @@ def evaluate_fast_rcnn(model):
         model.arguments[1]: test_minibatch_source[roi_stream_name],
     }
 
-    # evaluate test images and write netwrok output to file
+    # evaluate test images and write network output to the binary output store read by A3 and B3
     print("Evaluating Fast R-CNN model for %s images." % num_test_images)
-    results_file_path = os.path.join(base_path, "test.z")
-    with open(results_file_path, 'wb') as results_file:
-        for i in range(0, num_test_images):
-            data = test_minibatch_source.next_minibatch(1, input_map=input_map)
-            output = model.eval(data)
-            out_values = output[0].flatten()
-            np.savetxt(results_file, out_values[np.newaxis], fmt="%.6f")
-            if (i+1) % 100 == 0:
-                print("Evaluated %s images.." % (i+1))
+    results_dir = os.path.join(base_path, "test_parsed")
+    makeDirectory(results_dir)
+    results = None
+    for i in range(0, num_test_images):
+        data = test_minibatch_source.next_minibatch(1, input_map=input_map)
+        output = model.eval(data)
+        out_values = output[0].reshape(num_rois, -1)
+        if results is None:
+            results = createCntkOutputStore(results_dir, num_test_images, num_rois, out_values.shape[1])
+        results[i] = out_values
+        if (i+1) % 100 == 0:
+            print("Evaluated %s images.." % (i+1))
+    if results is not None:
+        results.flush()
 
     return True
 
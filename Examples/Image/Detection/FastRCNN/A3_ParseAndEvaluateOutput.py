@@ -11,7 +11,7 @@ import os
 from fastRCNN.test import test_net as evaluate_net
 from fastRCNN.timer import Timer
 from imdb_data import imdb_data
-from cntk_helpers import makeDirectory, parseCntkOutput, DummyNet, deleteAllFilesInDirectory
+from cntk_helpers import makeDirectory, parseCntkOutput, getCntkOutputStorePath, DummyNet, deleteAllFilesInDirectory
 import PARAMETERS
 
 
@@ -22,16 +22,22 @@ image_set = 'test' # 'train', 'test'
 
 def evaluate_output():
     p = PARAMETERS.get_parameters_for_dataset()
-    # parse cntk output
-    print ("Parsing CNTK output for image set: " + image_set)
     cntkImgsListPath = os.path.join(p.cntkFilesDir, image_set + ".txt")
     outParsedDir = os.path.join(p.cntkFilesDir, image_set + "_parsed")
     cntkOutputPath = os.path.join(p.cntkFilesDir, image_set + ".z")
+    outputStorePath = getCntkOutputStorePath(outParsedDir)
 
-    # write cntk output for each image to separate file
-    makeDirectory(outParsedDir)
-    parseCntkOutput(cntkImgsListPath, cntkOutputPath, outParsedDir, p.cntk_nrRois, p.cntk_featureDimensions[p.classifier],
-                    saveCompressed=True, skipCheck=True)
+    # A2_RunWithPyModel writes the output store directly, the cntk output of A2_RunWithBSModel is
+    # a text file which needs to be parsed. Use whichever of both was written last.
+    if os.path.exists(outputStorePath) and not (os.path.exists(cntkOutputPath) and
+                                                os.path.getmtime(cntkOutputPath) > os.path.getmtime(outputStorePath)):
+        print ("Using CNTK output store: " + outputStorePath)
+    else:
+        # parse cntk output and write it to the output store
+        print ("Parsing CNTK output for image set: " + image_set)
+        makeDirectory(outParsedDir)
+        parseCntkOutput(cntkImgsListPath, cntkOutputPath, outParsedDir, p.cntk_nrRois, p.cntk_featureDimensions[p.classifier],
+                        skipCheck=True)
 
     # delete cntk output file which can be very large
     # deleteFile(cntkOutputPath)
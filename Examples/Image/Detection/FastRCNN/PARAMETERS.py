@@ -30,6 +30,7 @@ class Parameters():
         self.resultsDir = os.path.join(self.rootDir, "results", datasetName + "_{}".format(self.cntk_nrRois))
         self.roiDir = os.path.join(self.procDir, "rois")
         self.cntkFilesDir = os.path.join(self.procDir, "cntkFiles")
+        self.roiCacheDir = os.path.join(self.rootDir, "proc", "roiCache")  # selective search ROIs by image content and parameters
         self.cntkTemplateDir = self.rootDir
 
         # ROI generation
@@ -44,6 +45,7 @@ class Parameters():
         self.ss_minSize = 20           # selective search ROIs: minimum component size for segmentation
         self.grid_nrScales = 7         # uniform grid ROIs: number of iterations from largest possible ROI to smaller ROIs
         self.grid_aspectRatios = [1.0, 2.0, 0.5]    # uniform grid ROIs: aspect ratio of ROIs
+        self.roi_nrWorkers = None      # number of processes generating ROIs (None: one per CPU core, 1: no worker processes)
 
         # thresholds
         self.train_posOverlapThres = 0.5 # threshold for marking ROIs as positive.
@@ -6,11 +6,11 @@
 
 from __future__ import print_function
 from builtins import str
-import pdb, sys, os, time
+import pdb, sys, os, time, hashlib
 import numpy as np
 import selectivesearch
 from easydict import EasyDict
-from fastRCNN.nms import nms as nmsPython
+from fastRCNN.nms import nms as nmsPython, nms_batched as nmsBatched
 from builtins import range
 
 import cv2, copy, textwrap
@@ -61,6 +61,45 @@ def getSelectiveSearchRois(img, ssScale, ssSigma, ssMinSize, maxDim):
     return rects, img, scale
 
 
+def getSelectiveSearchRoisCacheKey(imgPath, ssScale, ssSigma, ssMinSize, maxDim):
+    # key of the selective search rois of an image: the hash of the image file content
+    # and of all parameters the rois depend on
+    hasher = hashlib.sha1()
+    with open(imgPath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(block)
+    hasher.update(repr((float(ssScale), float(ssSigma), int(ssMinSize), int(maxDim))).encode('ascii'))
+    return hasher.hexdigest()
+
+
+def getSelectiveSearchRoisCached(imgPath, imgOrig, ssScale, ssSigma, ssMinSize, maxDim, cacheDir):
+    # Same as getSelectiveSearchRois, but the rois are stored in cacheDir and re-used as long as
+    # neither the image nor the parameters change. Instead of the resized image, its width and
+    # height are returned, together with whether the rois came from the cache.
+    cachePath = os.path.join(cacheDir, getSelectiveSearchRoisCacheKey(imgPath, ssScale, ssSigma, ssMinSize, maxDim) + ".npz")
+    if os.path.exists(cachePath):
+        try:
+            with np.load(cachePath) as data:
+                imgWidth, imgHeight = [int(v) for v in data['imgSize']]
+                return data['rects'].tolist(), imgWidth, imgHeight, float(data['scale']), True
+        except (IOError, ValueError, KeyError):
+            pass # incomplete or corrupt file, recompute
+
+    rects, img, scale = getSelectiveSearchRois(imgOrig, ssScale, ssSigma, ssMinSize, maxDim)
+    imgWidth, imgHeight = imArrayWidthHeight(img)
+
+    # write to a temporary file first, so that concurrent readers never see a partial file
+    makeDirectory(cacheDir)
+    tmpPath = "{}.{}.tmp.npz".format(cachePath[:-4], os.getpid())
+    np.savez(tmpPath, rects=np.array(rects, np.int32).reshape(-1, 4),
+             imgSize=np.array([imgWidth, imgHeight], np.int32), scale=np.float64(scale))
+    try:
+        os.rename(tmpPath, cachePath)
+    except OSError: # on Windows, another process wrote the same entry
+        os.remove(tmpPath)
+    return rects, imgWidth, imgHeight, scale, False
+
+
 def getGridRois(imgWidth, imgHeight, nrGridScales, aspectRatios = [1.0]):
     rects = []
     # start adding large ROIs and then smaller ones
@@ -117,12 +156,18 @@ def filterRois(rects, maxWidth, maxHeight, roi_minNrPixels, roi_maxNrPixels,
     return filteredRects
 
 
+def getRoisPath(roiDir, subdir, imgFilename):
+    return os.path.join(roiDir, subdir, imgFilename[:-4] + ".roi.npy")
+
+def saveRois(roiDir, subdir, imgFilename, rois):
+    np.save(getRoisPath(roiDir, subdir, imgFilename), np.array(rois, np.int32).reshape(-1, 4))
+
+# returns the rois of an image as nrRois x 4 array. Older roi directories contain text files instead of .npy files.
 def readRois(roiDir, subdir, imgFilename):
-    roiPath = os.path.join(roiDir, subdir, imgFilename[:-4] + ".roi.txt")
-    rois = np.loadtxt(roiPath, np.int)
-    if len(rois) == 4 and type(rois[0]) == np.int32:  # if only a single ROI in an image
-        rois = [rois]
-    return rois
+    roiPath = getRoisPath(roiDir, subdir, imgFilename)
+    if os.path.exists(roiPath):
+        return np.load(roiPath)
+    return np.loadtxt(roiPath[:-4] + ".txt", np.int32, ndmin=2)
 
 
 ####################################
@@ -143,6 +188,27 @@ def getCntkInputPaths(cntkFilesDir, image_set):
     cntkNrRoisPath = os.path.join(cntkFilesDir, image_set + '.nrRois.txt')
     return cntkImgsListPath, cntkRoiCoordsPath, cntkRoiLabelsPath, cntkNrRoisPath
 
+# path of the binary store with the same data as a cntk text file, e.g. train.rois.npy for train.rois.txt.
+# The stores are .npy files which can be memory-mapped, i.e. loaded without parsing any text.
+def getCntkStorePath(cntkFilePath):
+    return os.path.splitext(cntkFilePath)[0] + ".npy"
+
+def getCntkRoiStorePaths(cntkFilesDir, image_set):
+    _, cntkRoiCoordsPath, cntkRoiLabelsPath, cntkNrRoisPath = getCntkInputPaths(cntkFilesDir, image_set)
+    return getCntkStorePath(cntkRoiCoordsPath), getCntkStorePath(cntkRoiLabelsPath), getCntkStorePath(cntkNrRoisPath)
+
+# create the stores for the relative roi co-ordinates (x, y, w, h), the roi labels and the number of real rois.
+# Everything is initialized to zero, which is the format of the zero-padded rois.
+def createCntkRoiStore(cntkFilesDir, image_set, nrImages, nrRois):
+    roiCoordsStorePath, roiLabelsStorePath, nrRoisStorePath = getCntkRoiStorePaths(cntkFilesDir, image_set)
+    roiCoords = np.lib.format.open_memmap(roiCoordsStorePath, mode='w+', dtype=np.float32, shape=(nrImages, nrRois, 4))
+    roiLabels = np.lib.format.open_memmap(roiLabelsStorePath, mode='w+', dtype=np.int32, shape=(nrImages, nrRois))
+    nrRealRois = np.lib.format.open_memmap(nrRoisStorePath, mode='w+', dtype=np.int32, shape=(nrImages,))
+    return roiCoords, roiLabels, nrRealRois
+
+def readCntkRoiStore(cntkFilesDir, image_set, mmap_mode = 'r'):
+    return tuple(np.load(path, mmap_mode=mmap_mode) for path in getCntkRoiStorePaths(cntkFilesDir, image_set))
+
 def roiTransformPadScaleParams(imgWidth, imgHeight, padWidth, padHeight, boResizeImg = True):
     scale = 1.0
     if boResizeImg:
@@ -193,12 +259,34 @@ def getCntkRoiLabelsLine(overlaps, thres, nrClasses):
     oneHotString = " {}".format(" ".join(str(x) for x in oneHot))
     return oneHotString
 
+# same as roiTransformPadScale, getCntkRoiCoordsLine and getCntkRoiLabelsLine, but for all rois of an image at once.
+# Returns the relative roi co-ordinates (x, y, w, h) and the roi labels as arrays.
+def getCntkRoiCoordsAndLabels(boxes, gtOverlaps, w_offset, h_offset, scale, targetw, targeth, thres):
+    rects = np.round(scale * np.array(boxes, np.float64).reshape(-1, 4)) + [w_offset, h_offset, w_offset, h_offset]
+    relCoords = np.column_stack((rects[:, :2], rects[:, 2:] - rects[:, :2])) / [targetw, targeth, targetw, targeth]
+    assert np.all(relCoords[:, :2] <= 1.0), "Error: xrel and yrel should be <= 1 but max is " + str(relCoords[:, :2].max())
+    assert np.all(relCoords[:, 2:] >= 0.0), "Error: wrel and hrel should be >= 0 but min is " + str(relCoords[:, 2:].min())
+
+    # set to background label if small overlap with GT
+    overlaps = gtOverlaps.toarray() if hasattr(gtOverlaps, 'toarray') else np.asarray(gtOverlaps)
+    labels = np.argmax(overlaps, axis=1)
+    labels[overlaps[np.arange(len(labels)), labels] < thres] = 0
+    return relCoords, labels
+
+# cntk text format of the relative roi co-ordinates and the roi labels, i.e. the concatenated
+# getCntkRoiCoordsLine and getCntkRoiLabelsLine strings of all rois
+def getCntkRoiCoordsString(relCoords):
+    return "".join(" {} {} {} {}".format(*rect) for rect in np.asarray(relCoords, np.float64).tolist())
+
+def getCntkRoiLabelsString(labels, nrClasses):
+    oneHotStrings = [" 0" * label + " 1" + " 0" * (nrClasses - label - 1) for label in range(nrClasses)]
+    return "".join(oneHotStrings[label] for label in labels)
+
 def cntkPadInputs(currentNrRois, targetNrRois, nrClasses, boxesStr, labelsStr):
     assert currentNrRois <= targetNrRois, "Current number of rois ({}) should be <= target number of rois ({})".format(currentNrRois, targetNrRois)
-    while currentNrRois < targetNrRois:
-        boxesStr += " 0 0 0 0"
-        labelsStr += " 1" + " 0" * (nrClasses - 1)
-        currentNrRois += 1
+    nrPaddedRois = targetNrRois - currentNrRois
+    boxesStr += " 0 0 0 0" * nrPaddedRois
+    labelsStr += (" 1" + " 0" * (nrClasses - 1)) * nrPaddedRois
     return boxesStr, labelsStr
 
 def checkCntkOutputFile(cntkImgsListPath, cntkOutputPath, cntkNrRois, outputDim):
@@ -211,15 +299,34 @@ def checkCntkOutputFile(cntkImgsListPath, cntkOutputPath, cntkNrRois, outputDim)
                 assert (fp.readline() != "")
         assert (fp.readline() == "") # test if end-of-file is reached
 
-# parse the cntk output file and save the output for each image individually
+# the network output of all images is stored in a single nrImages x nrRois x outputDim array
+def getCntkOutputStorePath(cntkParsedOutputDir):
+    return os.path.join(cntkParsedOutputDir, "outputs.npy")
+
+def createCntkOutputStore(cntkParsedOutputDir, nrImages, nrRois, outputDim):
+    return np.lib.format.open_memmap(getCntkOutputStorePath(cntkParsedOutputDir), mode='w+', dtype=np.float32,
+                                     shape=(nrImages, nrRois, outputDim))
+
+# load the network output of an image, either from the output store or from the
+# individual file per image written by parseCntkOutput(..., saveStore = False)
+def loadCntkOutput(cntkParsedOutputDir, imgIndex):
+    storePath = getCntkOutputStorePath(cntkParsedOutputDir)
+    if os.path.exists(storePath):
+        return np.array(np.load(storePath, mmap_mode='r')[imgIndex])
+    cntkOutputPath = os.path.join(cntkParsedOutputDir, str(imgIndex) + ".dat.npz")
+    return np.load(cntkOutputPath)['arr_0']
+
+# parse the cntk output file and save the output to the output store, or for each image individually
 def parseCntkOutput(cntkImgsListPath, cntkOutputPath, outParsedDir, cntkNrRois, outputDim,
-                    saveCompressed = False, skipCheck = False, skip5Mod = None):
+                    saveCompressed = False, skipCheck = False, skip5Mod = None, saveStore = True):
     if not skipCheck and skip5Mod == None:
         checkCntkOutputFile(cntkImgsListPath, cntkOutputPath, cntkNrRois, outputDim)
 
-    # parse cntk output and write file for each image
+    # parse cntk output and write it to the store or a file for each image
     # always read in data for each image to forward file pointer
     imgPaths = getColumn(readTable(cntkImgsListPath), 1)
+    if saveStore:
+        outputStore = createCntkOutputStore(outParsedDir, len(imgPaths), cntkNrRois, outputDim)
     with open(cntkOutputPath) as fp:
         for imgIndex in range(len(imgPaths)):
             line = fp.readline()
@@ -229,26 +336,32 @@ def parseCntkOutput(cntkImgsListPath, cntkOutputPath, outParsedDir, cntkNrRois,
             print ("Parsing cntk output file, image %d of %d" % (imgIndex, len(imgPaths)))
 
             # convert to floats
-            data = []
             values = np.fromstring(line, dtype=float, sep=" ")
             assert len(values) == cntkNrRois * outputDim, "ERROR: expected dimension of {} but found {}".format(cntkNrRois * outputDim, len(values))
-            for i in range(cntkNrRois):
-                posStart = i * outputDim
-                posEnd = posStart + outputDim
-                currValues = values[posStart:posEnd]
-                data.append(currValues)
+            data = np.array(values.reshape(cntkNrRois, outputDim), np.float32)
 
             # save
-            data = np.array(data, np.float32)
+            if saveStore:
+                outputStore[imgIndex] = data
+                continue
             outPath = os.path.join(outParsedDir, str(imgIndex) + ".dat")
             if saveCompressed:
                 np.savez_compressed(outPath, data)
             else:
                 np.savez(outPath, data)
         assert (fp.readline() == "")  # test if end-of-file is reached
+    if saveStore:
+        outputStore.flush()
 
-# parse the cntk labels file and return the labels
+# parse the cntk labels file and return the labels. If A1 wrote the binary store next
+# to the labels file then the labels are loaded from there instead.
 def readCntkRoiLabels(roiLabelsPath, nrRois, roiDim, stopAtImgIndex = None):
+    storePath = getCntkStorePath(roiLabelsPath)
+    if os.path.exists(storePath):
+        roiLabels = np.load(storePath, mmap_mode='r')
+        assert (roiLabels.shape[1] == nrRois and roiLabels.max() < roiDim)
+        return np.array(roiLabels[:stopAtImgIndex or None])
+
     roiLabels = []
     for imgIndex, line in enumerate(readFile(roiLabelsPath)):
         if stopAtImgIndex and imgIndex == stopAtImgIndex:
@@ -264,24 +377,29 @@ def readCntkRoiLabels(roiLabelsPath, nrRois, roiDim, stopAtImgIndex = None):
             roiLabels[imgIndex].append(np.argmax(oneHotLabels))
     return roiLabels
 
-# parse the cntk rois file and return the co-ordinates
+# parse the cntk rois file and return the co-ordinates. If A1 wrote the binary store next
+# to the rois file then the co-ordinates are loaded from there instead.
 def readCntkRoiCoordinates(imgPaths, cntkRoiCoordsPath, nrRois, padWidth, padHeight, stopAtImgIndex = None):
-    roiCoords = []
-    for imgIndex, line in enumerate(readFile(cntkRoiCoordsPath)):
-        if stopAtImgIndex and imgIndex == stopAtImgIndex:
-            break
-        roiCoords.append([])
-        pos = line.find(b'|rois ')
-        valuesString = line[pos + 5:].strip().split(b' ')
-        assert (len(valuesString) == nrRois * 4)
+    storePath = getCntkStorePath(cntkRoiCoordsPath)
+    if os.path.exists(storePath):
+        allRelCoords = np.load(storePath, mmap_mode='r')[:stopAtImgIndex or None]
+    else:
+        allRelCoords = []
+        for imgIndex, line in enumerate(readFile(cntkRoiCoordsPath)):
+            if stopAtImgIndex and imgIndex == stopAtImgIndex:
+                break
+            pos = line.find(b'|rois ')
+            valuesString = line[pos + 5:].strip().split(b' ')
+            assert (len(valuesString) == nrRois * 4)
+            allRelCoords.append(np.array([float(s) for s in valuesString]).reshape(nrRois, 4))
 
+    roiCoords = []
+    for imgIndex, relCoords in enumerate(allRelCoords):
+        assert (len(relCoords) == nrRois)
         imgWidth, imgHeight = imWidthHeight(imgPaths[imgIndex])
-        for boxIndex in range(nrRois):
-            rect = [float(s) for s in valuesString[boxIndex*4 : (boxIndex+1)*4]]
-            x,y,w,h = rect
-            # convert back from padded-rois-co-ordinates to image co-ordinates
-            rect = getAbsoluteROICoordinates([x,y,x+w,y+h], imgWidth, imgHeight, padWidth, padHeight)
-            roiCoords[imgIndex].append(rect)
+        # convert back from padded-rois-co-ordinates to image co-ordinates
+        roiCoords.append([getAbsoluteROICoordinates([x,y,x+w,y+h], imgWidth, imgHeight, padWidth, padHeight)
+                          for x, y, w, h in np.asarray(relCoords, np.float64).tolist()])
     return roiCoords
 
 # convert roi co-ordinates from CNTK file back to original image co-ordinates
@@ -350,8 +468,7 @@ def saveSvm(svmDir, experimentName, svmWeights, svmBias, featureScale):
     np.savetxt(svmFeatScalePath, featureScale)
 
 def svmPredict(imgIndex, cntkOutputIndividualFilesDir, svmWeights, svmBias, svmFeatScale, roiSize, roiDim, decisionThreshold = 0):
-    cntkOutputPath = os.path.join(cntkOutputIndividualFilesDir,  str(imgIndex) + ".dat.npz")
-    data = np.load(cntkOutputPath)['arr_0']
+    data = loadCntkOutput(cntkOutputIndividualFilesDir, imgIndex)
     assert(len(data) == roiSize)
 
     # get prediction for each roi
@@ -370,8 +487,7 @@ def svmPredict(imgIndex, cntkOutputIndividualFilesDir, svmWeights, svmBias, svmF
     return labels, maxScores
 
 def nnPredict(imgIndex, cntkParsedOutputDir, roiSize, roiDim, decisionThreshold = None):
-    cntkOutputPath = os.path.join(cntkParsedOutputDir,  str(imgIndex) + ".dat.npz")
-    data = np.load(cntkOutputPath)['arr_0']
+    data = loadCntkOutput(cntkParsedOutputDir, imgIndex)
     assert(len(data) == roiSize)
 
     # get prediction for each roi
@@ -456,23 +572,10 @@ def visualizeResults(imgPath, roiLabels, roiScores, roiRelCoords, padWidth, padH
     return imgDebug
 
 def applyNonMaximaSuppression(nmsThreshold, labels, scores, coords):
-    # generate input for nms
-    allIndices = []
-    nmsRects = [[[]] for _ in range(max(labels) + 1)]
+    # nms of the rois of each label, with the kept roi indices ordered by label
+    labels = np.array(labels)
     coordsWithScores = np.hstack((coords, np.array([scores]).T))
-    for i in range(max(labels) + 1):
-        indices = np.where(np.array(labels) == i)[0]
-        nmsRects[i][0] = coordsWithScores[indices,:]
-        allIndices.append(indices)
-
-    # call nms
-    _, nmsKeepIndicesList = apply_nms(nmsRects, nmsThreshold)
-
-    # map back to original roi indices
-    nmsKeepIndices = []
-    for i in range(max(labels) + 1):
-        for keepIndex in nmsKeepIndicesList[i][0]:
-            nmsKeepIndices.append(allIndices[i][keepIndex]) # for keepIndex in nmsKeepIndicesList[i][0]]
+    nmsKeepIndices = list(nmsBatched(coordsWithScores, labels, nmsThreshold))
     assert (len(nmsKeepIndices) == len(set(nmsKeepIndices)))  # check if no roi indices was added >1 times
     return nmsKeepIndices
 
@@ -484,19 +587,38 @@ def apply_nms(all_boxes, thresh, boUsePythonImpl = True):
                  for _ in range(num_classes)]
     nms_keepIndices = [[[] for _ in range(num_images)]
                  for _ in range(num_classes)]
-    for cls_ind in range(num_classes):
-        for im_ind in range(num_images):
-            dets = all_boxes[cls_ind][im_ind]
-            if dets == []:
-                continue
-            if boUsePythonImpl:
-                keep = nmsPython(dets, thresh)
-            else:
+    if not boUsePythonImpl:
+        for cls_ind in range(num_classes):
+            for im_ind in range(num_images):
+                dets = all_boxes[cls_ind][im_ind]
+                if len(dets) == 0:
+                    continue
                 keep = nms(dets, thresh)
-            if len(keep) == 0:
-                continue
-            nms_boxes[cls_ind][im_ind] = dets[keep, :].copy()
-            nms_keepIndices[cls_ind][im_ind] = keep
+                if len(keep) == 0:
+                    continue
+                nms_boxes[cls_ind][im_ind] = dets[keep, :].copy()
+                nms_keepIndices[cls_ind][im_ind] = keep
+        return nms_boxes, nms_keepIndices
+
+    # suppress the boxes of all (class, image) cells in one batch, with one group per cell
+    cells = [(cls_ind, im_ind) for cls_ind in range(num_classes) for im_ind in range(num_images)
+             if len(all_boxes[cls_ind][im_ind]) > 0]
+    if not cells:
+        return nms_boxes, nms_keepIndices
+    sizes = [len(all_boxes[cls_ind][im_ind]) for cls_ind, im_ind in cells]
+    offsets = np.cumsum([0] + sizes)
+    dets = np.concatenate([all_boxes[cls_ind][im_ind] for cls_ind, im_ind in cells])
+    groups = np.repeat(np.arange(len(cells)), sizes)
+    keep = nmsBatched(dets, groups, thresh)
+
+    # the kept indices are ordered by group
+    bounds = np.searchsorted(groups[keep], np.arange(len(cells) + 1))
+    for group, (cls_ind, im_ind) in enumerate(cells):
+        cellKeep = keep[bounds[group]:bounds[group + 1]] - offsets[group]
+        if len(cellKeep) == 0:
+            continue
+        nms_boxes[cls_ind][im_ind] = all_boxes[cls_ind][im_ind][cellKeep, :].copy()
+        nms_keepIndices[cls_ind][im_ind] = list(cellKeep)
     return nms_boxes, nms_keepIndices
 
 ####################################
@@ -519,8 +641,7 @@ def im_detect(net, im, boxes, feature_scale=None, bboxIndices=None, boReturnClas
     #         background as object category 0)
     #     (optional) boxes (ndarray): R x (4*K) array of predicted bounding boxes
     # load cntk output for the given image
-    cntkOutputPath = os.path.join(net.cntkParsedOutputDir, str(im) + ".dat.npz")
-    cntkOutput = np.load(cntkOutputPath)['arr_0']
+    cntkOutput = loadCntkOutput(net.cntkParsedOutputDir, im)
     if bboxIndices != None:
         cntkOutput = cntkOutput[bboxIndices, :] # only keep output for certain rois
     else:
@@ -35,3 +35,96 @@ def nms(dets, thresh):
         order = order[inds + 1]
 
     return keep
+
+
+def _suppressed(x1, y1, x2, y2, areas, rows, cols, thresh):
+    """Whether box rows[k] suppresses box cols[l], computed as in nms."""
+    xx1 = np.maximum(x1[rows, np.newaxis], x1[cols])
+    yy1 = np.maximum(y1[rows, np.newaxis], y1[cols])
+    xx2 = np.minimum(x2[rows, np.newaxis], x2[cols])
+    yy2 = np.minimum(y2[rows, np.newaxis], y2[cols])
+
+    w = np.maximum(0.0, xx2 - xx1 + 1)
+    h = np.maximum(0.0, yy2 - yy1 + 1)
+    inter = w * h
+    ovr = inter / (areas[rows, np.newaxis] + areas[cols] - inter)
+    return ~(ovr <= thresh)
+
+
+def nms_batched(dets, group_ids, thresh, block_size=256):
+    """Applies nms to many independent groups of boxes at once, e.g. to the
+    detections of all classes of all images.
+
+    dets holds the boxes and scores of all groups as rows [x1, y1, x2, y2, score],
+    and group_ids the group of every row. Boxes only suppress boxes of their own group.
+
+    The boxes are sorted by group and descending score, as nms sorts them within a
+    group, and processed in blocks of block_size. A block first drops the boxes
+    suppressed by the boxes of earlier blocks that were kept, then resolves the greedy
+    suppression within the block with a few vectorized passes over the block's
+    suppression matrix.
+
+    Returns the indices of the kept rows, ordered by group and, within a group, in the
+    order nms returns them. Hence the kept indices of every group are the same as the
+    ones nms returns for that group's rows, as long as the rows of every group are in
+    the same relative order as in the array passed to nms.
+    """
+    dets = np.asarray(dets)
+    group_ids = np.asarray(group_ids)
+    n = len(dets)
+    if n == 0:
+        return np.zeros(0, dtype=np.intp)
+
+    x1 = dets[:, 0]
+    y1 = dets[:, 1]
+    x2 = dets[:, 2]
+    y2 = dets[:, 3]
+    scores = dets[:, 4]
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+
+    # sort by group and descending score. The order of equal scores depends on the sort
+    # algorithm, hence groups with ties are sorted exactly like nms sorts them
+    order = np.lexsort((-scores, group_ids))
+    sorted_groups = group_ids[order]
+    group_starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    group_ends = np.r_[group_starts[1:], n]
+    ties = np.flatnonzero((sorted_groups[1:] == sorted_groups[:-1]) &
+                          (scores[order[1:]] == scores[order[:-1]]))
+    for g in np.unique(np.searchsorted(group_starts, ties, side='right') - 1):
+        start, end = group_starts[g], group_ends[g]
+        members = np.sort(order[start:end])
+        order[start:end] = members[scores[members].argsort()[::-1]]
+
+    # first sorted position of the group of every sorted position
+    first = np.repeat(group_starts, group_ends - group_starts)
+
+    keep = np.ones(n, dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for start in range(0, n, block_size):
+            end = min(start + block_size, n)
+            block = order[start:end]
+            block_groups = sorted_groups[start:end]
+
+            # suppression by the kept boxes of earlier blocks of the same groups
+            earlier = first[start] + np.flatnonzero(keep[first[start]:start])
+            if len(earlier):
+                suppressed = _suppressed(x1, y1, x2, y2, areas, order[earlier], block, thresh)
+                suppressed &= sorted_groups[earlier, np.newaxis] == block_groups
+                keep[start:end] &= ~suppressed.any(axis=0)
+
+            # greedy suppression within the block: a box is kept unless an earlier box of
+            # the block that is kept suppresses it. Starting from all candidates, every
+            # pass fixes at least one more box, and the passes stop at the greedy result
+            suppressed = _suppressed(x1, y1, x2, y2, areas, block, block, thresh)
+            suppressed &= block_groups[:, np.newaxis] == block_groups
+            suppressed &= np.triu(np.ones(suppressed.shape, dtype=bool), 1)
+            candidates = keep[start:end]
+            kept = candidates.copy()
+            while True:
+                updated = candidates & ~(kept[:, np.newaxis] & suppressed).any(axis=0)
+                if np.array_equal(updated, kept):
+                    break
+                kept = updated
+            keep[start:end] = kept
+
+    return order[keep]
@@ -15,6 +15,107 @@ traditional R-CNN.
 from timer import Timer
 from sklearn import svm
 import numpy as np
+import multiprocessing, os, tempfile
+
+
+#################################################
+# Feature cache
+#################################################
+class FeatureBuffer(object):
+    """
+    Rows of features in a preallocated buffer that grows by doubling, so that appending
+    is amortized O(1) instead of copying all rows like repeated stacking does. The buffer
+    is memory mapped from a file in cache_dir if given, hence its size is not bounded by
+    the memory, and it is passed to worker processes by file name instead of by value.
+    """
+
+    def __init__(self, dim, capacity=1024, cache_dir=None, dtype=np.float32):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.path = None
+        if cache_dir is not None:
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            fd, self.path = tempfile.mkstemp(suffix='.features', dir=cache_dir)
+            os.close(fd)
+        self._buffer = self._allocate(max(capacity, 1))
+
+    def _allocate(self, capacity):
+        if self.path is None:
+            return np.zeros((capacity, self.dim), dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode='w+' if self.count == 0 else 'r+',
+                         shape=(capacity, self.dim))
+
+    @property
+    def capacity(self):
+        return self._buffer.shape[0]
+
+    @property
+    def data(self):
+        """The rows appended so far, as a view into the buffer."""
+        return self._buffer[:self.count]
+
+    def __len__(self):
+        return self.count
+
+    def reserve(self, capacity):
+        if capacity <= self.capacity:
+            return
+        if self.path is None:
+            grown = self._allocate(capacity)
+            grown[:self.count] = self._buffer[:self.count]
+            self._buffer = grown
+        else:
+            # growing the file keeps the rows in place
+            self._buffer.flush()
+            del self._buffer
+            self._buffer = self._allocate(capacity)
+
+    def append(self, feat):
+        num = feat.shape[0]
+        if self.count + num > self.capacity:
+            self.reserve(max(2 * self.capacity, self.count + num))
+        self._buffer[self.count:self.count + num] = feat
+        self.count += num
+
+    def keep(self, indices):
+        """Keeps only the given rows, in place."""
+        kept = self._buffer[np.asarray(indices)]
+        self._buffer[:len(kept)] = kept
+        self.count = len(kept)
+
+    def flush(self):
+        if self.path is not None:
+            self._buffer.flush()
+
+    def close(self):
+        if self.path is not None:
+            del self._buffer
+            os.remove(self.path)
+            self.path = None
+            self._buffer = np.zeros((0, self.dim), dtype=self.dtype)
+            self.count = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.path is not None:
+            # workers map the file read-only instead of receiving a copy
+            self.flush()
+            state['_buffer'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.path is not None:
+            capacity = os.path.getsize(self.path) // (self.dim * self.dtype.itemsize)
+            self._buffer = np.memmap(self.path, dtype=self.dtype, mode='r', shape=(capacity, self.dim))
+
+
+def _train_class(trainer):
+    # runs in a worker process, hence the loss history entry is returned too
+    result = trainer.train()
+    return result, trainer.loss_history[-1], trainer.svm
 
 
 
@@ -29,7 +130,11 @@ class SVMTrainer(object):
 
     def __init__(self, net, imdb, im_detect, svmWeightsPath, svmBiasPath, svmFeatScalePath,
                  svm_C, svm_B, svm_nrEpochs, svm_retrainLimit, svm_evictThreshold, svm_posWeight,
-                 svm_targetNorm, svm_penality, svm_loss, svm_rngSeed):
+                 svm_targetNorm, svm_penality, svm_loss, svm_rngSeed,
+                 svm_batchSize=1, svm_nrWorkers=1, svm_cacheDir=None):
+        # svm_batchSize: number of images whose hard negatives are mined with the same SVMs
+        # svm_nrWorkers: number of processes retraining the SVMs of different classes
+        # svm_cacheDir:  directory of the memory mapped feature caches (None: in memory)
         self.net = net
         self.imdb = imdb
         self.im_detect = im_detect
@@ -41,12 +146,15 @@ class SVMTrainer(object):
         self.layer = 'fc7'
         self.hard_thresh = -1.0001
         self.neg_iou_thresh = 0.3
+        self.batch_size = svm_batchSize
+        self.nr_workers = svm_nrWorkers
         dim = net.params['cls_score'][0].data.shape[1]
         self.feature_scale = self._get_feature_scale()
         print('Feature dim: {}'.format(dim))
         print('Feature scale: {:.3f}'.format(self.feature_scale))
         self.trainers = [SVMClassTrainer(cls, dim, self.feature_scale, svm_C, svm_B, svm_posWeight, svm_penality, svm_loss,
-                                         svm_rngSeed, svm_retrainLimit, svm_evictThreshold) for cls in imdb.classes]
+                                         svm_rngSeed, svm_retrainLimit, svm_evictThreshold, svm_cacheDir)
+                         for cls in imdb.classes]
 
 
     def _get_feature_scale(self, num_images=100):
@@ -138,6 +246,41 @@ class SVMTrainer(object):
         self.net.params['cls_score'][0].data[cls_ind, :] = w
         self.net.params['cls_score'][1].data[cls_ind] = b
 
+    def _get_features_and_scores(self, image_indices):
+        # features of all rois of a batch of images, scored with one matrix product
+        roidb = self.imdb.roidb
+        feats = [self.im_detect(self.net, i, roidb[i]['boxes'], self.feature_scale, boReturnClassifierScore = False)[2]
+                 for i in image_indices]
+        feat = np.vstack(feats)
+        svmWeights = self.net.params['cls_score'][0].data.transpose()
+        svmBias = self.net.params['cls_score'][1].data.transpose()
+        scores = np.dot(feat * 1.0 / self.feature_scale, svmWeights) + svmBias
+        overlaps = np.vstack([roidb[i]['gt_overlaps'].toarray() for i in image_indices])
+        return feat, scores, overlaps
+
+    def _retrain(self, class_indices):
+        # retrains the SVMs of the given classes, in parallel if there are several workers
+        trainers = [self.trainers[j] for j in class_indices]
+        for trainer in trainers:
+            trainer.flush()
+        if self.nr_workers > 1 and len(trainers) > 1:
+            pool = multiprocessing.Pool(min(self.nr_workers, len(trainers)))
+            try:
+                results = pool.map(_train_class, trainers)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_train_class(trainer) for trainer in trainers]
+
+        for j, trainer, (result, losses, fitted_svm) in zip(class_indices, trainers, results):
+            if trainer.svm is not fitted_svm:
+                trainer.svm = fitted_svm
+                trainer.loss_history.append(losses)
+            new_w_b, pos_scores, neg_scores = result
+            trainer.prune(pos_scores, neg_scores)
+            self.update_net(j, new_w_b[0], new_w_b[1])
+
     def train_with_hard_negatives(self):
         _t = Timer()
         roidb = self.imdb.roidb
@@ -146,33 +289,29 @@ class SVMTrainer(object):
         for epoch in range(0,self.svm_nrEpochs):
 
             # num_images = 100
-            for i in range(num_images):
-                print("*** EPOCH = %d, IMAGE = %d *** " % (epoch, i))
-                #im = cv2.imread(self.imdb.image_path_at(i))
-                #if roidb[i]['flipped']:
-                #    im = im[:, ::-1, :]
-                #im = self.imdb.image_path_at(i)
+            for start in range(0, num_images, self.batch_size):
+                image_indices = range(start, min(start + self.batch_size, num_images))
+                print("*** EPOCH = %d, IMAGES = %d-%d *** " % (epoch, image_indices[0], image_indices[-1]))
                 _t.tic()
-                scores, boxes, feat = self.im_detect(self.net, i, roidb[i]['boxes'], self.feature_scale)
+                feat, scores, overlaps = self._get_features_and_scores(image_indices)
                 _t.toc()
-                #feat = self.net.blobs[self.layer].data
+                retrain = []
                 for j in range(1, self.imdb.num_classes):
                     hard_inds = \
                         np.where((scores[:, j] > self.hard_thresh) &
-                                 (roidb[i]['gt_overlaps'][:, j].toarray().ravel() <
-                                  self.neg_iou_thresh))[0]
+                                 (overlaps[:, j] < self.neg_iou_thresh))[0]
                     if len(hard_inds) > 0:
-                        hard_feat = feat[hard_inds, :].copy()
-                        new_w_b = \
-                            self.trainers[j].append_neg_and_retrain(feat=hard_feat)
-                        if new_w_b is not None:
-                            self.update_net(j, new_w_b[0], new_w_b[1])
-                            np.savetxt(self.svmWeightsPath[:-4]   + "_epoch" + str(epoch) + ".txt", self.net.params['cls_score'][0].data)
-                            np.savetxt(self.svmBiasPath[:-4]      + "_epoch" + str(epoch) + ".txt", self.net.params['cls_score'][1].data)
-                            np.savetxt(self.svmFeatScalePath[:-4] + "_epoch" + str(epoch) + ".txt", [self.feature_scale])
+                        self.trainers[j].append_neg(feat[hard_inds, :])
+                        if self.trainers[j].needs_retrain():
+                            retrain.append(j)
+                if retrain:
+                    self._retrain(retrain)
+                    np.savetxt(self.svmWeightsPath[:-4]   + "_epoch" + str(epoch) + ".txt", self.net.params['cls_score'][0].data)
+                    np.savetxt(self.svmBiasPath[:-4]      + "_epoch" + str(epoch) + ".txt", self.net.params['cls_score'][1].data)
+                    np.savetxt(self.svmFeatScalePath[:-4] + "_epoch" + str(epoch) + ".txt", [self.feature_scale])
 
             print(('train_with_hard_negatives: '
-                   '{:d}/{:d} {:.3f}s').format(i + 1, len(roidb),
+                   '{:d}/{:d} {:.3f}s').format(num_images, len(roidb),
                                                _t.average_time))
 
     def train(self):
@@ -199,9 +338,9 @@ class SVMTrainer(object):
 
         # One final SVM retraining for each class
         # Install SVMs into net
-        for j in range(1, self.imdb.num_classes):
-            new_w_b = self.trainers[j].append_neg_and_retrain(force=True)
-            self.update_net(j, new_w_b[0], new_w_b[1])
+        self._retrain(range(1, self.imdb.num_classes))
+        for trainer in self.trainers:
+            trainer.close()
 
         #save svm
         np.savetxt(self.svmWeightsPath,   self.net.params['cls_score'][0].data)
@@ -213,9 +352,11 @@ class SVMClassTrainer(object):
     """Manages post-hoc SVM training for a single object class."""
 
     def __init__(self, cls, dim, feature_scale,
-                 C, B, pos_weight, svm_penality, svm_loss, svm_rngSeed, svm_retrainLimit, svm_evictThreshold):
-        self.pos = np.zeros((0, dim), dtype=np.float32)
-        self.neg = np.zeros((0, dim), dtype=np.float32)
+                 C, B, pos_weight, svm_penality, svm_loss, svm_rngSeed, svm_retrainLimit, svm_evictThreshold,
+                 cache_dir=None):
+        self.cache_dir = cache_dir
+        self._pos = FeatureBuffer(dim, 0, cache_dir)
+        self._neg = FeatureBuffer(dim, 1024, cache_dir)
         self.B = B
         self.C = C
         self.cls = cls
@@ -238,14 +379,37 @@ class SVMClassTrainer(object):
         self.evict_thresh = svm_evictThreshold
         self.loss_history = []
 
+    @property
+    def pos(self):
+        return self._pos.data
+
+    @property
+    def neg(self):
+        return self._neg.data
+
     def alloc_pos(self, count):
         self.pos_cur = 0
-        self.pos = np.zeros((count, self.dim), dtype=np.float32)
+        self._pos.count = 0
+        self._pos.reserve(count)
 
     def append_pos(self, feat):
-        num = feat.shape[0]
-        self.pos[self.pos_cur:self.pos_cur + num, :] = feat
-        self.pos_cur += num
+        self._pos.append(feat)
+        self.pos_cur += feat.shape[0]
+
+    def append_neg(self, feat):
+        self._neg.append(feat)
+        self.num_neg_added += feat.shape[0]
+
+    def needs_retrain(self, force=False):
+        return self.num_neg_added > self.retrain_limit or force
+
+    def flush(self):
+        self._pos.flush()
+        self._neg.flush()
+
+    def close(self):
+        self._pos.close()
+        self._neg.close()
 
     def train(self):
         print('>>> Updating {} detector <<<'.format(self.cls))
@@ -289,27 +453,28 @@ class SVMClassTrainer(object):
 
         return ((w * self.feature_scale, b), pos_scores, neg_scores)
 
+    def prune(self, pos_scores, neg_scores):
+        # scores = np.dot(self.neg, new_w_b[0].T) + new_w_b[1]
+        # easy_inds = np.where(neg_scores < self.evict_thresh)[0]
+        self.num_neg_added = 0
+        print('    Pruning easy negatives')
+        print('         before pruning: #neg = ' + str(len(self.neg)))
+        not_easy_inds = np.where(neg_scores >= self.evict_thresh)[0]
+        if len(not_easy_inds) > 0:
+            self._neg.keep(not_easy_inds)
+            # self.neg = np.delete(self.neg, easy_inds)
+        print('         after pruning: #neg = ' + str(len(self.neg)))
+        print('    Cache holds {} pos examples and {} neg examples'.
+              format(self.pos.shape[0], self.neg.shape[0]))
+        print('    {} pos support vectors'.format((pos_scores <= 1).sum()))
+        print('    {} neg support vectors'.format((neg_scores >= -1).sum()))
+
     def append_neg_and_retrain(self, feat=None, force=False):
         if feat is not None:
-            num = feat.shape[0]
-            self.neg = np.vstack((self.neg, feat))
-            self.num_neg_added += num
-        if self.num_neg_added > self.retrain_limit or force:
-            self.num_neg_added = 0
+            self.append_neg(feat)
+        if self.needs_retrain(force):
             new_w_b, pos_scores, neg_scores = self.train()
-            # scores = np.dot(self.neg, new_w_b[0].T) + new_w_b[1]
-            # easy_inds = np.where(neg_scores < self.evict_thresh)[0]
-            print('    Pruning easy negatives')
-            print('         before pruning: #neg = ' + str(len(self.neg)))
-            not_easy_inds = np.where(neg_scores >= self.evict_thresh)[0]
-            if len(not_easy_inds) > 0:
-                self.neg = self.neg[not_easy_inds, :]
-                # self.neg = np.delete(self.neg, easy_inds)
-            print('         after pruning: #neg = ' + str(len(self.neg)))
-            print('    Cache holds {} pos examples and {} neg examples'.
-                  format(self.pos.shape[0], self.neg.shape[0]))
-            print('    {} pos support vectors'.format((pos_scores <= 1).sum()))
-            print('    {} neg support vectors'.format((neg_scores >= -1).sum()))
+            self.prune(pos_scores, neg_scores)
             return new_w_b
         else:
             return None
@@ -7,6 +7,7 @@
 from __future__ import print_function
 import xml.etree.ElementTree as ET
 import os
+import multiprocessing
 import pickle as cp
 import numpy as np
 
@@ -62,6 +63,135 @@ def voc_ap(rec, prec, use_07_metric=False):
         ap = np.sum((mrec[i + 1] - mrec[i]) * mpre[i + 1])
     return ap
 
+def voc_tp_fp(class_recs, image_ids, confidence, BB, ovthresh=0.5, chunk_size=65536):
+    """tp, fp = voc_tp_fp(class_recs, image_ids, confidence, BB, [ovthresh])
+
+    Marks the detections of a class as true or false positives, going down the
+    detections by descending confidence. The detections are matched to the ground truth
+    of their images in blocks of chunk_size detections, computing the overlaps of every
+    detection with all ground truth boxes of its image at once.
+
+    class_recs: ground truth by image id, each with the 'bbox' and 'difficult' arrays
+    image_ids: image id of every detection
+    confidence: confidence of every detection
+    BB: boxes of the detections, one [x1, y1, x2, y2] row per detection
+
+    Returns tp and fp, which are 1 for the true and false positives (detections
+    matching a difficult ground truth box are neither) in the order of descending
+    confidence.
+    """
+    nd = len(image_ids)
+    tp = np.zeros(nd)
+    fp = np.zeros(nd)
+    if nd == 0:
+        return tp, fp
+
+    # sort by confidence
+    sorted_ind = np.argsort(-confidence)
+    BB = np.asarray(BB)[sorted_ind, :].astype(float)
+    image_ids = [image_ids[x] for x in sorted_ind]
+
+    # ground truth of all images with detections, padded to the same number of boxes
+    images = {}
+    det_images = np.array([images.setdefault(image_id, len(images)) for image_id in image_ids])
+    gts = [None] * len(images)
+    for image_id, index in images.items():
+        R = class_recs[image_id]
+        gts[index] = (np.asarray(R['bbox']).astype(float).reshape(-1, 4),
+                      np.asarray(R['difficult'], dtype=bool).reshape(-1))
+    max_gt = max(len(bbox) for bbox, _ in gts)
+    if max_gt == 0:
+        fp[:] = 1.
+        return tp, fp
+    BBGT = np.zeros((len(gts), max_gt, 4))
+    valid = np.zeros((len(gts), max_gt), dtype=bool)
+    difficult = np.zeros((len(gts), max_gt), dtype=bool)
+    for index, (bbox, diff) in enumerate(gts):
+        BBGT[index, :len(bbox)] = bbox
+        valid[index, :len(bbox)] = True
+        difficult[index, :len(bbox)] = diff
+
+    # overlap of every detection with the best matching ground truth box of its image
+    ovmax = np.empty(nd)
+    jmax = np.empty(nd, dtype=int)
+    for start in range(0, nd, chunk_size):
+        end = min(start + chunk_size, nd)
+        bb = BB[start:end, :, np.newaxis]
+        gt = BBGT[det_images[start:end]]
+
+        # intersection
+        ixmin = np.maximum(gt[:, :, 0], bb[:, 0])
+        iymin = np.maximum(gt[:, :, 1], bb[:, 1])
+        ixmax = np.minimum(gt[:, :, 2], bb[:, 2])
+        iymax = np.minimum(gt[:, :, 3], bb[:, 3])
+        iw = np.maximum(ixmax - ixmin + 1., 0.)
+        ih = np.maximum(iymax - iymin + 1., 0.)
+        inters = iw * ih
+
+        # union
+        uni = ((bb[:, 2] - bb[:, 0] + 1.) * (bb[:, 3] - bb[:, 1] + 1.) +
+               (gt[:, :, 2] - gt[:, :, 0] + 1.) *
+               (gt[:, :, 3] - gt[:, :, 1] + 1.) - inters)
+
+        overlaps = inters / uni
+        overlaps[~valid[det_images[start:end]]] = -np.inf
+        ovmax[start:end] = np.max(overlaps, axis=1)
+        jmax[start:end] = np.argmax(overlaps, axis=1)
+
+    # a ground truth box is detected by the first detection it is the best match of,
+    # the later ones are false positives
+    matched = ovmax > ovthresh
+    fp[~matched] = 1.
+    candidates = np.flatnonzero(matched & ~difficult[det_images, jmax])
+    _, first = np.unique(det_images[candidates] * max_gt + jmax[candidates], return_index=True)
+    fp[candidates] = 1.
+    fp[candidates[first]] = 0.
+    tp[candidates[first]] = 1.
+    return tp, fp
+
+
+def voc_precision_recall_ap(class_recs, image_ids, confidence, BB, npos, ovthresh=0.5,
+                            use_07_metric=False):
+    """rec, prec, ap = voc_precision_recall_ap(class_recs, image_ids, confidence, BB, npos,
+                                               [ovthresh], [use_07_metric])
+
+    Precision, recall and AP of the detections of a class, see voc_tp_fp. npos is the
+    number of ground truth boxes that count for the recall.
+    """
+    tp, fp = voc_tp_fp(class_recs, image_ids, confidence, BB, ovthresh)
+
+    # compute precision recall
+    fp = np.cumsum(fp)
+    tp = np.cumsum(tp)
+    rec = tp / float(npos)
+    # avoid divide by zero in case the first detection matches a difficult
+    # ground truth
+    prec = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
+    ap = voc_ap(rec, prec, use_07_metric)
+    return rec, prec, ap
+
+
+def _voc_precision_recall_ap(args):
+    return voc_precision_recall_ap(*args)
+
+
+def voc_precision_recall_ap_classes(class_args, nrWorkers=1):
+    """results = voc_precision_recall_ap_classes(class_args, [nrWorkers])
+
+    Evaluates several classes, each given by the tuple of arguments of
+    voc_precision_recall_ap, in a pool of nrWorkers processes if nrWorkers > 1.
+    Returns the (rec, prec, ap) of every class in the order of class_args.
+    """
+    if nrWorkers > 1 and len(class_args) > 1:
+        pool = multiprocessing.Pool(min(nrWorkers, len(class_args)))
+        try:
+            return pool.map(_voc_precision_recall_ap, class_args)
+        finally:
+            pool.close()
+            pool.join()
+    return [_voc_precision_recall_ap(args) for args in class_args]
+
+
 def voc_eval(detpath,
              annopath,
              imagesetfile,
@@ -145,60 +275,5 @@ def voc_eval(detpath,
     confidence = np.array([float(x[1]) for x in splitlines])
     BB = np.array([[float(z) for z in x[2:]] for x in splitlines])
 
-    # sort by confidence
-    sorted_ind = np.argsort(-confidence)
-    sorted_scores = np.sort(-confidence)
-
-    BB = BB[sorted_ind, :]
-    image_ids = [image_ids[x] for x in sorted_ind]
-
-    # go down dets and mark TPs and FPs
-    nd = len(image_ids)
-    tp = np.zeros(nd)
-    fp = np.zeros(nd)
-    for d in range(nd):
-        R = class_recs[image_ids[d]]
-        bb = BB[d, :].astype(float)
-        ovmax = -np.inf
-        BBGT = R['bbox'].astype(float)
-
-        if BBGT.size > 0:
-            # compute overlaps
-            # intersection
-            ixmin = np.maximum(BBGT[:, 0], bb[0])
-            iymin = np.maximum(BBGT[:, 1], bb[1])
-            ixmax = np.minimum(BBGT[:, 2], bb[2])
-            iymax = np.minimum(BBGT[:, 3], bb[3])
-            iw = np.maximum(ixmax - ixmin + 1., 0.)
-            ih = np.maximum(iymax - iymin + 1., 0.)
-            inters = iw * ih
-
-            # union
-            uni = ((bb[2] - bb[0] + 1.) * (bb[3] - bb[1] + 1.) +
-                   (BBGT[:, 2] - BBGT[:, 0] + 1.) *
-                   (BBGT[:, 3] - BBGT[:, 1] + 1.) - inters)
-
-            overlaps = inters / uni
-            ovmax = np.max(overlaps)
-            jmax = np.argmax(overlaps)
-
-        if ovmax > ovthresh:
-            if not R['difficult'][jmax]:
-                if not R['det'][jmax]:
-                    tp[d] = 1.
-                    R['det'][jmax] = 1
-                else:
-                    fp[d] = 1.
-        else:
-            fp[d] = 1.
-
-    # compute precision recall
-    fp = np.cumsum(fp)
-    tp = np.cumsum(tp)
-    rec = tp / float(npos)
-    # avoid divide by zero in case the first detection matches a difficult
-    # ground truth
-    prec = tp / np.maximum(tp + fp, np.finfo(np.float64).eps)
-    ap = voc_ap(rec, prec, use_07_metric)
-
-    return rec, prec, ap
+    return voc_precision_recall_ap(class_recs, image_ids, confidence, BB, npos,
+                                   ovthresh, use_07_metric)
@@ -14,6 +14,7 @@ import scipy.io as sio
 import pickle as cp
 import numpy as np
 import fastRCNN
+from fastRCNN.voc_eval import voc_tp_fp, voc_precision_recall_ap_classes
 
 
 class imdb_data(fastRCNN.imdb):
@@ -135,10 +136,7 @@ class imdb_data(fastRCNN.imdb):
         # box_list = nrImages x nrBoxes x 4
         box_list = []
         for imgFilename, subdir in zip(self._image_index, self._image_subdirs):
-            roiPath = "{}/{}/{}.roi.txt".format(self._roiDir, subdir, imgFilename[:-4])
-            assert os.path.exists(roiPath), "Error: rois file not found: " + roiPath
-            rois = np.loadtxt(roiPath, np.int32)
-            box_list.append(rois)
+            box_list.append(readRois(self._roiDir, subdir, imgFilename))
         return self.create_roidb_from_box_list(box_list, gt_roidb)
 
     def _load_annotation(self, imgIndex):
@@ -186,13 +184,16 @@ class imdb_data(fastRCNN.imdb):
     # main call to compute per-calass average precision
     #   shape of all_boxes: e.g. 21 classes x 4952 images x 58 rois x 5 coords+score
     #  (see also test_net() in fastRCNN\test.py)
-    def evaluate_detections(self, all_boxes, output_dir, use_07_metric=False):
+    def evaluate_detections(self, all_boxes, output_dir, use_07_metric=False, nrWorkers=1):
+        # the ground truth is loaded once for all classes, which are evaluated in nrWorkers processes
+        gtAnnotations = self._load_gt_annotations()
+        classIndices = [classIndex for classIndex, className in enumerate(self._classes) if className != '__background__']
+        classArgs = [self._voc_evaluation_args(classIndex, all_boxes, gtAnnotations, use_07_metric = use_07_metric)
+                     for classIndex in classIndices]
         aps = []
-        for classIndex, className in enumerate(self._classes):
-            if className != '__background__':
-                rec, prec, ap = self._evaluate_detections(classIndex, all_boxes, use_07_metric = use_07_metric)
-                aps += [ap]
-                print('AP for {:>15} = {:.4f}'.format(className, ap))
+        for classIndex, (rec, prec, ap) in zip(classIndices, voc_precision_recall_ap_classes(classArgs, nrWorkers)):
+            aps += [ap]
+            print('AP for {:>15} = {:.4f}'.format(self._classes[classIndex], ap))
         print('Mean AP = {:.4f}'.format(np.nanmean(aps)))
 
     def _evaluate_detections(self, classIndex, all_boxes, overlapThreshold = 0.5, use_07_metric = False):
@@ -202,99 +203,68 @@ class imdb_data(fastRCNN.imdb):
         [overlapThreshold]: Overlap threshold (default = 0.5)
         [use_07_metric]: Whether to use VOC07's 11 point AP computation (default False)
         """
-        assert (len(all_boxes) == self.num_classes)
-        assert (len(all_boxes[0]) == self.num_images)
+        class_recs, image_ids, confidence, BB, _, ovthresh, use_07_metric = self._voc_evaluation_args(
+            classIndex, all_boxes, self._load_gt_annotations(), overlapThreshold, use_07_metric)
 
-        # load ground truth annotations for this class
-        gtInfos = []
+        # compute precision / recall / ap
+        rec, prec, ap = self._voc_computePrecisionRecallAp(
+            class_recs=class_recs,
+            confidence=confidence,
+            image_ids=image_ids,
+            BB=BB,
+            ovthresh=ovthresh,
+            use_07_metric=use_07_metric)
+        return rec, prec, ap
+
+    def _load_gt_annotations(self):
+        # ground truth boxes and labels of all images
+        gtAnnotations = []
         for imgIndex in range(self.num_images):
             imgPath = self.image_path_at(imgIndex)
-            imgSubir  = os.path.normpath(imgPath).split(os.path.sep)[-2]
             bboxesPaths = imgPath[:-4] + ".bboxes.tsv"
             labelsPaths = imgPath[:-4] + ".bboxes.labels.tsv"
             if os.path.exists(bboxesPaths) and os.path.exists(labelsPaths):
                 gtBoxes, gtLabels = readGtAnnotation(imgPath)
-                gtBoxes = [box for box, label in zip(gtBoxes, gtLabels) if label.decode('utf-8') == self.classes[classIndex]]
+                gtAnnotations.append((gtBoxes, [label.decode('utf-8') for label in gtLabels]))
             else:
-                gtBoxes = []
+                gtAnnotations.append(([], []))
+        return gtAnnotations
+
+    def _voc_evaluation_args(self, classIndex, all_boxes, gtAnnotations, overlapThreshold = 0.5, use_07_metric = False):
+        # the arguments of voc_precision_recall_ap for one class
+        assert (len(all_boxes) == self.num_classes)
+        assert (len(all_boxes[0]) == self.num_images)
+
+        # ground truth annotations for this class
+        gtInfos = []
+        for gtBoxes, gtLabels in gtAnnotations:
+            gtBoxes = [box for box, label in zip(gtBoxes, gtLabels) if label == self.classes[classIndex]]
             gtInfos.append({'bbox': np.array(gtBoxes),
                            'difficult': [False] * len(gtBoxes),
                            'det': [False] * len(gtBoxes)})
+        npos = sum([len(gtInfo['bbox']) for gtInfo in gtInfos])
 
         # parse detections for this class
         # shape of all_boxes: e.g. 21 classes x 4952 images x 58 rois x 5 coords+score
-        detBboxes = []
-        detImgIndices = []
-        detConfidences = []
-        for imgIndex in range(self.num_images):
-            dets = all_boxes[classIndex][imgIndex]
-            if dets != []:
-                for k in range(dets.shape[0]):
-                    detImgIndices.append(imgIndex)
-                    detConfidences.append(dets[k, -1])
-                    # the VOCdevkit expects 1-based indices
-                    detBboxes.append([dets[k, 0] + 1, dets[k, 1] + 1, dets[k, 2] + 1, dets[k, 3] + 1])
-        detBboxes = np.array(detBboxes)
-        detConfidences = np.array(detConfidences)
-
-        # compute precision / recall / ap
-        rec, prec, ap = self._voc_computePrecisionRecallAp(
-            class_recs=gtInfos,
-            confidence=detConfidences,
-            image_ids=detImgIndices,
-            BB=detBboxes,
-            ovthresh=overlapThreshold,
-            use_07_metric=use_07_metric)
-        return rec, prec, ap
+        cells = [(imgIndex, all_boxes[classIndex][imgIndex]) for imgIndex in range(self.num_images)
+                 if len(all_boxes[classIndex][imgIndex]) > 0]
+        detImgIndices = [imgIndex for imgIndex, dets in cells for _ in range(dets.shape[0])]
+        if cells:
+            detConfidences = np.concatenate([dets[:, -1] for _, dets in cells])
+            # the VOCdevkit expects 1-based indices
+            detBboxes = np.concatenate([dets[:, :4] + 1 for _, dets in cells])
+        else:
+            detConfidences = np.array([])
+            detBboxes = np.zeros((0, 4))
+        return gtInfos, detImgIndices, detConfidences, detBboxes, npos, overlapThreshold, use_07_metric
 
 
     #########################################################################
     # Python evaluation functions (copied/refactored from faster-RCNN)
     ##########################################################################
     def _voc_computePrecisionRecallAp(self, class_recs, confidence, image_ids, BB, ovthresh=0.5, use_07_metric=False):
-        # sort by confidence
-        sorted_ind = np.argsort(-confidence)
-        BB = BB[sorted_ind, :]
-        image_ids = [image_ids[x] for x in sorted_ind]
-
-        # go down dets and mark TPs and FPs
-        nd = len(image_ids)
-        tp = np.zeros(nd)
-        fp = np.zeros(nd)
-        for d in range(nd):
-            R = class_recs[image_ids[d]]
-            bb = BB[d, :].astype(float)
-            ovmax = -np.inf
-            BBGT = R['bbox'].astype(float)
-
-            if BBGT.size > 0:
-                # compute overlaps
-                ixmin = np.maximum(BBGT[:, 0], bb[0])
-                iymin = np.maximum(BBGT[:, 1], bb[1])
-                ixmax = np.minimum(BBGT[:, 2], bb[2])
-                iymax = np.minimum(BBGT[:, 3], bb[3])
-                iw = np.maximum(ixmax - ixmin + 1., 0.)
-                ih = np.maximum(iymax - iymin + 1., 0.)
-                inters = iw * ih
-
-                # union
-                uni = ((bb[2] - bb[0] + 1.) * (bb[3] - bb[1] + 1.) +
-                       (BBGT[:, 2] - BBGT[:, 0] + 1.) *
-                       (BBGT[:, 3] - BBGT[:, 1] + 1.) - inters)
-
-                overlaps = inters / uni
-                ovmax = np.max(overlaps)
-                jmax = np.argmax(overlaps)
-
-            if ovmax > ovthresh:
-                if not R['difficult'][jmax]:
-                    if not R['det'][jmax]:
-                        tp[d] = 1.
-                        R['det'][jmax] = 1
-                    else:
-                        fp[d] = 1.
-            else:
-                fp[d] = 1.
+        # go down dets by confidence and mark TPs and FPs
+        tp, fp = voc_tp_fp(class_recs, image_ids, confidence, BB, ovthresh)
 
         # compute precision recall
         npos = sum([len(cr['bbox']) for cr in class_recs])
@@ -0,0 +1,93 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+"""
+Times apply_nms, which suppresses the boxes of all (class, image) cells in one batch,
+against the loop calling nms once per cell it replaced, and checks that both keep the
+same boxes. Run it from the FastRCNN directory with
+
+    python nms_benchmark.py
+"""
+
+from __future__ import print_function
+import argparse, time
+import numpy as np
+from fastRCNN.nms import nms as nmsPython
+from cntk_helpers import apply_nms
+
+
+def reference_apply_nms(all_boxes, thresh):
+    # the per-cell loop of apply_nms before batching
+    num_classes = len(all_boxes)
+    num_images = len(all_boxes[0])
+    nms_boxes = [[[] for _ in range(num_images)]
+                 for _ in range(num_classes)]
+    nms_keepIndices = [[[] for _ in range(num_images)]
+                 for _ in range(num_classes)]
+    for cls_ind in range(num_classes):
+        for im_ind in range(num_images):
+            dets = all_boxes[cls_ind][im_ind]
+            if len(dets) == 0:
+                continue
+            keep = nmsPython(dets, thresh)
+            if len(keep) == 0:
+                continue
+            nms_boxes[cls_ind][im_ind] = dets[keep, :].copy()
+            nms_keepIndices[cls_ind][im_ind] = keep
+    return nms_boxes, nms_keepIndices
+
+
+def random_detections(num_classes, num_images, max_boxes, seed=0):
+    # detections clustered around a few objects per image, as after scoring rois, with
+    # scores quantized so that some of them are equal
+    rng = np.random.RandomState(seed)
+    all_boxes = [[[] for _ in range(num_images)] for _ in range(num_classes)]
+    for cls_ind in range(1, num_classes):
+        for im_ind in range(num_images):
+            n = rng.randint(0, max_boxes + 1)
+            if n == 0:
+                continue
+            centers = rng.uniform(50, 450, size=(rng.randint(1, 5), 2))
+            xy = centers[rng.randint(len(centers), size=n)] + rng.normal(0, 15, size=(n, 2))
+            wh = rng.uniform(20, 120, size=(n, 2))
+            scores = np.round(rng.uniform(0, 1, size=(n, 1)), 2)
+            all_boxes[cls_ind][im_ind] = np.hstack((xy, xy + wh, scores)).astype(np.float32)
+    return all_boxes
+
+
+def run_benchmark(num_classes=21, num_images=500, max_boxes=100, thresh=0.3, seed=0):
+    all_boxes = random_detections(num_classes, num_images, max_boxes, seed)
+
+    start = time.time()
+    expected_boxes, expected_keep = reference_apply_nms(all_boxes, thresh)
+    reference_time = time.time() - start
+
+    start = time.time()
+    actual_boxes, actual_keep = apply_nms(all_boxes, thresh)
+    batched_time = time.time() - start
+
+    for cls_ind in range(num_classes):
+        for im_ind in range(num_images):
+            assert [int(k) for k in expected_keep[cls_ind][im_ind]] == \
+                   [int(k) for k in actual_keep[cls_ind][im_ind]], \
+                   "kept boxes of class {} in image {} differ".format(cls_ind, im_ind)
+            assert np.array_equal(np.asarray(expected_boxes[cls_ind][im_ind]),
+                                  np.asarray(actual_boxes[cls_ind][im_ind]))
+    return reference_time, batched_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="batched nms benchmark")
+    parser.add_argument('--classes', type=int, default=21, help='number of classes (default: %(default)s)')
+    parser.add_argument('--images', type=int, default=500, help='number of images (default: %(default)s)')
+    parser.add_argument('--max_boxes', type=int, default=100,
+                        help='maximum number of detections per class and image (default: %(default)s)')
+    parser.add_argument('--thresh', type=float, default=0.3, help='nms threshold (default: %(default)s)')
+    args = parser.parse_args()
+
+    reference_time, batched_time = run_benchmark(args.classes, args.images, args.max_boxes, args.thresh)
+    print("per-cell loop: {:.3f}s, batched: {:.3f}s ({:.1f}x), same boxes kept".format(
+        reference_time, batched_time, reference_time / max(batched_time, 1e-9)))
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+    per-image timing of selective_search against the reference
+    implementation it replaced, which also checks that both return the
+    same regions
+
+    run from the FastRCNN directory with
+
+        python -m selectivesearch.benchmark [image ...]
+
+    without images, the test images of the Grocery data set are used
+"""
+from __future__ import print_function
+import argparse
+import glob
+import os
+import time
+import skimage.color
+import skimage.io
+import skimage.transform
+import numpy
+
+from .selectivesearch import (
+    selective_search, _generate_segments, _calc_texture_gradient,
+    _calc_colour_hist, _calc_texture_hist, _calc_sim, _merge_regions)
+
+
+def _reference_extract_regions(img):
+
+    R = {}
+
+    # get hsv image
+    hsv = skimage.color.rgb2hsv(img[:, :, :3])
+
+    # pass 1: count pixel positions
+    for y, i in enumerate(img):
+
+        for x, (r, g, b, l) in enumerate(i):
+
+            # initialize a new region
+            if l not in R:
+                R[l] = {
+                    "min_x": 0xffff, "min_y": 0xffff,
+                    "max_x": 0, "max_y": 0, "labels": [l]}
+
+            # bounding box
+            if R[l]["min_x"] > x:
+                R[l]["min_x"] = x
+            if R[l]["min_y"] > y:
+                R[l]["min_y"] = y
+            if R[l]["max_x"] < x:
+                R[l]["max_x"] = x
+            if R[l]["max_y"] < y:
+                R[l]["max_y"] = y
+
+    # pass 2: calculate texture gradient
+    tex_grad = _calc_texture_gradient(img)
+
+    # pass 3: calculate colour histogram of each region
+    for k, v in R.items():
+
+        # colour histogram
+        masked_pixels = hsv[:, :, :][img[:, :, 3] == k]
+        R[k]["size"] = len(masked_pixels / 4)
+        R[k]["hist_c"] = _calc_colour_hist(masked_pixels)
+
+        # texture histogram
+        R[k]["hist_t"] = _calc_texture_hist(tex_grad[:, :][img[:, :, 3] == k])
+
+    return R
+
+
+def _reference_extract_neighbours(regions):
+
+    def intersect(a, b):
+        if (a["min_x"] < b["min_x"] < a["max_x"]
+                and a["min_y"] < b["min_y"] < a["max_y"]) or (
+            a["min_x"] < b["max_x"] < a["max_x"]
+                and a["min_y"] < b["max_y"] < a["max_y"]) or (
+            a["min_x"] < b["min_x"] < a["max_x"]
+                and a["min_y"] < b["max_y"] < a["max_y"]) or (
+            a["min_x"] < b["max_x"] < a["max_x"]
+                and a["min_y"] < b["min_y"] < a["max_y"]):
+            return True
+        return False
+
+    R = list(regions.items())
+    neighbours = []
+    for cur, a in enumerate(R[:-1]):
+        for b in R[cur + 1:]:
+            if intersect(a[1], b[1]):
+                neighbours.append((a, b))
+
+    return neighbours
+
+
+def reference_selective_search(im_orig, scale=1.0, sigma=0.8, min_size=50):
+    """
+        the implementation selective_search replaced, with the similarities
+        sorted on every merge and all pairs scanned for stale ones
+    """
+    img = _generate_segments(im_orig, scale, sigma, min_size)
+
+    imsize = img.shape[0] * img.shape[1]
+    R = _reference_extract_regions(img)
+
+    neighbours = _reference_extract_neighbours(R)
+
+    S = {}
+    for (ai, ar), (bi, br) in neighbours:
+        S[(ai, bi)] = _calc_sim(ar, br, imsize)
+
+    while S != {}:
+
+        # a stable sort, so that the last of equally similar pairs wins
+        i, j = sorted(S.items(), key=lambda kv: kv[1])[-1][0]
+
+        t = max(R.keys()) + 1.0
+        R[t] = _merge_regions(R[i], R[j])
+
+        key_to_delete = []
+        for k, v in S.items():
+            if (i in k) or (j in k):
+                key_to_delete.append(k)
+
+        for k in key_to_delete:
+            del S[k]
+
+        for k in filter(lambda a: a != (i, j), key_to_delete):
+            n = k[1] if k[0] in (i, j) else k[0]
+            S[(t, n)] = _calc_sim(R[t], R[n], imsize)
+
+    regions = []
+    for k, r in R.items():
+        regions.append({
+            'rect': (
+                r['min_x'], r['min_y'],
+                r['max_x'] - r['min_x'], r['max_y'] - r['min_y']),
+            'size': r['size'],
+            'labels': r['labels']
+        })
+
+    return img, regions
+
+
+def _load_image(path, max_dim):
+    img = skimage.io.imread(path)
+    if img.ndim == 2:
+        img = skimage.color.gray2rgb(img)
+    img = img[:, :, :3]
+    scale = float(max_dim) / max(img.shape[:2])
+    if scale < 1:
+        shape = (int(round(img.shape[0] * scale)), int(round(img.shape[1] * scale)))
+        img = skimage.transform.resize(img, shape, preserve_range=True).astype(numpy.uint8)
+    return img
+
+
+def run_benchmark(paths, scale=100, sigma=1.2, min_size=20, max_dim=200):
+    """
+        times both implementations on every image
+
+        returns a list of (path, number of regions, reference seconds,
+        selective_search seconds) and raises an AssertionError if the
+        regions differ
+    """
+    results = []
+    for path in paths:
+        img = _load_image(path, max_dim)
+
+        start = time.time()
+        _, expected = reference_selective_search(img, scale, sigma, min_size)
+        reference_time = time.time() - start
+
+        start = time.time()
+        _, actual = selective_search(img, scale, sigma, min_size)
+        actual_time = time.time() - start
+
+        assert actual == expected, "regions of %s differ" % path
+        results.append((path, len(actual), reference_time, actual_time))
+    return results
+
+
+if __name__ == '__main__':
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..",
+                               "DataSets", "Grocery", "testImages")
+    parser = argparse.ArgumentParser(description="selective search benchmark")
+    parser.add_argument('images', nargs='*',
+                        help='images to segment (default: the Grocery test images)')
+    parser.add_argument('--scale', type=float, default=100,
+                        help='felzenszwalb scale (default: %(default)s)')
+    parser.add_argument('--sigma', type=float, default=1.2,
+                        help='felzenszwalb sigma (default: %(default)s)')
+    parser.add_argument('--min_size', type=int, default=20,
+                        help='felzenszwalb minimum component size (default: %(default)s)')
+    parser.add_argument('--max_dim', type=int, default=200,
+                        help='images are downscaled to this size (default: %(default)s)')
+    args = parser.parse_args()
+
+    paths = args.images or sorted(glob.glob(os.path.join(default_dir, "*.jpg")))
+    total_reference = total = 0.0
+    for path, count, reference_time, actual_time in run_benchmark(
+            paths, args.scale, args.sigma, args.min_size, args.max_dim):
+        print("{}: {} regions, reference {:.3f}s, selective_search {:.3f}s ({:.1f}x)".format(
+            os.path.basename(path), count, reference_time, actual_time,
+            reference_time / max(actual_time, 1e-9)))
+        total_reference += reference_time
+        total += actual_time
+    if paths:
+        print("mean per image: reference {:.3f}s, selective_search {:.3f}s".format(
+            total_reference / len(paths), total / len(paths)))
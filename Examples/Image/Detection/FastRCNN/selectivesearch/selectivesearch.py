@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
-import sys
-from past.builtins import cmp
+import heapq
 import skimage.io
 import skimage.feature
 import skimage.color
@@ -153,64 +152,87 @@ def _extract_regions(img):
     # get hsv image
     hsv = skimage.color.rgb2hsv(img[:, :, :3])
 
-    # pass 1: count pixel positions
-    for y, i in enumerate(img):
-
-        for x, (r, g, b, l) in enumerate(i):
-
-            # initialize a new region
-            if l not in R:
-                R[l] = {
-                    "min_x": 0xffff, "min_y": 0xffff,
-                    "max_x": 0, "max_y": 0, "labels": [l]}
-
-            # bounding box
-            if R[l]["min_x"] > x:
-                R[l]["min_x"] = x
-            if R[l]["min_y"] > y:
-                R[l]["min_y"] = y
-            if R[l]["max_x"] < x:
-                R[l]["max_x"] = x
-            if R[l]["max_y"] < y:
-                R[l]["max_y"] = y
+    # pass 1: count pixel positions. Regions are numbered in the order of
+    # their first pixel in raster order
+    labels = img[:, :, 3].ravel()
+    values, first, inverse = numpy.unique(
+        labels, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    ys, xs = numpy.divmod(numpy.arange(len(labels)), img.shape[1])
+    min_x = numpy.full(len(values), 0xffff, dtype=int)
+    min_y = numpy.full(len(values), 0xffff, dtype=int)
+    max_x = numpy.zeros(len(values), dtype=int)
+    max_y = numpy.zeros(len(values), dtype=int)
+    numpy.minimum.at(min_x, inverse, xs)
+    numpy.minimum.at(min_y, inverse, ys)
+    numpy.maximum.at(max_x, inverse, xs)
+    numpy.maximum.at(max_y, inverse, ys)
 
     # pass 2: calculate texture gradient
     tex_grad = _calc_texture_gradient(img)
 
-    # pass 3: calculate colour histogram of each region
-    for k, v in R.items():
-
-        # colour histogram
-        masked_pixels = hsv[:, :, :][img[:, :, 3] == k]
-        R[k]["size"] = len(masked_pixels / 4)
-        R[k]["hist_c"] = _calc_colour_hist(masked_pixels)
-
-        # texture histogram
-        R[k]["hist_t"] = _calc_texture_hist(tex_grad[:, :][img[:, :, 3] == k])
+    # pass 3: calculate colour histogram of each region. A stable sort by
+    # region keeps the pixels of every region in raster order
+    order = numpy.argsort(inverse, kind='mergesort')
+    ends = numpy.cumsum(numpy.bincount(inverse, minlength=len(values)))
+    hsv_pixels = hsv.reshape(-1, hsv.shape[2])[order]
+    tex_pixels = tex_grad.reshape(-1, tex_grad.shape[2])[order]
+
+    for k in numpy.argsort(first, kind='mergesort'):
+        l = values[k]
+        start = ends[k - 1] if k > 0 else 0
+        masked_pixels = hsv_pixels[start:ends[k]]
+        R[l] = {
+            "min_x": int(min_x[k]), "min_y": int(min_y[k]),
+            "max_x": int(max_x[k]), "max_y": int(max_y[k]),
+            "labels": [l],
+            "size": len(masked_pixels),
+            # colour histogram
+            "hist_c": _calc_colour_hist(masked_pixels),
+            # texture histogram
+            "hist_t": _calc_texture_hist(tex_pixels[start:ends[k]])}
 
     return R
 
 
 def _extract_neighbours(regions):
+    """
+        find the pairs of regions (a, b), with a before b in the order of
+        regions, for which a corner of b lies strictly inside the bounding
+        box of a
 
-    def intersect(a, b):
-        if (a["min_x"] < b["min_x"] < a["max_x"]
-                and a["min_y"] < b["min_y"] < a["max_y"]) or (
-            a["min_x"] < b["max_x"] < a["max_x"]
-                and a["min_y"] < b["max_y"] < a["max_y"]) or (
-            a["min_x"] < b["min_x"] < a["max_x"]
-                and a["min_y"] < b["max_y"] < a["max_y"]) or (
-            a["min_x"] < b["max_x"] < a["max_x"]
-                and a["min_y"] < b["min_y"] < a["max_y"]):
-            return True
-        return False
-
+        the corners of all regions are sorted by x, so that only the
+        corners in the x range of a have to be tested
+    """
     R = list(regions.items())
+    if not R:
+        return []
+
+    boxes = numpy.array(
+        [[r["min_x"], r["min_y"], r["max_x"], r["max_y"]] for _, r in R])
+    n = len(R)
+    corner_x = numpy.concatenate(
+        [boxes[:, 0], boxes[:, 2], boxes[:, 0], boxes[:, 2]])
+    corner_y = numpy.concatenate(
+        [boxes[:, 1], boxes[:, 3], boxes[:, 3], boxes[:, 1]])
+    corner_region = numpy.tile(numpy.arange(n), 4)
+    order = numpy.argsort(corner_x, kind='mergesort')
+    corner_x = corner_x[order]
+    corner_y = corner_y[order]
+    corner_region = corner_region[order]
+
     neighbours = []
-    for cur, a in enumerate(R[:-1]):
-        for b in R[cur + 1:]:
-            if intersect(a[1], b[1]):
-                neighbours.append((a, b))
+    for cur in range(n - 1):
+        min_x, min_y, max_x, max_y = boxes[cur]
+        lo = numpy.searchsorted(corner_x, min_x, side='right')
+        hi = numpy.searchsorted(corner_x, max_x, side='left')
+        if lo >= hi:
+            continue
+        y = corner_y[lo:hi]
+        candidates = corner_region[lo:hi]
+        inside = (min_y < y) & (y < max_y) & (candidates > cur)
+        for b in numpy.unique(candidates[inside]):
+            neighbours.append((R[cur], R[b]))
 
     return neighbours
 
@@ -231,28 +253,59 @@ def _merge_regions(r1, r2):
     }
     return rt
 
-def mycmp(x, y): 
-    return cmp(x[1],y[1])
-    
-def cmp_to_key(mycmp):
-    'Convert a cmp= function into a key= function'
-    class K(object):
-        def __init__(self, obj, *args):
-            self.obj = obj
-        def __lt__(self, other):
-            return mycmp(self.obj, other.obj) < 0
-        def __gt__(self, other):
-            return mycmp(self.obj, other.obj) > 0
-        def __eq__(self, other):
-            return mycmp(self.obj, other.obj) == 0
-        def __le__(self, other):
-            return mycmp(self.obj, other.obj) <= 0
-        def __ge__(self, other):
-            return mycmp(self.obj, other.obj) >= 0
-        def __ne__(self, other):
-            return mycmp(self.obj, other.obj) != 0
-    return K
-    
+
+def _hierarchical_grouping(R, neighbours, imsize):
+    """
+        greedily merge the most similar pair of neighbouring regions until
+        no neighbours are left, adding the merged regions to R
+
+        pairs are kept in a heap and invalidated lazily once one of their
+        regions is merged. Every pair gets a sequence number when it is
+        created, and among equally similar pairs the most recent one is
+        merged first
+    """
+    heap = []
+    adjacency = dict((k, {}) for k in R)
+    seq = 0
+    for (ai, ar), (bi, br) in neighbours:
+        heap.append((-_calc_sim(ar, br, imsize), -seq, ai, bi))
+        adjacency[ai][bi] = adjacency[bi][ai] = seq
+        seq += 1
+    heapq.heapify(heap)
+
+    top = max(R.keys()) if R else 0.0
+    while heap:
+
+        # get highest similarity
+        _, _, i, j = heapq.heappop(heap)
+        if i not in adjacency or j not in adjacency:
+            continue
+
+        # merge corresponding regions
+        t = top + 1.0
+        top = t
+        R[t] = _merge_regions(R[i], R[j])
+
+        # remove old similarities of related regions, in the order their
+        # pairs were created
+        related = sorted(
+            [(s, n) for n, s in adjacency.pop(i).items() if n != j] +
+            [(s, n) for n, s in adjacency.pop(j).items() if n != i])
+
+        # calculate similarity set with the new region
+        adjacency[t] = {}
+        for _, n in related:
+            adjacency[n].pop(i, None)
+            adjacency[n].pop(j, None)
+            if n in adjacency[t]:
+                continue
+            heapq.heappush(heap, (-_calc_sim(R[t], R[n], imsize), -seq, t, n))
+            adjacency[t][n] = adjacency[n][t] = seq
+            seq += 1
+
+    return R
+
+
 def selective_search(
         im_orig, scale=1.0, sigma=0.8, min_size=50):
     '''Selective Search
@@ -296,38 +349,8 @@ def selective_search(
     # extract neighbouring information
     neighbours = list(_extract_neighbours(R))
 
-    # calculate initial similarities
-    S = {}
-    for (ai, ar), (bi, br) in neighbours:
-        S[(ai, bi)] = _calc_sim(ar, br, imsize)
-
     # hierarchal search
-    while S != {}:
-
-        # get highest similarity
-        if sys.version_info[0] < 3: 
-            i, j = sorted(S.items(), cmp=mycmp)[-1][0]
-        else: 
-            i, j = sorted(S.items(), key=cmp_to_key(mycmp))[-1][0]
-            
-        # merge corresponding regions
-        t = max(R.keys()) + 1.0
-        R[t] = _merge_regions(R[i], R[j])
-
-        # mark similarities for regions to be removed
-        key_to_delete = []
-        for k, v in S.items():
-            if (i in k) or (j in k):
-                key_to_delete.append(k)
-
-        # remove old similarities of related regions
-        for k in key_to_delete:
-            del S[k]
-
-        # calculate similarity set with the new region
-        for k in filter(lambda a: a != (i, j), key_to_delete):
-            n = k[1] if k[0] in (i, j) else k[0]
-            S[(t, n)] = _calc_sim(R[t], R[n], imsize)
+    _hierarchical_grouping(R, neighbours, imsize)
 
     regions = []
     for k, r in R.items():
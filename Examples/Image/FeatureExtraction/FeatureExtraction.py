@@ -21,7 +21,7 @@ def create_mb_source(image_height, image_width, num_channels, map_file):
 
 def eval_and_write(model_file, node_name, output_file, minibatch_source, num_objects):
     # load model and pick desired node as output
-    loaded_model  = load_model(model_file)
+    loaded_model  = load_model(model_file, cache='freeze')
     node_in_graph = loaded_model.find_by_name(node_name)
     output_nodes  = combine([node_in_graph.owner])
 
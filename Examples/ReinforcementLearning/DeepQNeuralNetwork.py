@@ -6,7 +6,6 @@
 
 from argparse import ArgumentParser
 
-import gym
 import numpy as np
 from cntk.core import Value
 from cntk.initializer import he_uniform
@@ -32,10 +31,22 @@ class ReplayMemory(object):
         self._max_size = size
         self._history_length = max(1, history_length)
         self._state_shape = sample_shape
-        self._states = np.zeros((size,) + sample_shape, dtype=np.float32)
-        self._actions = np.zeros(size, dtype=np.uint8)
-        self._rewards = np.zeros(size, dtype=np.float32)
-        self._terminals = np.zeros(size, dtype=np.float32)
+        self._states = self._allocate((size,) + sample_shape, np.float32)
+        self._actions = self._allocate(size, np.uint8)
+        self._rewards = self._allocate(size, np.float32)
+        self._terminals = self._allocate(size, np.float32)
+
+    def _allocate(self, shape, dtype):
+        """ Allocate a zero-initialized buffer of the memory
+
+        Attributes:
+            shape (tuple or int): Shape of the buffer
+            dtype (np.dtype): Type of the elements
+
+        Returns:
+            np.ndarray
+        """
+        return np.zeros(shape, dtype=dtype)
 
     def __len__(self):
         """ Returns the number of items currently present in the memory
@@ -63,35 +74,88 @@ class ReplayMemory(object):
         self._count = max(self._count, self._pos + 1)
         self._pos = (self._pos + 1) % self._max_size
 
+    def extend(self, states, actions, rewards, dones):
+        """ Appends several transitions at once, in the same order as successive calls to #append().
+
+        Attributes:
+            states (Tensor[n, sample_shape]): The states to append
+            actions ([int]): The actions done
+            rewards ([float]): The rewards received for doing these actions
+            dones ([bool]): Flags specifying which of the states are terminal
+
+        Returns:
+            Indexes where the transitions have been stored (np.ndarray)
+        """
+        states = np.asarray(states)
+        assert states.shape[1:] == self._state_shape, \
+            'Invalid state shape (required: %s, got: %s)' % (self._state_shape, states.shape[1:])
+
+        # Only the last max_size transitions would remain in the memory
+        skip = max(0, len(states) - self._max_size)
+        self._pos = (self._pos + skip) % self._max_size
+        states, actions, rewards, dones = states[skip:], actions[skip:], rewards[skip:], dones[skip:]
+
+        indexes = (self._pos + np.arange(len(states))) % self._max_size
+        self._states[indexes] = states
+        self._actions[indexes] = actions
+        self._rewards[indexes] = rewards
+        self._terminals[indexes] = dones
+
+        self._count = max(self._count, min(self._pos + len(states), self._max_size))
+        self._pos = (self._pos + len(states)) % self._max_size
+        return indexes
+
+    def is_valid(self, indexes):
+        """ Check which indexes can be sampled: the history of a valid index
+            does not wrap over the current pointer and does not contain a terminal state.
+
+        Attributes:
+            indexes (np.ndarray): Indexes in [history_length, len(memory) - 1)
+
+        Returns:
+            Boolean mask of the valid indexes (np.ndarray)
+        """
+        pos, history_len = self._pos, self._history_length
+        valid = ~((indexes >= pos) & (pos > indexes - history_len))
+
+        # Row i of this strided view holds the terminal flags of the states i, ..., i + history_length - 1
+        terminals = np.lib.stride_tricks.as_strided(
+            self._terminals, shape=(self._max_size - history_len + 1, history_len),
+            strides=self._terminals.strides * 2)
+        return valid & ~terminals[indexes - history_len].any(axis=1)
+
+    def nb_valid(self):
+        """ Returns the number of indexes that can currently be sampled
+        Returns: Int >= 0
+        """
+        if self._count - 1 <= self._history_length:
+            return 0
+        return int(self.is_valid(np.arange(self._history_length, self._count - 1)).sum())
+
     def sample(self, size):
         """ Generate size random integers mapping indices in the memory.
-            The returned indices can be retrieved using #get_state().
+            The returned indices can be retrieved using #get_state() or #get_states().
             See the method #minibatch() if you want to retrieve samples directly.
             
         Attributes:
             size (int): The minibatch size
             
         Returns:
-             Indexes of the sampled states ([int])
+             Indexes of the sampled states (np.ndarray)
         """
-
-        # Local variable access is faster in loops
-        count, pos, history_len, terminals = self._count - 1, self._pos, \
-                                             self._history_length, self._terminals
-        indexes = []
+        count, history_len = self._count - 1, self._history_length
+        indexes = np.empty(0, dtype=np.int64)
 
         while len(indexes) < size:
-            index = np.random.randint(history_len, count)
+            # Draw more candidates than missing, as invalid and duplicated ones are rejected
+            candidates = np.random.randint(history_len, count, size=2 * (size - len(indexes)))
+            indexes = np.concatenate((indexes, candidates[self.is_valid(candidates)]))
 
-            if index not in indexes:
+            # Remove duplicates, keeping the first draw of each index
+            _, first = np.unique(indexes, return_index=True)
+            indexes = indexes[np.sort(first)]
 
-                # if not wrapping over current pointer,
-                # then check if there is terminal state wrapped inside
-                if not (index >= pos > index - history_len):
-                    if not terminals[(index - history_len):index].any():
-                        indexes.append(index)
-
-        return indexes
+        return indexes[:size]
 
     def minibatch(self, size):
         """ Generate a minibatch with the number of samples specified by the size parameter.
@@ -104,8 +168,8 @@ class ReplayMemory(object):
         """
         indexes = self.sample(size)
 
-        pre_states = np.array([self.get_state(index) for index in indexes], dtype=np.float32)
-        post_states = np.array([self.get_state(index + 1) for index in indexes], dtype=np.float32)
+        pre_states = self.get_states(indexes)
+        post_states = self.get_states(indexes + 1)
         actions = self._actions[indexes]
         rewards = self._rewards[indexes]
         dones = self._terminals[indexes]
@@ -134,6 +198,188 @@ class ReplayMemory(object):
             indexes = np.arange(index - self._history_length + 1, index + 1)
             return self._states.take(indexes, mode='wrap', axis=0)
 
+    def get_states(self, indexes):
+        """ Return the states at several indexes, see #get_state()
+
+        Attributes:
+            indexes (np.ndarray): States' indexes
+
+        Returns:
+            States at specified indexes (Tensor[len(indexes), history_length, input_shape...])
+        """
+        if self._count == 0:
+            raise IndexError('Empty Memory')
+
+        # Gather the history of all states with a single fancy indexing
+        history = (np.asarray(indexes) % self._count)[:, np.newaxis] + np.arange(1 - self._history_length, 1)
+        return self._states.take(history, mode='wrap', axis=0)
+
+
+class SumTree(object):
+    """
+    Binary tree where each node holds the sum of the priorities of the leaves below it.
+    Leaves map to the indexes of a replay memory. Updating priorities and sampling indexes
+    proportionally to the priorities costs O(log(n)) and is vectorized over batches of indexes.
+    """
+
+    def __init__(self, size):
+        self._depth = int(np.ceil(np.log2(max(size, 2))))
+        self._first_leaf = (1 << self._depth) - 1
+        self._tree = np.zeros(2 * self._first_leaf + 1, dtype=np.float64)
+
+    @property
+    def total(self):
+        """ Sum of all the priorities
+
+        Returns: float
+        """
+        return self._tree[0]
+
+    def get(self, indexes):
+        """ Return the priorities of the specified indexes
+
+        Attributes:
+            indexes (np.ndarray): Leaves' indexes
+
+        Returns:
+            Priorities (np.ndarray)
+        """
+        return self._tree[self._first_leaf + np.asarray(indexes)]
+
+    def update(self, indexes, priorities):
+        """ Set the priorities of the specified indexes
+
+        Attributes:
+            indexes (np.ndarray): Leaves' indexes
+            priorities (np.ndarray): New priorities of the leaves
+        """
+        nodes = self._first_leaf + np.asarray(indexes, dtype=np.int64).ravel()
+        self._tree[nodes] = priorities
+
+        # Recompute the sums one level at a time, all nodes of a level at once
+        for _ in range(self._depth):
+            nodes = np.unique((nodes - 1) // 2)
+            self._tree[nodes] = self._tree[2 * nodes + 1] + self._tree[2 * nodes + 2]
+
+    def find(self, values):
+        """ Return the leaves where the cumulative sum of the priorities reaches the specified values
+
+        Attributes:
+            values (np.ndarray): Values in [0, total)
+
+        Returns:
+            Leaves' indexes (np.ndarray)
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.zeros(len(values), dtype=np.int64)
+
+        for _ in range(self._depth):
+            left = 2 * nodes + 1
+            left_sums = self._tree[left]
+            go_right = values >= left_sums
+            values = np.where(go_right, values - left_sums, values)
+            nodes = np.where(go_right, left + 1, left)
+
+        return nodes - self._first_leaf
+
+
+class PrioritizedReplayMemory(ReplayMemory):
+    """
+    Replay memory sampling the transitions proportionally to their priority, like in:
+        ICLR 2016. "Prioritized Experience Replay" (Schaul & al. 2016)
+    The priority of a transition is derived from its last temporal-difference error.
+    New transitions get the highest priority seen so far, to be replayed at least once.
+    """
+    def __init__(self, size, sample_shape, history_length=4, alpha=0.6, beta=0.4, epsilon=1e-6):
+        super(PrioritizedReplayMemory, self).__init__(size, sample_shape, history_length)
+        self.alpha = alpha
+        self.beta = beta
+        self._epsilon = epsilon
+        self._tree = SumTree(size)
+        self._max_priority = 1.0
+        self._pending = []
+
+    def append(self, state, action, reward, done):
+        # The sum tree is updated once for all pending transitions before sampling
+        self._pending.append(self._pos)
+        super(PrioritizedReplayMemory, self).append(state, action, reward, done)
+
+    def extend(self, states, actions, rewards, dones):
+        indexes = super(PrioritizedReplayMemory, self).extend(states, actions, rewards, dones)
+        self._pending.extend(indexes.tolist())
+        return indexes
+
+    def _update_pending(self):
+        if self._pending:
+            self._tree.update(self._pending, self._max_priority)
+            self._pending = []
+
+    def sample(self, size):
+        """ Generate size indices in the memory, sampled with probability proportional to their priority.
+            Each index is drawn from an equal share of the total priority (stratified sampling).
+
+        Attributes:
+            size (int): The minibatch size
+
+        Returns:
+             Indexes of the sampled states (np.ndarray)
+        """
+        self._update_pending()
+        count, history_len, total = self._count - 1, self._history_length, self._tree.total
+
+        values = (np.arange(size) + np.random.rand(size)) * (total / size)
+        indexes = self._tree.find(np.minimum(values, np.nextafter(total, 0)))
+
+        valid = (indexes >= history_len) & (indexes < count)
+        valid[valid] = self.is_valid(indexes[valid])
+        while not valid.all():
+            # Redraw the rejected indexes from the whole memory
+            retry = np.flatnonzero(~valid)
+            indexes[retry] = self._tree.find(np.random.rand(len(retry)) * np.nextafter(total, 0))
+            valid[retry] = (indexes[retry] >= history_len) & (indexes[retry] < count)
+            retry = retry[valid[retry]]
+            valid[retry] = self.is_valid(indexes[retry])
+
+        return indexes
+
+    def minibatch(self, size):
+        """ Generate a minibatch with the number of samples specified by the size parameter.
+
+        Attributes:
+            size (int): Minibatch size
+
+        Returns:
+            tuple: Tensor[minibatch_size, input_shape...], [int], [float], [bool], then the sampled
+            indexes [int] (see #update_priorities()) and the importance-sampling weights [float]
+        """
+        indexes = self.sample(size)
+
+        pre_states = self.get_states(indexes)
+        post_states = self.get_states(indexes + 1)
+        actions = self._actions[indexes]
+        rewards = self._rewards[indexes]
+        dones = self._terminals[indexes]
+
+        # Importance-sampling weights correcting the bias of the prioritized sampling,
+        # normalized such as the largest weight of the minibatch is 1
+        probabilities = self._tree.get(indexes) / self._tree.total
+        weights = (len(self) * probabilities) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32)
+
+        return pre_states, actions, post_states, rewards, dones, indexes, weights
+
+    def update_priorities(self, indexes, td_errors):
+        """ Update the priorities of sampled transitions from their new temporal-difference errors
+
+        Attributes:
+            indexes ([int]): Indexes returned by #minibatch()
+            td_errors ([float]): Temporal-difference error of each transition
+        """
+        self._update_pending()
+        priorities = (np.abs(td_errors) + self._epsilon) ** self.alpha
+        self._tree.update(indexes, priorities)
+        self._max_priority = max(self._max_priority, priorities.max())
+
 
 class History(object):
     """
@@ -214,7 +460,7 @@ class LinearEpsilonAnnealingExplorer(object):
         return np.random.rand() < self._epsilon(step)
 
 
-def huber_loss(y, y_hat, delta):
+def huber_loss(y, y_hat, delta, weights=None):
     """ Compute the Huber Loss as part of the model graph
 
     Huber Loss is more robust to outliers. It is defined as:
@@ -227,6 +473,7 @@ def huber_loss(y, y_hat, delta):
         y (Tensor[-1, 1]): Target value
         y_hat(Tensor[-1, 1]): Estimated value
         delta (float): Outliers threshold
+        weights (Tensor[-1, 1]): Optional weight of each sample
     
     Returns:
         CNTK Graph Node
@@ -238,10 +485,34 @@ def huber_loss(y, y_hat, delta):
     less_than = 0.5 * square(error)
     more_than = (delta * abs_error) - half_delta_squared
     loss_per_sample = element_select(less(abs_error, delta), less_than, more_than)
+    if weights is not None:
+        loss_per_sample = loss_per_sample * weights
 
     return reduce_sum(loss_per_sample, name='loss')
 
 
+def create_action_value_net(input_shape, nb_actions):
+    """ Create the network estimating the expected reward of each action from the N last states
+
+    Attributes:
+        input_shape (tuple): Shape of the N last states stacked along the first axis
+        nb_actions (int): Number of actions available
+
+    Returns:
+        CNTK Function mapping Tensor[input_shape] to Tensor[nb_actions]
+    """
+    with default_options(activation=relu, init=he_uniform()):
+        action_value_net = Sequential([
+            Convolution2D((8, 8), 16, strides=4),
+            Convolution2D((4, 4), 32, strides=2),
+            Convolution2D((3, 3), 32, strides=1),
+            Dense(256, init=he_uniform(scale=0.01)),
+            Dense(nb_actions, activation=None, init=he_uniform(scale=0.01))
+        ])
+    action_value_net.update_signature(Tensor[input_shape])
+    return action_value_net
+
+
 class DeepQAgent(object):
     """
     Implementation of Deep Q Neural Network agent like in: 
@@ -251,7 +522,7 @@ class DeepQAgent(object):
                  gamma=0.99, explorer=LinearEpsilonAnnealingExplorer(1, 0.1, 1000000),
                  learning_rate=0.00025, momentum=0.95, minibatch_size=32,
                  memory_size=500000, train_after=200000, train_interval=4, target_update_interval=10000,
-                 monitor=True):
+                 monitor=True, prioritized_replay=False, memory=None):
         self.input_shape = input_shape
         self.nb_actions = nb_actions
         self.gamma = gamma
@@ -263,29 +534,29 @@ class DeepQAgent(object):
         self._explorer = explorer
         self._minibatch_size = minibatch_size
         self._history = History(input_shape)
-        self._memory = ReplayMemory(memory_size, input_shape[1:], 4)
+        self._prioritized_replay = prioritized_replay
+        if memory is not None:
+            self._memory = memory
+        elif prioritized_replay:
+            self._memory = PrioritizedReplayMemory(memory_size, input_shape[1:], 4)
+        else:
+            self._memory = ReplayMemory(memory_size, input_shape[1:], 4)
         self._num_actions_taken = 0
 
         # Metrics accumulator
         self._episode_rewards, self._episode_q_means, self._episode_q_stddev = [], [], []
 
         # Action Value model (used by agent to interact with the environment)
-        with default_options(activation=relu, init=he_uniform()):
-            self._action_value_net = Sequential([
-                Convolution2D((8, 8), 16, strides=4),
-                Convolution2D((4, 4), 32, strides=2),
-                Convolution2D((3, 3), 32, strides=1),
-                Dense(256, init=he_uniform(scale=0.01)),
-                Dense(nb_actions, activation=None, init=he_uniform(scale=0.01))
-            ])
-        self._action_value_net.update_signature(Tensor[input_shape])
+        self._action_value_net = create_action_value_net(input_shape, nb_actions)
 
         # Return the indexes of the maximum expectation from the network
         self._choose_action = argmax(self._action_value_net, name='q_values_argmax')
 
         # Target model
         # (used to compute target QValues in training, updated less frequently)
-        self._target_net = self._action_value_net.clone(CloneMethod.freeze)
+        # The training criterion and the priorities of prioritized replay are computed from this very Function,
+        # so it is updated in place by #update_target_net(). Its parameters are not given to the learner.
+        self._target_net = self._action_value_net.clone(CloneMethod.clone)
 
         # # Function computing qvalues targets as part of the computation graph
         @Function
@@ -298,10 +569,11 @@ class DeepQAgent(object):
             )
 
         # Define the loss, using Huber Loss (More robust to outliers)
+        # weights are the importance-sampling weights of prioritized replay (1 otherwise)
         @Function
         @Signature(pre_states=Tensor[input_shape], actions=Tensor[nb_actions],
-                   post_states=Tensor[input_shape], rewards=Tensor[()], terminals=Tensor[()])
-        def criterion(pre_states, actions, post_states, rewards, terminals):
+                   post_states=Tensor[input_shape], rewards=Tensor[()], terminals=Tensor[()], weights=Tensor[()])
+        def criterion(pre_states, actions, post_states, rewards, terminals, weights):
             # Compute the q_targets
             q_targets = compute_q_targets(post_states, rewards, terminals)
 
@@ -309,7 +581,7 @@ class DeepQAgent(object):
             q_acted = reduce_sum(self._action_value_net(pre_states) * actions, axis=0)
 
             # Define training criterion as the Huber Loss function
-            return huber_loss(q_targets, q_acted, 1.0)
+            return huber_loss(q_targets, q_acted, 1.0, weights)
 
         # Adam based SGD
         lr_schedule = learning_rate_schedule(learning_rate, UnitType.minibatch)
@@ -322,6 +594,24 @@ class DeepQAgent(object):
         self._learner = l_sgd
         self._trainer = Trainer(criterion, (criterion, None), l_sgd, self._metrics_writer)
 
+    @property
+    def action_value_net(self):
+        """ The Action Value Network being trained
+
+        Returns:
+            CNTK Function
+        """
+        return self._action_value_net
+
+    @property
+    def memory(self):
+        """ The replay memory the agent is trained from
+
+        Returns:
+            ReplayMemory
+        """
+        return self._memory
+
     def act(self, state):
         """ This allows the agent to select the next action to perform in regard of the current state of the environment.
         It follows the terminology used in the Nature paper.
@@ -394,21 +684,57 @@ class DeepQAgent(object):
 
         if agent_step >= self._train_after:
             if (agent_step % self._train_interval) == 0:
-                pre_states, actions, post_states, rewards, terminals = self._memory.minibatch(self._minibatch_size)
-
-                self._trainer.train_minibatch(
-                    self._trainer.loss_function.argument_map(
-                        pre_states=pre_states,
-                        actions=Value.one_hot(actions.reshape(-1, 1).tolist(), self.nb_actions),
-                        post_states=post_states,
-                        rewards=rewards,
-                        terminals=terminals
-                    )
-                )
+                self.learn()
 
                 # Update the Target Network if needed
                 if (agent_step % self._target_update_interval) == 0:
-                    self._target_net = self._action_value_net.clone(CloneMethod.freeze)
+                    self.update_target_net()
+
+    def learn(self):
+        """ Train the Action Value Network on a single minibatch sampled from the replay memory.
+        Unlike #train(), this does not depend on the number of actions taken by the agent itself,
+        which allows the experience to be collected by other processes (see MultiActorDeepQNetwork.py).
+        """
+        if self._prioritized_replay:
+            pre_states, actions, post_states, rewards, terminals, indexes, weights = \
+                self._memory.minibatch(self._minibatch_size)
+
+            # Priorities are updated from the temporal-difference errors before this update
+            self._memory.update_priorities(
+                indexes, self._td_errors(pre_states, actions, post_states, rewards, terminals))
+        else:
+            pre_states, actions, post_states, rewards, terminals = self._memory.minibatch(self._minibatch_size)
+            weights = np.ones(len(rewards), dtype=np.float32)
+
+        self._trainer.train_minibatch(
+            self._trainer.loss_function.argument_map(
+                pre_states=pre_states,
+                actions=Value.one_hot(actions.reshape(-1, 1).tolist(), self.nb_actions),
+                post_states=post_states,
+                rewards=rewards,
+                terminals=terminals,
+                weights=weights
+            )
+        )
+
+    def update_target_net(self):
+        """ Copy the current parameters of the Action Value Network into the Target Network
+        """
+        for target, source in zip(self._target_net.parameters, self._action_value_net.parameters):
+            assert target.shape == source.shape, \
+                'Invalid parameter shape (required: %s, got: %s)' % (source.shape, target.shape)
+            target.value = source.value
+
+    def _td_errors(self, pre_states, actions, post_states, rewards, terminals):
+        """ Compute the temporal-difference error of each transition of a minibatch
+
+        Returns:
+            np.ndarray: q_targets - q_acted for each transition
+        """
+        q_targets = np.where(terminals, rewards,
+                             self.gamma * self._target_net.eval(post_states).max(axis=1) + rewards)
+        q_acted = self._action_value_net.eval(pre_states)[np.arange(len(actions)), actions]
+        return q_targets - q_acted
 
     def _plot_metrics(self):
         """Plot current buffers accumulated values to visualize agent learning 
@@ -441,15 +767,19 @@ if __name__ == '__main__':
     parser = ArgumentParser()
     parser.add_argument('-e', '--epoch', default=100, type=int, help='Number of epochs to run (epoch = 250k actions')
     parser.add_argument('-p', '--plot', action='store_true', default=False, help='Flag for enabling Tensorboard')
+    parser.add_argument('-r', '--prioritized', action='store_true', default=False,
+                        help='Flag for enabling prioritized experience replay')
     parser.add_argument('env', default='Pong-v3', type=str, metavar='N', nargs='?', help='Gym Atari environment to run')
 
     args = parser.parse_args()
 
+    import gym
+
     # 1. Make environment:
     env = gym.make(args.env)
 
     # 2. Make agent
-    agent = DeepQAgent((4, 84, 84), env.action_space.n, monitor=args.plot)
+    agent = DeepQAgent((4, 84, 84), env.action_space.n, monitor=args.plot, prioritized_replay=args.prioritized)
 
     # Train
     current_step = 0
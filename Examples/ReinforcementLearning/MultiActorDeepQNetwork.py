@@ -0,0 +1,376 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+from argparse import ArgumentParser
+from functools import partial
+import multiprocessing
+import time
+
+import numpy as np
+
+from DeepQNeuralNetwork import DeepQAgent, ReplayMemory, History, LinearEpsilonAnnealingExplorer, \
+    create_action_value_net, as_ale_input
+
+# The actors are started with 'spawn' rather than forked from the learner, which has already
+# initialized CNTK. Shared buffers and locks have to be created from the same context.
+_context = None
+
+
+def _get_context():
+    """ Returns the multiprocessing context the actors are started with
+    Returns: multiprocessing context
+    """
+    global _context
+    if _context is None:
+        if not hasattr(multiprocessing, 'get_context'):
+            raise RuntimeError('Multi-actor training requires Python 3.4 or later (multiprocessing start methods)')
+        _context = multiprocessing.get_context('spawn')
+    return _context
+
+
+class SharedReplayMemory(ReplayMemory):
+    """
+    ReplayMemory whose buffers live in shared memory, so that an actor process can append
+    transitions while the learner process samples minibatches from it.
+    Appending and sampling hold a lock shared by all the copies of the memory.
+    """
+    def __init__(self, size, sample_shape, history_length=4):
+        self._lock = _get_context().Lock()
+        self._shared_pos = _get_context().RawValue('l', 0)
+        self._shared_count = _get_context().RawValue('l', 0)
+        self._buffers = []
+        super(SharedReplayMemory, self).__init__(size, sample_shape, history_length)
+
+    def _allocate(self, shape, dtype):
+        shape, dtype = tuple(np.atleast_1d(shape)), np.dtype(dtype)
+        buffer = _get_context().RawArray('b', int(np.prod(shape)) * dtype.itemsize)
+        self._buffers.append((buffer, shape, dtype))
+        return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+    def __getstate__(self):
+        # The numpy views are rebuilt from the shared buffers
+        state = self.__dict__.copy()
+        for name in ['_states', '_actions', '_rewards', '_terminals']:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._states, self._actions, self._rewards, self._terminals = \
+            [np.frombuffer(buffer, dtype=dtype).reshape(shape) for buffer, shape, dtype in self._buffers]
+
+    @property
+    def _pos(self):
+        return self._shared_pos.value
+
+    @_pos.setter
+    def _pos(self, value):
+        self._shared_pos.value = value
+
+    @property
+    def _count(self):
+        return self._shared_count.value
+
+    @_count.setter
+    def _count(self, value):
+        self._shared_count.value = value
+
+    def append(self, state, action, reward, done):
+        with self._lock:
+            super(SharedReplayMemory, self).append(state, action, reward, done)
+
+    def extend(self, states, actions, rewards, dones):
+        with self._lock:
+            return super(SharedReplayMemory, self).extend(states, actions, rewards, dones)
+
+    def minibatch(self, size):
+        with self._lock:
+            return super(SharedReplayMemory, self).minibatch(size)
+
+
+class MultiActorReplayMemory(object):
+    """
+    Replay memory made of one SharedReplayMemory per actor. The transitions of an actor are stored
+    contiguously, so the state histories never mix frames of different actors.
+    Minibatches are sampled uniformly over the transitions of all the actors.
+    """
+    def __init__(self, nb_actors, size, sample_shape, history_length=4):
+        self._memories = [SharedReplayMemory(size // nb_actors, sample_shape, history_length)
+                          for _ in range(nb_actors)]
+
+    def __len__(self):
+        """ Returns the number of transitions collected by all the actors
+        Returns: Int >= 0
+        """
+        return sum(len(memory) for memory in self._memories)
+
+    def __getitem__(self, actor):
+        """ Returns the memory of the specified actor
+        Returns: SharedReplayMemory
+        """
+        return self._memories[actor]
+
+    def minibatch(self, size):
+        """ Generate a minibatch with the number of samples specified by the size parameter.
+        See ReplayMemory#minibatch()
+        """
+        # The actors can't append while the samples are split and drawn, which could invalidate indexes
+        for memory in self._memories:
+            memory._lock.acquire()
+        try:
+            counts = np.array([memory.nb_valid() for memory in self._memories])
+            if counts.sum() < size:
+                raise ValueError('Cannot sample %d transitions, only %d can be sampled yet' % (size, counts.sum()))
+
+            # No actor is asked for more samples than it can provide, the remainder is spread over the others
+            sizes = np.zeros(len(counts), dtype=np.int64)
+            while sizes.sum() < size:
+                room = counts - sizes
+                sizes += np.minimum(np.random.multinomial(size - sizes.sum(), room / room.sum()), room)
+
+            parts = [ReplayMemory.minibatch(memory, n) for memory, n in zip(self._memories, sizes) if n > 0]
+        finally:
+            for memory in self._memories:
+                memory._lock.release()
+
+        return tuple(np.concatenate(values) for values in zip(*parts))
+
+
+class SharedParameters(object):
+    """
+    Copy of the parameters of a Function in shared memory. The learner publishes the parameters of
+    its network, the actors pull them into their own copy of the network.
+    """
+    def __init__(self, parameters):
+        self._shapes = [parameter.shape for parameter in parameters]
+        self._sizes = [int(np.prod(shape)) for shape in self._shapes]
+        self._buffer = _get_context().RawArray('f', sum(self._sizes))
+        self._version = _get_context().RawValue('l', 0)
+        self._lock = _get_context().Lock()
+        self.publish(parameters)
+
+    @property
+    def version(self):
+        """ Number of times the parameters have been published
+        Returns: Int > 0
+        """
+        return self._version.value
+
+    def publish(self, parameters):
+        """ Copy the values of the parameters to the shared memory
+
+        Attributes:
+            parameters ([Parameter]): Parameters of the learner's network
+        """
+        values = np.concatenate([np.asarray(parameter.value, dtype=np.float32).ravel() for parameter in parameters])
+        with self._lock:
+            np.frombuffer(self._buffer, dtype=np.float32)[:] = values
+            self._version.value += 1
+
+    def pull(self, parameters, version=0):
+        """ Copy the shared values to the parameters, if they have been published since the specified version
+
+        Attributes:
+            parameters ([Parameter]): Parameters of a network with the same architecture as the learner's one
+            version (int): Version of the values the parameters currently hold
+
+        Returns:
+            Version of the values the parameters hold after the call (int)
+        """
+        with self._lock:
+            if self._version.value == version:
+                return version
+            values = np.frombuffer(self._buffer, dtype=np.float32).copy()
+            version = self._version.value
+
+        offset = 0
+        for parameter, shape, size in zip(parameters, self._shapes, self._sizes):
+            assert parameter.shape == shape, \
+                'Invalid parameter shape (required: %s, got: %s)' % (shape, parameter.shape)
+            parameter.value = values[offset:offset + size].reshape(shape)
+            offset += size
+        return version
+
+
+class DummyEnvironment(object):
+    """
+    Environment with the interface of a gym Atari environment, to run the example without gym.
+    At each step one action is rewarded, and the brightness of the observed frame tells which one.
+    """
+
+    class ActionSpace(object):
+        def __init__(self, n):
+            self.n = n
+
+    def __init__(self, nb_actions=4, episode_length=200, observation_shape=(210, 160, 3), seed=None):
+        self.action_space = DummyEnvironment.ActionSpace(nb_actions)
+        self._episode_length = episode_length
+        self._observation_shape = observation_shape
+        self._rng = np.random.RandomState(seed)
+        self._step = 0
+        self._target = 0
+
+    def _observe(self):
+        self._target = self._rng.randint(self.action_space.n)
+        brightness = (255 * self._target) // max(1, self.action_space.n - 1)
+        return np.full(self._observation_shape, brightness, dtype=np.uint8)
+
+    def reset(self):
+        self._step = 0
+        return self._observe()
+
+    def step(self, action):
+        reward = 1. if action == self._target else 0.
+        self._step += 1
+        return self._observe(), reward, self._step >= self._episode_length, {}
+
+
+def make_gym_environment(name):
+    import gym
+    return gym.make(name)
+
+
+def run_actor(env_factory, memory, shared_parameters, stop_event, input_shape, nb_actions, explorer,
+              sync_interval=1000, push_interval=100, seed=None):
+    """ Run an environment and push its transitions into the actor's replay memory, until stop_event is set.
+    The actions are chosen by a local copy of the Action Value Network, which is synced with the learner's
+    one every sync_interval steps.
+
+    Attributes:
+        env_factory (callable): Creates the environment
+        memory (SharedReplayMemory): Memory of this actor
+        shared_parameters (SharedParameters): Parameters published by the learner
+        stop_event (Event): Set by the learner when the actor has to stop
+        input_shape (tuple): Shape of the N last states stacked along the first axis
+        nb_actions (int): Number of actions available
+        explorer (LinearEpsilonAnnealingExplorer): Exploration policy
+        sync_interval (int): Number of steps between two syncs of the network
+        push_interval (int): Number of transitions pushed into the memory at once
+        seed (int): Seed of the exploration
+    """
+    np.random.seed(seed)
+    env = env_factory()
+    action_value_net = create_action_value_net(input_shape, nb_actions)
+    version = shared_parameters.pull(action_value_net.parameters)
+    history = History(input_shape)
+
+    states, actions, rewards, dones = [], [], [], []
+    current_step = 0
+    current_state = as_ale_input(env.reset())
+
+    while not stop_event.is_set():
+        history.append(current_state)
+        if explorer.is_exploring(current_step):
+            action = explorer(nb_actions)
+        else:
+            env_with_history = history.value
+            action = action_value_net.eval(env_with_history.reshape((1,) + env_with_history.shape)).argmax()
+
+        new_state, reward, done, _ = env.step(action)
+
+        # Clipping reward for training stability
+        reward = np.clip(reward, -1, 1)
+
+        states.append(current_state)
+        actions.append(action)
+        rewards.append(reward)
+        dones.append(done)
+
+        if done:
+            history.reset()
+            new_state = env.reset()
+        current_state = as_ale_input(new_state)
+        current_step += 1
+
+        if len(states) == push_interval:
+            memory.extend(np.array(states, dtype=np.float32), np.array(actions),
+                          np.array(rewards, dtype=np.float32), np.array(dones))
+            states, actions, rewards, dones = [], [], [], []
+
+        if current_step % sync_interval == 0:
+            version = shared_parameters.pull(action_value_net.parameters, version)
+
+
+def train_multi_actor(env_factory, input_shape, nb_actions, nb_actors=4, nb_updates=1000000,
+                      memory_size=500000, train_after=50000, target_update_interval=2500,
+                      publish_interval=100, sync_interval=1000, push_interval=100,
+                      minibatch_size=32, explorer_steps=1000000, monitor=False, seed=0):
+    """ Train a DeepQAgent from the experience collected by actor processes.
+    Each actor runs its own environment with a copy of the agent's network, while the learner
+    (the calling process) trains the agent on minibatches sampled from all the actors' transitions.
+
+    Attributes:
+        env_factory (callable): Creates the environment of an actor, has to be picklable
+        input_shape (tuple): Shape of the N last states stacked along the first axis
+        nb_actions (int): Number of actions available
+        nb_actors (int): Number of actor processes
+        nb_updates (int): Number of minibatches the learner trains on
+        memory_size (int): Number of transitions kept in the replay memory, shared among the actors
+        train_after (int): Number of transitions collected before the learner starts
+        target_update_interval (int): Number of updates between two updates of the Target Network
+        publish_interval (int): Number of updates between two publications of the parameters to the actors
+        sync_interval (int): Number of steps between two syncs of an actor's network
+        push_interval (int): Number of transitions an actor pushes into the memory at once
+        minibatch_size (int): Minibatch size
+        explorer_steps (int): Number of steps over which the actors anneal their exploration
+        monitor (bool): Plot the training with Tensorboard
+
+    Returns:
+        DeepQAgent: The trained agent
+    """
+    memory = MultiActorReplayMemory(nb_actors, memory_size, input_shape[1:], input_shape[0])
+    agent = DeepQAgent(input_shape, nb_actions, minibatch_size=minibatch_size, memory=memory, monitor=monitor)
+    shared_parameters = SharedParameters(agent.action_value_net.parameters)
+    stop_event = _get_context().Event()
+
+    actors = [_get_context().Process(target=run_actor, args=(
+        env_factory, memory[actor], shared_parameters, stop_event, input_shape, nb_actions,
+        LinearEpsilonAnnealingExplorer(1, 0.1, explorer_steps), sync_interval, push_interval, seed + actor))
+        for actor in range(nb_actors)]
+    for actor in actors:
+        actor.daemon = True
+        actor.start()
+
+    try:
+        # Wait for the actors to collect enough experience
+        while len(memory) < train_after:
+            if not all(actor.is_alive() for actor in actors):
+                raise RuntimeError('An actor process has stopped')
+            time.sleep(0.1)
+
+        for update in range(1, nb_updates + 1):
+            agent.learn()
+
+            if update % target_update_interval == 0:
+                agent.update_target_net()
+            if update % publish_interval == 0:
+                shared_parameters.publish(agent.action_value_net.parameters)
+    finally:
+        stop_event.set()
+        for actor in actors:
+            actor.join()
+
+    return agent
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-a', '--actors', default=4, type=int, help='Number of actor processes')
+    parser.add_argument('-u', '--updates', default=1000000, type=int, help='Number of minibatches to train on')
+    parser.add_argument('-p', '--plot', action='store_true', default=False, help='Flag for enabling Tensorboard')
+    parser.add_argument('-d', '--dummy', action='store_true', default=False,
+                        help='Flag for using a dummy environment instead of gym')
+    parser.add_argument('env', default='Pong-v3', type=str, metavar='N', nargs='?', help='Gym Atari environment to run')
+
+    args = parser.parse_args()
+
+    if args.dummy:
+        env_factory = DummyEnvironment
+    else:
+        env_factory = partial(make_gym_environment, args.env)
+
+    train_multi_actor(env_factory, (4, 84, 84), env_factory().action_space.n, nb_actors=args.actors,
+                      nb_updates=args.updates, monitor=args.plot)
@@ -0,0 +1,108 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+from argparse import ArgumentParser
+import time
+
+import numpy as np
+
+from DeepQNeuralNetwork import ReplayMemory, PrioritizedReplayMemory
+
+
+def reference_minibatch(memory, size):
+    """ Minibatch assembly as done before the vectorized sampler: indexes are drawn one at a time
+    with rejection, and the states are gathered with one #get_state() call per index.
+
+    Attributes:
+        memory (ReplayMemory): The memory to sample from
+        size (int): Minibatch size
+    """
+    count, pos, history_len, terminals = len(memory) - 1, memory._pos, memory._history_length, memory._terminals
+    indexes = []
+
+    while len(indexes) < size:
+        index = np.random.randint(history_len, count)
+
+        if index not in indexes:
+            if not (index >= pos > index - history_len):
+                if not terminals[(index - history_len):index].any():
+                    indexes.append(index)
+
+    pre_states = np.array([memory.get_state(index) for index in indexes], dtype=np.float32)
+    post_states = np.array([memory.get_state(index + 1) for index in indexes], dtype=np.float32)
+    return pre_states, memory._actions[indexes], post_states, memory._rewards[indexes], memory._terminals[indexes]
+
+
+def fill_memory(memory, nb_transitions, state_shape, episode_length, chunk_size=100000):
+    """ Append random transitions, with episodes of episode_length steps
+
+    Attributes:
+        memory (ReplayMemory): The memory to fill
+        nb_transitions (int): Number of transitions to append
+        state_shape (tuple): Shape of a single state
+        episode_length (int): Number of steps of each episode
+    """
+    for start in range(0, nb_transitions, chunk_size):
+        n = min(chunk_size, nb_transitions - start)
+        steps = np.arange(start, start + n)
+        memory.extend(np.random.rand(n, *state_shape).astype(np.float32),
+                      np.random.randint(0, 4, size=n),
+                      np.random.rand(n).astype(np.float32),
+                      steps % episode_length == episode_length - 1)
+
+
+def time_minibatch(minibatch, size, repeats):
+    """ Average time in seconds to assemble a minibatch """
+    minibatch(size)
+    start = time.time()
+    for _ in range(repeats):
+        minibatch(size)
+    return (time.time() - start) / repeats
+
+
+def run_benchmark(capacity=1000000, state_dim=8, minibatch_size=32, episode_length=1000, repeats=100, seed=0):
+    """ Measure the time to assemble minibatches from full replay memories. The memories are filled
+    past their capacity, so the sampler also has to avoid the histories wrapping over the current pointer.
+
+    Returns:
+        dict with the seconds per minibatch of the 'reference', 'vectorized' and 'prioritized' samplers,
+        and 'consistent' which is True if #get_states() matches #get_state()
+    """
+    np.random.seed(seed)
+    state_shape = (state_dim, state_dim)
+    nb_transitions = capacity + capacity // 2
+
+    memory = ReplayMemory(capacity, state_shape)
+    fill_memory(memory, nb_transitions, state_shape, episode_length)
+    indexes = memory.sample(minibatch_size)
+    consistent = np.array_equal(memory.get_states(indexes), [memory.get_state(index) for index in indexes])
+
+    reference = time_minibatch(lambda size: reference_minibatch(memory, size), minibatch_size, repeats)
+    vectorized = time_minibatch(memory.minibatch, minibatch_size, repeats)
+    del memory
+
+    prioritized_memory = PrioritizedReplayMemory(capacity, state_shape)
+    fill_memory(prioritized_memory, nb_transitions, state_shape, episode_length)
+    prioritized_memory.update_priorities(np.arange(capacity), np.random.rand(capacity))
+    prioritized = time_minibatch(prioritized_memory.minibatch, minibatch_size, repeats)
+
+    return {'reference': reference, 'vectorized': vectorized, 'prioritized': prioritized, 'consistent': consistent}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('-c', '--capacity', default=1000000, type=int, help='Number of transitions in the memory')
+    parser.add_argument('-d', '--state_dim', default=8, type=int,
+                        help='Width and height of a state (84 for Atari games, which needs a lot of memory)')
+    parser.add_argument('-m', '--minibatch_size', default=32, type=int, help='Minibatch size')
+    parser.add_argument('-r', '--repeats', default=100, type=int, help='Number of timed minibatches')
+
+    args = parser.parse_args()
+    result = run_benchmark(args.capacity, args.state_dim, args.minibatch_size, repeats=args.repeats)
+
+    print('Minibatch assembly at capacity %d (states match: %s)' % (args.capacity, result['consistent']))
+    for name in ['reference', 'vectorized', 'prioritized']:
+        print('  %-12s %8.3f ms' % (name, result[name] * 1000))
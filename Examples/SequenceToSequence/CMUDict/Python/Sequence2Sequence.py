@@ -10,7 +10,7 @@ import os
 from cntk import Trainer, Axis
 from cntk.io import MinibatchSource, CTFDeserializer, StreamDef, StreamDefs, INFINITELY_REPEAT
 from cntk.learners import momentum_sgd, fsadagrad, momentum_as_time_constant_schedule, learning_rate_schedule, UnitType
-from cntk import input, cross_entropy_with_softmax, classification_error, sequence, \
+from cntk import input, input_variable, cross_entropy_with_softmax, classification_error, sequence, \
                  element_select, alias, hardmax, placeholder, combine, parameter, times, plus
 from cntk.ops.functions import CloneMethod, load_model, Function
 from cntk.initializer import glorot_uniform
@@ -48,6 +48,7 @@ length_increase = 1.5
 
 # sentence-start symbol as a constant
 sentence_start = Constant(np.array([w=='<s>' for w in vocab], dtype=np.float32))
+sentence_start_index = vocab.index('<s>')
 sentence_end_index = vocab.index('</s>')
 # TODO: move these where they belong
 
@@ -174,6 +175,17 @@ def create_model_greedy(s2smodel):
         return unfold(initial_state=sentence_start, dynamic_axes_like=input)
     return model_greedy
 
+def create_model_beam_search(s2smodel, beam_width):
+    # model used in beam search decoding, which keeps the beam_width best hypotheses instead of only the best one
+    # Unlike UnfoldFrom(), the search runs one decoder step at a time, for all hypotheses of all input sequences at once.
+    # The encoder runs once per input sequence, and its outputs are shared by all hypotheses.
+    history = input_variable(**LabelSequence[Tensor[label_vocab_dim]])
+    input   = input_variable(**InputSequence[SparseTensor[input_vocab_dim]])
+    decoder = s2smodel(history, input)
+    encoder_outputs = [decoder.encoded_h] if use_attention else [decoder.encoded_h, decoder.encoded_c]
+    return BeamSearchDecoder(decoder, history, encoder_outputs, sentence_start_index, sentence_end_index,
+                             beam_width=beam_width, length_increase=length_increase)
+
 def create_criterion_function(model):
     @Function
     @Signature(input = InputSequence[Tensor[input_vocab_dim]], labels = LabelSequence[Tensor[label_vocab_dim]])
@@ -278,9 +290,13 @@ def train(train_reader, valid_reader, vocab, i2w, s2smodel, max_epochs, epoch_si
 ########################
 
 # This decodes the test set and counts the string error rate.
-def evaluate_decoding(reader, s2smodel, i2w):
+# With a beam_width larger than 1, a beam search decoder is used instead of the greedy one.
+def evaluate_decoding(reader, s2smodel, i2w, beam_width=1):
 
-    model_decoding = create_model_greedy(s2smodel) # wrap the greedy decoder around the model
+    if beam_width > 1:
+        model_decoding = create_model_beam_search(s2smodel, beam_width)
+    else:
+        model_decoding = create_model_greedy(s2smodel) # wrap the greedy decoder around the model
 
     progress_printer = ProgressPrinter(tag='Evaluation')
 
@@ -293,8 +309,13 @@ def evaluate_decoding(reader, s2smodel, i2w):
         mb = reader.next_minibatch(minibatch_size)
         if not mb: # finish when end of test set reached
             break
-        e = model_decoding(mb[reader.streams.features])
-        outputs = format_sequences(e, i2w)
+        if beam_width > 1:
+            sources = [np.argmax(s, axis=-1) for s in sparse_to_dense(mb[reader.streams.features])]
+            hypotheses, _ = model_decoding.decode(sources)
+            outputs = [" ".join([i2w[w] for w in h]) for h in hypotheses]
+        else:
+            e = model_decoding(mb[reader.streams.features])
+            outputs = format_sequences(e, i2w)
         labels  = format_sequences(sparse_to_dense(mb[reader.streams.labels]), i2w)
         # prepend sentence start for comparison
         outputs = ["<s> " + output for output in outputs]
@@ -304,6 +325,10 @@ def evaluate_decoding(reader, s2smodel, i2w):
 
     rate = num_wrong / num_total
     print("string error rate of {:.1f}% in {} samples".format(100 * rate, num_total))
+    if beam_width > 1:
+        summary = model_decoding.throughput_summary()
+        print("beam search decoded {:.1f} tokens/sec ({:.1f} tokens/sec over all hypotheses)".format(
+            summary['tokens_per_second'], summary['beam_tokens_per_second']))
     return rate
 
 #######################
@@ -372,6 +397,10 @@ def translate(tokens, model_decoding, vocab, i2w, show_attention=False, max_labe
         print('Input contains an unexpected token.')
         return []
 
+    if isinstance(model_decoding, BeamSearchDecoder):
+        hypotheses, _ = model_decoding.decode([w])
+        return [i2w[i] for i in hypotheses[0]]
+
     # convert to one_hot
     query = Value.one_hot([w], len(vdict), sparse_output=True)
     pred = model_decoding(query)
@@ -410,9 +439,12 @@ def translate(tokens, model_decoding, vocab, i2w, show_attention=False, max_labe
 
     return translation
 
-def interactive_session(s2smodel, vocab, i2w, show_attention=False):
+def interactive_session(s2smodel, vocab, i2w, show_attention=False, beam_width=1):
 
-    model_decoding = create_model_greedy(s2smodel) # wrap the greedy decoder around the model
+    if beam_width > 1:
+        model_decoding = create_model_beam_search(s2smodel, beam_width)
+    else:
+        model_decoding = create_model_greedy(s2smodel) # wrap the greedy decoder around the model
 
     import sys
 
@@ -490,6 +522,10 @@ if __name__ == '__main__':
     test_reader = create_reader(os.path.join(DATA_DIR, TESTING_DATA), False)
     evaluate_decoding(test_reader, model, i2w)
 
+    # same with beam search decoding
+    test_reader = create_reader(os.path.join(DATA_DIR, TESTING_DATA), False)
+    evaluate_decoding(test_reader, model, i2w, beam_width=5)
+
     # test same metric same as in training on test set
     test_reader = create_reader(os.path.join(DATA_DIR, TESTING_DATA), False)
     evaluate_metric(test_reader, model)
@@ -16,6 +16,7 @@ from cntk.metrics import classification_error
 from cntk.ops.functions import load_model
 from cntk.layers import LSTM, Stabilizer, Recurrence, Dense, For, Sequential
 from cntk.logging import log_number_of_parameters, ProgressPrinter
+from cntk.utils import DecodingSession
 
 # model hyperparameters
 hidden_dim = 256
@@ -48,7 +49,7 @@ def sample(root, ix_to_char, vocab_dim, char_to_ix, prime_text='', use_hardmax=T
 
     def sample_word(p):
         if use_hardmax:
-            w = np.argmax(p, axis=2)[0,0]
+            w = np.argmax(p)
         else:
             # normalize probabilities then take weighted sample
             p = np.exp(p) / np.sum(np.exp(p))            
@@ -60,44 +61,38 @@ def sample(root, ix_to_char, vocab_dim, char_to_ix, prime_text='', use_hardmax=T
     prime = -1
 
     # start sequence with first input    
-    x = np.zeros((1, vocab_dim), dtype=np.float32)    
     if prime_text != '':
         plen = len(prime_text)
         prime = char_to_ix[prime_text[0]]
     else:
         prime = np.random.choice(range(vocab_dim))
-    x[0, prime] = 1
-    arguments = ([x], [True])
+
+    # the session keeps the state of the recurrences between characters, so
+    # that each character only runs one step of the network
+    session = DecodingSession(root)
 
     # setup a list for the output characters and add the initial prime text
     output = []
     output.append(prime)
+    idx = prime
     
     # loop through prime text
     for i in range(plen):            
-        p = root.eval(arguments)        
+        p = session.step([idx])
         
-        # reset
-        x = np.zeros((1, vocab_dim), dtype=np.float32)
         if i < plen-1:
             idx = char_to_ix[prime_text[i+1]]
         else:
             idx = sample_word(p)
 
         output.append(idx)
-        x[0, idx] = 1            
-        arguments = ([x], [False])
     
     # loop through length of generated text, sampling along the way
     for i in range(length-plen):
-        p = root.eval(arguments)
+        p = session.step([idx])
         idx = sample_word(p)
         output.append(idx)
 
-        x = np.zeros((1, vocab_dim), dtype=np.float32)
-        x[0, idx] = 1
-        arguments = ([x], [False])
-
     # return output
     return ''.join([ix_to_char[c] for c in output])
 
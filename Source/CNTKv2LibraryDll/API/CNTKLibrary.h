@@ -2082,6 +2082,9 @@ private:
         CNTK_API void RecordValueUpdate();
 
     private:
+#ifdef SWIGPYTHON
+    public:
+#endif
         explicit Parameter(const NDArrayViewPtr& value, const std::wstring& name, const std::wstring& uid)
             : Variable(value->Shape(), VariableKind::Parameter, value->GetDataType(), value, true, {}, name, uid)
         {
@@ -2179,10 +2182,14 @@ private:
         CNTK_API void SetValue(const NDArrayViewPtr& value);
 
     private:
+#ifdef SWIGPYTHON
+    public:
+#endif
         Constant(const NDArrayViewPtr& value, const std::wstring& name, const std::wstring& uid)
             : Variable(value->Shape(), VariableKind::Constant, value->GetDataType(), value, false, {}, name, uid)
         {}
 
+    private:
         ///
         /// Construct a constant of specified shape whose contents are initialized using the specified initializer
         ///
@@ -4866,6 +4873,12 @@ namespace CNTK
         ///
         size_t PreviousMinibatchSampleCount() const { return m_prevMinibatchNumSamples; }
 
+        ///
+        /// Returns the time in seconds the last minibatch spent in the parameter learners' update,
+        /// including the aggregation of gradients across workers in distributed training.
+        ///
+        double PreviousMinibatchUpdateTime() const { return m_prevMinibatchUpdateTime; }
+
         ///
         /// Learners associated with this Trainer for updating the model's parameters using computed gradients.
         ///
@@ -4919,6 +4932,7 @@ namespace CNTK
         ValuePtr    m_rootGradientValue;
 
         size_t   m_prevMinibatchNumSamples;
+        double   m_prevMinibatchUpdateTime;
         ValuePtr m_prevMinibatchAggregateTrainingLossValue;
         ValuePtr m_prevMinibatchAggregateEvalCriterionValue;
 
@@ -10,6 +10,7 @@
 #include "PerformanceProfiler.h"
 #include "CompositeFunction.h"
 #include "Serialization.h"
+#include <chrono>
 
 namespace
 {
@@ -41,6 +42,7 @@ namespace CNTK
           m_lossFunction(lossFunction),
           m_parameterLearners(std::make_shared<Learners>(parameterLearners)),
           m_prevMinibatchNumSamples(0),
+          m_prevMinibatchUpdateTime(0),
           m_distributed(false),
           m_aggregatedTrainingLossValue(std::make_shared<Accumulator>()),
           m_aggregatedTrainingEvalCriterionValue(),
@@ -197,6 +199,7 @@ namespace CNTK
         if (emptyMinibatch) // Nothing to train with.
         {
             m_prevMinibatchNumSamples = 0;
+            m_prevMinibatchUpdateTime = 0;
             return false;
         }
 
@@ -208,7 +211,11 @@ namespace CNTK
         std::unordered_map<Parameter, NDArrayViewPtr> gradients;
         for (const auto& parameter : m_learnerParameters)
             gradients[parameter] = parameterGradients[parameter]->Data();
-        return m_parameterLearners->Update(gradients, m_prevMinibatchNumSamples, sweepEnd);
+
+        auto updateStart = std::chrono::high_resolution_clock::now();
+        bool updated = m_parameterLearners->Update(gradients, m_prevMinibatchNumSamples, sweepEnd);
+        m_prevMinibatchUpdateTime = std::chrono::duration<double>(std::chrono::high_resolution_clock::now() - updateStart).count();
+        return updated;
     }
 
     bool Trainer::TrainDistributedMinibatch(const std::unordered_map<Variable, ValuePtr>& arguments, std::unordered_map<Variable, ValuePtr>& outputsToFetch, bool sweepEnd, const DeviceDescriptor& computeDevice /*= DeviceDescriptor::UseDefaultDevice()*/)
@@ -241,7 +248,9 @@ namespace CNTK
         auto prevTotalNumSamples = TotalNumberOfSamplesSeen();
 
         MinibatchInfo info{ arguments.empty(), sweepEnd, m_prevMinibatchNumSamples, trainingLoss, evalCriterion };
+        auto updateStart = std::chrono::high_resolution_clock::now();
         bool updated = m_parameterLearners->Update(gradients, info);
+        m_prevMinibatchUpdateTime = std::chrono::duration<double>(std::chrono::high_resolution_clock::now() - updateStart).count();
         m_prevMinibatchNumSamples = info.numberOfSamples;
 
         // Update internal state.
@@ -231,6 +231,8 @@ namespace CNTK
     // TODO: Possibly expose a limiting counter on the number of samples for validation.
     bool TrainingSession::CrossValidate(size_t currentIndex, const DeviceDescriptor& computeDevice)
     {
+        OnCrossValidationStart(currentIndex);
+
         if (m_cv.m_source) // Running cross validation
         {
             std::unordered_map<Variable, ValuePtr> minibatch;
@@ -0,0 +1,39 @@
+# ==============================================================================
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+import os
+import sys
+import platform
+import pytest
+from functools import partial
+from cntk.ops.tests.ops_test_utils import cntk_device
+from cntk.device import try_set_default_device
+
+
+def test_multi_actor_deep_q_network(device_id):
+    if platform.system() != 'Linux':
+        pytest.skip('test only runs on Linux')
+    if sys.version_info[0] < 3:
+        pytest.skip('test requires Python 3 (multiprocessing spawn context)')
+
+    try_set_default_device(cntk_device(device_id))
+
+    abs_path = os.path.dirname(os.path.abspath(__file__))
+    sys.path.append(abs_path)
+    sys.path.append(os.path.join(abs_path, "..", "..", "..", "..", "Examples", "ReinforcementLearning"))
+
+    from MultiActorDeepQNetwork import DummyEnvironment, train_multi_actor
+
+    nb_actors = 2
+    env_factory = partial(DummyEnvironment, nb_actions=4, episode_length=50)
+
+    agent = train_multi_actor(env_factory, (4, 84, 84), 4, nb_actors=nb_actors, nb_updates=20,
+                              memory_size=1000, train_after=200, target_update_interval=10,
+                              publish_interval=5, sync_interval=20, push_interval=10, explorer_steps=100)
+
+    assert len(agent.memory) >= 200
+    for actor in range(nb_actors):
+        assert len(agent.memory[actor]) > 0
@@ -620,10 +620,11 @@ public:
 %feature("nodirector") CNTK::Learner::ResetLearningRate;
 
 %feature("director") CNTK::TrainingSession;
-%feature("nodirector") CNTK::TrainingSession::OnMinibatchStart;
-%feature("nodirector") CNTK::TrainingSession::OnCheckpointStart;
 %feature("nodirector") CNTK::TrainingSession::GetMinibatchSize;
 
+// Only the session used for minibatch size tuning asks Python for the size of every minibatch.
+%feature("director") CNTK::TunableTrainingSession;
+
 %feature("director") CNTK::ProgressWriter;
 %ignore CNTK::ProgressWriter::UpdateTraining;
 %ignore CNTK::ProgressWriter::UpdateTest;
@@ -1436,6 +1437,42 @@ std::unordered_map<CNTK::StreamInformation, std::pair<CNTK::NDArrayViewPtr, CNTK
 
 %shared_ptr(CNTK::SwigMinibatchSource)
 
+// Support for choosing the minibatch size from Python
+%shared_ptr(CNTK::TunableTrainingSession)
+
+%inline %{
+namespace CNTK
+{
+    //
+    // TrainingSession whose GetMinibatchSize can be overridden in Python.
+    // It is a separate class so that a plain TrainingSession does not call
+    // into Python for every minibatch.
+    //
+    class TunableTrainingSession : public CNTK::TrainingSession
+    {
+    public:
+        TunableTrainingSession(
+            const TrainerPtr& trainer,
+            const MinibatchSourcePtr& trainingSource,
+            const MinibatchSizeSchedule& minibatchSizeSchedule,
+            const std::unordered_map<Variable, StreamInformation>& inputVarToStream,
+            size_t maxNumTrainingSamples,
+            size_t progressFrequency,
+            const CheckpointConfig& checkpointing,
+            const CrossValidationConfig& crossValidation,
+            const TestConfig& test)
+            : TrainingSession(trainer, trainingSource, minibatchSizeSchedule, inputVarToStream,
+                              maxNumTrainingSamples, progressFrequency, checkpointing, crossValidation, test)
+        {}
+
+        size_t GetMinibatchSize() override
+        {
+            return TrainingSession::GetMinibatchSize();
+        }
+    };
+}
+%}
+
 
 %inline %{
 namespace CNTK
@@ -1562,6 +1599,62 @@ namespace CNTK
 // FIXME ignore is ignored
 %ignore CNTK::NDMask::DataBuffer();
 %extend CNTK::NDMask {
+    //
+    // Creates a mask from an int8 NumPy array of shape (#sequences, #steps)
+    // holding MaskKind values, i.e. the inverse of to_ndarray().
+    //
+    NDMask(PyObject* numpyArrayObject, const CNTK::DeviceDescriptor& device)
+    {
+        if (!PyArray_Check((PyArrayObject*)numpyArrayObject))
+            throw std::logic_error("NumPy array expected");
+
+        PyArrayObject* array = (PyArrayObject*)numpyArrayObject;
+        if (PyArray_NDIM(array) != 2)
+            throw std::invalid_argument("mask requires exactly two dimensions");
+
+        if (PyArray_TYPE(array) != NPY_BYTE || !PyArray_IS_C_CONTIGUOUS(array))
+            throw std::invalid_argument("mask must be a C contiguous NumPy array of type int8");
+
+        npy_intp* np_shape = PyArray_SHAPE(array);
+        size_t numSequences = static_cast<size_t>(np_shape[0]);
+        size_t numSteps = static_cast<size_t>(np_shape[1]);
+        NDShape shape({ numSteps, numSequences });
+        const char* kinds = static_cast<const char*>(PyArray_DATA(array));
+
+        // A new mask is all valid; mark the other runs of each sequence
+        std::unique_ptr<NDMask> mask(new NDMask(shape, DeviceDescriptor::CPUDevice()));
+        for (size_t s = 0; s < numSequences; s++)
+        {
+            const char* row = kinds + s * numSteps;
+            size_t t = 0;
+            while (t < numSteps)
+            {
+                size_t end = t + 1;
+                while (end < numSteps && row[end] == row[t])
+                    end++;
+
+                MaskKind kind = static_cast<MaskKind>(row[t]);
+                if (kind == MaskKind::Invalid)
+                    mask->InvalidateSection({ t, s }, NDShape({ end - t, 1 }));
+                else if (kind == MaskKind::SequenceBegin)
+                    mask->MarkSequenceBegin({ t, s }, NDShape({ end - t, 1 }));
+                else if (kind != MaskKind::Valid)
+                    throw std::invalid_argument("mask values must be 0 (invalid), 1 (valid) or 2 (sequence begin)");
+
+                t = end;
+            }
+        }
+
+        if (device != DeviceDescriptor::CPUDevice())
+        {
+            std::unique_ptr<NDMask> deviceMask(new NDMask(shape, device));
+            deviceMask->CopyFrom(*mask);
+            mask = std::move(deviceMask);
+        }
+
+        return mask.release();
+    }
+
     PyObject* to_ndarray() {
         std::vector<size_t> cntk_dims = (*self).Shape().Dimensions();
         static_assert(cntk_dims.size()==2, "mask requires exactly two dimensions");
@@ -1759,6 +1852,76 @@ namespace CNTK
         PyObject *NDArrayViewToNumPy(const CNTK::NDArrayView*);
         return NDArrayViewToNumPy(self);
     }
+
+    //
+    // Returns a NumPy array that refers to the data buffer of this dense CPU
+    // NDArrayView instead of copying it. The array keeps the NDArrayView
+    // alive through its base object.
+    //
+    PyObject* to_ndarray_view(bool readOnly) {
+        if ((*self).GetStorageFormat() != StorageFormat::Dense)
+            throw std::invalid_argument("only dense NDArrayView objects can be viewed without copying");
+
+        if ((*self).Device() != DeviceDescriptor::CPUDevice())
+            throw std::invalid_argument("only NDArrayView objects on the CPU can be viewed without copying");
+
+        if (!readOnly && (*self).IsReadOnly())
+            throw std::invalid_argument("cannot create a writable view of a read-only NDArrayView");
+
+        // CNTK uses column major, thus we reverse the shape
+        std::vector<size_t> dimensions_cntk = (*self).Shape().Dimensions();
+        std::vector<npy_intp> dimensions(dimensions_cntk.rbegin(), dimensions_cntk.rend());
+
+        int numpy_type;
+        void* buffer;
+        CNTK::DataType cntk_type = (*self).GetDataType();
+        if (cntk_type == CNTK::DataType::Float)
+        {
+            numpy_type = NPY_FLOAT;
+            buffer = readOnly ? (void*)(*self).DataBuffer<float>() : (void*)(*self).WritableDataBuffer<float>();
+        }
+        else if (cntk_type == CNTK::DataType::Double)
+        {
+            numpy_type = NPY_DOUBLE;
+            buffer = readOnly ? (void*)(*self).DataBuffer<double>() : (void*)(*self).WritableDataBuffer<double>();
+        }
+        else
+        {
+            throw std::invalid_argument("unknown CNTK data type");
+        }
+
+        PyObject* ndarray = PyArray_SimpleNewFromData(static_cast<int>(dimensions.size()),
+            dimensions.empty() ? nullptr : &dimensions[0], numpy_type, buffer);
+        if (ndarray == nullptr)
+            return nullptr;
+
+        struct OwnerCapsule
+        {
+            static void Release(PyObject* capsule)
+            {
+                delete static_cast<CNTK::NDArrayViewPtr*>(PyCapsule_GetPointer(capsule, "CNTK::NDArrayViewPtr"));
+            }
+        };
+
+        PyObject* owner = PyCapsule_New(new CNTK::NDArrayViewPtr((*self).shared_from_this()), "CNTK::NDArrayViewPtr", OwnerCapsule::Release);
+        if (owner == nullptr)
+        {
+            Py_DECREF(ndarray);
+            return nullptr;
+        }
+
+        // steals the reference to owner
+        if (PyArray_SetBaseObject((PyArrayObject*)ndarray, owner) < 0)
+        {
+            Py_DECREF(ndarray);
+            return nullptr;
+        }
+
+        if (readOnly)
+            PyArray_CLEARFLAGS((PyArrayObject*)ndarray, NPY_ARRAY_WRITEABLE);
+
+        return ndarray;
+    }
 }
 
 // end of NDArrayView
@@ -5,6 +5,7 @@
 
 import warnings
 import numbers
+import collections
 import numpy as np
 from scipy import sparse
 
@@ -201,6 +202,27 @@ class NDArrayView(cntk_py.NDArrayView):
                 list(reversed(extent)),
                 read_only)
 
+    def as_array_view(self, read_only=True):
+        '''
+        Returns a NumPy array that shares its memory with this instance
+        instead of copying it like :meth:`asarray` does. The array keeps this
+        instance alive. Only dense data on the CPU can be viewed.
+
+        Example:
+            >>> nd = NDArrayView.from_dense(np.zeros((2, 3), dtype=np.float32), device=C.cpu())
+            >>> view = nd.as_array_view(read_only=False)
+            >>> view[0, 1] = 5
+            >>> print(nd.asarray()[0])
+            [ 0.  5.  0.]
+
+        Args:
+          read_only (bool): whether the returned array can be written to
+
+        Returns:
+            numpy.ndarray: view on the data of this instance
+        '''
+        return super(NDArrayView, self).to_ndarray_view(read_only)
+
     @property
     @typemap
     def device(self):
@@ -613,6 +635,96 @@ class Value(cntk_py.Value):
         return data_type_to_dtype(self.get_data_type())
 
 
+class PaddedSequences(collections.namedtuple('PaddedSequences', ['data', 'mask'])):
+    '''
+    A batch of sequences padded to the length of the longest sequence. This
+    is how a :class:`~cntk.ops.functions.UserFunction` created with
+    ``padded_sequences=True`` sees sequence data.
+
+    Attributes:
+        data (numpy.ndarray): array of shape ``(#sequences, max length) +
+         sample shape``. The values at padded positions are undefined.
+        mask (numpy.ndarray): ``np.int8`` array of shape ``(#sequences, max
+         length)`` with the encoding of :attr:`Value.mask`
+    '''
+    __slots__ = ()
+
+    @staticmethod
+    def from_lengths(data, lengths):
+        '''
+        Creates a batch of new sequences from padded ``data`` and the number
+        of valid steps of every sequence.
+
+        Example:
+            >>> p = PaddedSequences.from_lengths(np.zeros((2, 3, 4)), [3, 1])
+            >>> print(p.mask)
+            [[2 1 1]
+             [2 0 0]]
+
+        Args:
+            data (numpy.ndarray): padded data of shape ``(#sequences, max
+             length) + sample shape``
+            lengths (list or numpy.ndarray): length of every sequence
+
+        Returns:
+            :class:`PaddedSequences`
+        '''
+        lengths = np.asarray(lengths)
+        if lengths.shape != data.shape[:1]:
+            raise ValueError('expected %d sequence lengths, got %d'
+                             % (data.shape[0], lengths.size))
+
+        mask = (np.arange(data.shape[1]) < lengths[:, np.newaxis]).astype(np.int8)
+        mask[lengths > 0, 0] = cntk_py.MaskKind_SequenceBegin
+        return PaddedSequences(data, mask)
+
+    @property
+    def lengths(self):
+        '''
+        Number of valid steps of every sequence.
+        '''
+        return (self.mask != cntk_py.MaskKind_Invalid).sum(axis=1)
+
+
+def _value_as_padded_sequences(value, zero_copy=False):
+    '''
+    Converts a dense Value with a sequence axis to :class:`PaddedSequences`.
+    If ``zero_copy`` is `True`, data on the CPU is returned as read-only view.
+    '''
+    data = cntk_py.Value.data(value)
+    if zero_copy and data.device().type() == cntk_py.DeviceKind_CPU:
+        array = data.to_ndarray_view(True)
+    else:
+        array = data.to_ndarray()
+
+    mask = cntk_py.Value.mask(value)
+    if mask is None:
+        # every sequence starts in this minibatch and has the maximum length
+        mask = np.ones(array.shape[:2], dtype=np.int8)
+        mask[:, 0] = cntk_py.MaskKind_SequenceBegin
+    else:
+        mask = mask.to_ndarray()
+
+    return PaddedSequences(array, mask)
+
+
+def _padded_sequences_as_value(variable, sequences, device):
+    '''
+    Converts :class:`PaddedSequences` holding the data of ``variable`` to a
+    Value on ``device``.
+    '''
+    data, mask = sequences
+    data = np.ascontiguousarray(data, dtype=variable.dtype)
+    mask = np.ascontiguousarray(mask, dtype=np.int8)
+
+    if data.shape[:2] != mask.shape:
+        raise ValueError('padded data of shape %s does not match the mask '
+                         'of shape %s' % (data.shape, mask.shape))
+
+    ndav = NDArrayView.from_dense(data, device)
+    return cntk_py.Value(ndav, cntk_py.NDMask(mask, device))
+
+
 def user_function(user_func):
     '''
     Wraps the passed Function to create a composite representing the
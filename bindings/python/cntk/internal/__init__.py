@@ -23,8 +23,74 @@ def _value_as_sequence_or_array(val, var):
         map_if_possible(val)
         return val.asarray()
 
+def _is_cpu(device):
+    from cntk import cntk_py
+    return device.type() == cntk_py.DeviceKind_CPU
+
+def _can_view_without_copy(var):
+    '''
+    Whether the values of ``var`` can be exchanged with NumPy without copying,
+    which requires a dense variable of known shape with only a batch axis.
+    '''
+    return len(var.dynamic_axes) == 1 and not var.is_sparse and \
+        all(dim >= 0 for dim in var.shape)
+
+def _value_as_array_view(val, var):
+    '''
+    Returns a read-only NumPy view on the data of ``val`` if it can be
+    viewed without copying, otherwise a copy as returned by
+    :func:`_value_as_sequence_or_array`.
+    '''
+    from cntk import cntk_py
+    if _can_view_without_copy(var) and not cntk_py.Value.is_sparse(val) and \
+            cntk_py.Value.mask(val) is None:
+        data = cntk_py.Value.data(val)
+        if _is_cpu(data.device()):
+            return data.to_ndarray_view(True)
+
+    return _value_as_sequence_or_array(val, var)
+
+def _allocate_array_view(var, batch_size, dtype=None):
+    '''
+    Allocates an uninitialized CPU NDArrayView for ``batch_size`` samples of
+    ``var``. Returns it together with a writable NumPy view on its data.
+    '''
+    from cntk import cntk_py
+    from cntk.device import cpu
+    if dtype is None:
+        dtype = var.dtype
+    ndav = cntk_py.NDArrayView(sanitize_dtype_cntk(dtype),
+                               cntk_py.StorageFormat_Dense,
+                               (batch_size,) + var.shape, cpu())
+    return ndav, ndav.to_ndarray_view(False)
+
 _serialization_version = 1
 
+# factories resolved from (module, class) during deserialization
+_udf_factories = {}
+
+def _resolve_udf_factory(module, cls):
+    '''
+    Returns the static ``deserialize`` method of the user function class
+    ``cls`` defined in ``module``, or ``None`` if the class does not have
+    one. The result is cached, so that loading a model imports every user
+    function class only once, regardless of how many nodes it has.
+    '''
+    key = (module, cls)
+    try:
+        return _udf_factories[key]
+    except KeyError:
+        pass
+
+    import importlib
+    udf_class = getattr(importlib.import_module(module), cls, None)
+    if udf_class is None:
+        raise ImportError('cannot import name {} from {}'.format(cls, module))
+
+    factory = getattr(udf_class, 'deserialize', None)
+    _udf_factories[key] = factory
+    return factory
+
 def _serialize(udf):
     dictionary = {}
     dictionary['class'] = udf.__class__.__name__
@@ -45,14 +111,11 @@ class _UDFDeserializeCallbackWrapper(cntk_py.UDFDeserializeCallbackWrapper):
         module = dictionary['module']
         state = dictionary['state']
         op_name = dictionary['op_name']
-        deserialize_method = 'deserialize'
 
         if (self.factory_callback_map and op_name in self.factory_callback_map):
             factory = self.factory_callback_map[op_name]
         else:
-            exec("from {} import {}".format(module, cls))
-            eval_str = "{0}.{1} if hasattr({0}, '{1}') else None"
-            factory = eval(eval_str.format(cls, deserialize_method))
+            factory = _resolve_udf_factory(module, cls)
 
         if factory:
             return factory(list(inputs), name, state)
@@ -0,0 +1,198 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+'''
+A model container that stores the parameters and constants of a model as
+aligned raw blobs next to the serialized graph, so that loading can
+memory-map them instead of parsing and copying them.
+
+Layout of the file::
+
+    magic (8 bytes) | header size (uint64, little endian) | JSON header |
+    graph (protobuf) | blob | blob | ...
+
+The graph is the model with every parameter and constant replaced by a
+placeholder. The header maps the uid of every placeholder to the offset
+(relative to the start of the graph), shape and data type of its blob. The
+graph and every blob start at a multiple of ``_ALIGNMENT`` bytes.
+'''
+
+import os
+import json
+import struct
+import tempfile
+import threading
+import numpy as np
+
+from .. import cntk_py
+from .swig_helper import map_if_possible
+
+_MAGIC = b'CNTKMMAP'
+_VERSION = 1
+_ALIGNMENT = 64
+_HEADER_START = len(_MAGIC) + 8
+
+# The parameters and constants of the loaded models point into their mappings
+# without holding a reference to them, and so does any graph that is built
+# from a loaded model. The mappings therefore stay open for the lifetime of
+# the process.
+_mappings = []
+_mappings_lock = threading.Lock()
+
+
+def _align(offset):
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def is_mapped_model(filename):
+    '''
+    Whether ``filename`` is a model saved by :func:`save_mapped_model`.
+    '''
+    try:
+        with open(filename, 'rb') as f:
+            return f.read(len(_MAGIC)) == _MAGIC
+    except (IOError, OSError):
+        return False
+
+
+def _graph_bytes(function):
+    fd, graph_file = tempfile.mkstemp(suffix='.model')
+    os.close(fd)
+    try:
+        function.save(graph_file)
+        with open(graph_file, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(graph_file)
+
+
+def save_mapped_model(function, filename):
+    '''
+    Saves ``function`` in the memory-mappable container format.
+
+    Args:
+        function (:class:`~cntk.ops.functions.Function`): the model to save
+        filename (str): model path
+    '''
+    from cntk.ops import placeholder
+    from cntk.ops.functions import CloneMethod
+
+    variables = list(function.parameters) + list(function.constants)
+    substitutions = {}
+    entries = []
+    for var in variables:
+        if any(dim < 0 for dim in var.shape):
+            raise ValueError('%s has an inferred shape and cannot be saved' % var)
+
+        ph = placeholder(shape=var.shape, dynamic_axes=[], name=var.name)
+        substitutions[var] = ph
+        entries.append({'uid': ph.uid, 'name': var.name, 'variable_uid': var.uid,
+                        'kind': 'parameter' if var.is_parameter else 'constant',
+                        'dtype': np.dtype(var.dtype).name,
+                        'shape': list(var.shape)})
+
+    graph = _graph_bytes(function.clone(CloneMethod.share, substitutions))
+
+    # blob offsets are relative to the aligned start of the graph
+    offset = _align(len(graph))
+    for entry in entries:
+        entry['offset'] = offset
+        size = int(np.prod(entry['shape'])) * np.dtype(entry['dtype']).itemsize
+        offset = _align(offset + size)
+
+    header = {'version': _VERSION, 'graph_size': len(graph), 'variables': entries}
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _align(_HEADER_START + len(header_bytes))
+
+    # Write to a temporary file first, since truncating a file that is
+    # mapped by a loaded model would invalidate its memory.
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        f.write(_MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b'\0' * (data_start - f.tell()))
+        f.write(graph)
+
+        for var, entry in zip(variables, entries):
+            f.write(b'\0' * (data_start + entry['offset'] - f.tell()))
+            value = np.ascontiguousarray(var.value, dtype=entry['dtype'])
+            value.tofile(f)
+
+    try:
+        os.rename(temp_filename, filename)
+    except OSError:
+        # Windows does not replace existing files
+        os.remove(filename)
+        os.rename(temp_filename, filename)
+
+
+def load_mapped_model(filename, device):
+    '''
+    Loads a model saved by :func:`save_mapped_model`. On the CPU the
+    parameters and constants borrow the memory of a copy-on-write mapping
+    of the file, so that all loads of the same model share its unmodified
+    pages. On other devices the values are copied from the mapping. The
+    parameters and constants keep the uids they were saved with.
+
+    Since any graph built from the model may use its memory, the mapping
+    stays open for the lifetime of the process.
+
+    Args:
+        filename (str): model path
+        device (:class:`~cntk.device.DeviceDescriptor`): device to load the
+         model on
+
+    Returns:
+        :class:`~cntk.ops.functions.Function`: the loaded model
+    '''
+    # Every load gets its own copy-on-write mapping, so that updating the
+    # parameters of one model does not affect other models loaded from the
+    # same file. Pages are shared through the page cache until written.
+    mapping = np.memmap(filename, dtype=np.uint8, mode='c')
+    if mapping[:len(_MAGIC)].tobytes() != _MAGIC:
+        raise ValueError('%s is not a memory-mapped model' % filename)
+
+    header_size = struct.unpack('<Q', mapping[len(_MAGIC):_HEADER_START].tobytes())[0]
+    header = json.loads(mapping[_HEADER_START:_HEADER_START + header_size].tobytes().decode('utf-8'))
+    if header['version'] > _VERSION:
+        raise ValueError('unsupported memory-mapped model version %s' % header['version'])
+
+    data_start = _align(_HEADER_START + header_size)
+    graph = mapping[data_start:data_start + header['graph_size']].tobytes()
+    model = cntk_py.Function.load_from_buffer(graph, device)
+    map_if_possible(model)
+
+    borrow = device.type() == cntk_py.DeviceKind_CPU
+    entries = dict((entry['uid'], entry) for entry in header['variables'])
+    substitutions = {}
+    for ph in model.placeholders:
+        entry = entries.get(ph.uid)
+        if entry is None:
+            raise ValueError('the model contains an unknown placeholder %s' % ph)
+
+        dtype = np.dtype(entry['dtype'])
+        shape = tuple(entry['shape'])
+        size = int(np.prod(shape)) * dtype.itemsize
+        offset = data_start + entry['offset']
+        data = mapping[offset:offset + size].view(dtype).reshape(shape)
+
+        # Constants are writable as well, since some of them, such as the
+        # running statistics of batch normalization, are updated in training.
+        value = cntk_py.NDArrayView(data, device, False, borrow)
+        if entry['kind'] == 'constant':
+            var = cntk_py.Constant(value, entry['name'], entry['variable_uid'])
+        else:
+            var = cntk_py.Parameter(value, entry['name'], entry['variable_uid'])
+        map_if_possible(var)
+        substitutions[ph] = var
+
+    if borrow:
+        with _mappings_lock:
+            _mappings.append(mapping)
+
+    if substitutions:
+        model.replace_placeholders(substitutions)
+    return model
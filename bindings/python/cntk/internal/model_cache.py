@@ -0,0 +1,113 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+'''
+A process-wide least-recently-used cache of loaded models, so that repeated
+loads of the same model file clone an already deserialized graph instead of
+parsing the file and reconstructing its user functions again.
+'''
+
+import os
+import threading
+from collections import OrderedDict
+
+from .swig_helper import map_if_possible
+
+
+class ModelCache(object):
+    '''
+    Least-recently-used cache of loaded models keyed by the absolute path,
+    modification time and size of the model file and the device the model
+    was loaded on, so that a file that changed on disk is loaded again.
+
+    The cached models are never handed out. Callers get clones of them,
+    created with the requested :class:`~cntk.ops.functions.CloneMethod`.
+
+    Args:
+        capacity (int): maximum number of cached models. 0 disables the cache.
+    '''
+
+    def __init__(self, capacity=8):
+        if capacity < 0:
+            raise ValueError('capacity must be non-negative')
+        self._capacity = capacity
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self):
+        '''
+        Maximum number of cached models.
+        '''
+        return self._capacity
+
+    @capacity.setter
+    def capacity(self, capacity):
+        if capacity < 0:
+            raise ValueError('capacity must be non-negative')
+        with self._lock:
+            self._capacity = capacity
+            self._evict()
+
+    def __len__(self):
+        return len(self._models)
+
+    def clear(self):
+        '''
+        Removes all models from the cache.
+        '''
+        with self._lock:
+            self._models.clear()
+
+    def _evict(self):
+        while len(self._models) > self._capacity:
+            self._models.popitem(last=False)
+
+    @staticmethod
+    def _key(filename, device):
+        stat = os.stat(filename)
+        return (os.path.abspath(filename), stat.st_mtime, stat.st_size,
+                device.type(), device.id())
+
+    def load(self, filename, device, loader, method):
+        '''
+        Returns a clone of the model in ``filename``, loading it with
+        ``loader`` if it is not cached yet.
+
+        Args:
+            filename (str): model path
+            device (:class:`~cntk.device.DeviceDescriptor`): device to load
+             the model on
+            loader (callable): called with ``filename`` and ``device`` to
+             load the model on a cache miss
+            method (:class:`~cntk.ops.functions.CloneMethod`): how the
+             returned clone treats the parameters of the cached model
+
+        Returns:
+            :class:`~cntk.ops.functions.Function`: a clone of the cached model
+        '''
+        key = self._key(filename, device)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                # move to the most recently used end
+                del self._models[key]
+                self._models[key] = model
+
+        if model is None:
+            # loading happens outside of the lock, so that loads of different
+            # models do not wait for each other
+            model = loader(filename, device)
+            map_if_possible(model)
+            with self._lock:
+                # a concurrent load of the same file may have won the race
+                model = self._models.pop(key, model)
+                self._models[key] = model
+                self._evict()
+
+        return model.clone(method)
+
+
+model_cache = ModelCache()
@@ -9,3 +9,4 @@ Layers and building blocks that are not generic but represent more specific mode
 '''
 
 from .attention import *
+from .beam_search import *
@@ -0,0 +1,339 @@
+# ==============================================================================
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+'''
+Beam search decoder for sequence-to-sequence models.
+'''
+
+from __future__ import division
+import time
+import numpy as np
+import cntk as C
+
+
+def _is_sequence(var):
+    return len(var.dynamic_axes) > 1
+
+
+def _static_value(var):
+    # value of a constant or learnable initial state, None if it is computed from data
+    if var.is_constant:
+        return var.as_constant().value
+    if var.is_parameter:
+        return var.as_parameter().value
+    return None
+
+
+def _unique(variables):
+    uids = set()
+    unique = []
+    for var in variables:
+        if var.uid not in uids:
+            uids.add(var.uid)
+            unique.append(var)
+    return unique
+
+
+def _log_softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    return z - np.log(np.exp(z).sum(axis=1, keepdims=True))
+
+
+class BeamSearchDecoder(object):
+    '''
+    BeamSearchDecoder(decoder, history, encoder_outputs, sentence_start_index, sentence_end_index, beam_width=5, length_increase=1, max_length=None, device=None)
+
+    Beam search decoder for a sequence-to-sequence model, as an alternative to
+    the greedy decoding of :func:`~cntk.layers.sequence.UnfoldFrom`.
+
+    The encoder is evaluated once per input sequence, and its outputs are
+    shared by all hypotheses of the sequence. The decoder is then run one step
+    at a time: the delays that feed the state of its recurrences back to the
+    next step are replaced by inputs, so that every step of all hypotheses of
+    all sequences is a single ``forward``. The hypotheses are pruned to the
+    ``beam_width`` best ones of each sequence with a vectorized top-k over the
+    scores of all their continuations.
+
+    Example:
+     >>> from cntk.layers import *
+     >>> src = C.sequence.input_variable(5, sequence_axis=C.Axis('src'))
+     >>> tgt = C.sequence.input_variable(6, sequence_axis=C.Axis('tgt'))
+     >>> h0 = Fold(GRU(4))(src)
+     >>> decoder = Dense(6)(RecurrenceFrom(GRU(4))(h0, tgt))
+     >>> beam_search = BeamSearchDecoder(decoder, tgt, [h0], sentence_start_index=0, sentence_end_index=1,
+     ...                                 beam_width=3, max_length=4)
+     >>> hypotheses, scores = beam_search.decode([[2, 3, 4], [4, 2]])
+     >>> len(hypotheses)
+     2
+     >>> all(0 < len(h) <= 4 for h in hypotheses)
+     True
+
+    Args:
+     decoder (:class:`~cntk.ops.functions.Function`): the model, mapping the
+      history (the output sequence so far, delayed by one step) and the input
+      sequence to the unnormalized log probabilities of the next token. Its
+      recurrences over the history must run forward with a delay of one step.
+     history (:class:`~cntk.variables.Variable`): the input of ``decoder``
+      that receives the one-hot encoded history
+     encoder_outputs (list): the variables or functions of ``decoder`` that
+      encode the input sequence. They must depend on the input sequence only,
+      and the decoder must only see the input sequence through them.
+     sentence_start_index (int): index of the token that starts the history
+     sentence_end_index (int): index of the token that ends a hypothesis
+     beam_width (int, defaults to 5): number of hypotheses kept per sequence
+     length_increase (float, defaults to 1): the maximum number of output
+      tokens is the length of the input sequence multiplied by this factor,
+      like in :func:`~cntk.layers.sequence.UnfoldFrom`
+     max_length (int, optional): maximum number of output tokens of all
+      sequences, overrides ``length_increase``
+     device (:class:`~cntk.device.DeviceDescriptor`): the device to run the
+      model on
+    '''
+
+    def __init__(self, decoder, history, encoder_outputs, sentence_start_index, sentence_end_index,
+                 beam_width=5, length_increase=1, max_length=None, device=None):
+        if beam_width < 1:
+            raise ValueError('beam_width must be a positive value')
+        if 2 * beam_width > np.prod(history.shape):
+            raise ValueError('beam_width can be at most half the vocabulary size')
+
+        encoder_outputs = [o.output if isinstance(o, C.Function) else o for o in encoder_outputs]
+        self._encoder = C.combine(_unique(encoder_outputs))
+        if len(self._encoder.arguments) != 1:
+            raise ValueError('the encoder outputs must depend on the input sequence only, found %d inputs' %
+                             len(self._encoder.arguments))
+        self._source = self._encoder.arguments[0]
+        encoder_outputs = list(self._encoder.outputs)
+
+        # cut the decoder off the encoder
+        self._history = C.input_variable(history.shape, history.dtype, is_sparse=history.is_sparse,
+                                         dynamic_axes=history.dynamic_axes, name=history.name)
+        self._encoder_inputs = [C.input_variable(o.shape, o.dtype, dynamic_axes=o.dynamic_axes, name=o.name)
+                                for o in encoder_outputs]
+        substitutions = {history: self._history}
+        substitutions.update(zip(encoder_outputs, self._encoder_inputs))
+        decoder = decoder.clone(C.CloneMethod.share, substitutions)
+        if any(arg.uid == self._source.uid for arg in decoder.arguments):
+            raise ValueError('the decoder must only depend on the input sequence through the encoder outputs')
+
+        # the recurrences over the history, other delays run over the encoder outputs
+        history_axes = [axis.name for axis in history.dynamic_axes]
+        delays = [d for d in C.logging.graph.depth_first_search(decoder,
+                  lambda x: isinstance(x, C.Function) and x.op_name in ('PastValue', 'FutureValue'), depth=0)
+                  if [axis.name for axis in d.output.dynamic_axes] == history_axes]
+        if not delays:
+            raise ValueError('the decoder has no recurrence over the history to decode')
+        for delay in delays:
+            if delay.op_name == 'FutureValue':
+                raise ValueError('a recurrence over the history running backwards cannot be decoded')
+            if delay.attributes.get('offset', 1) != 1:
+                raise ValueError('only delays of one step can be decoded, found %d' % delay.attributes['offset'])
+
+        # the initial states are constant, or computed from the encoder outputs once per sequence
+        self._initial_states = [d.inputs[1] for d in delays]
+        computed = _unique([s for s in self._initial_states if _static_value(s) is None and
+                            not any(s.uid == i.uid for i in self._encoder_inputs)])
+        self._initial_state_function = C.combine(computed) if computed else None
+        if computed and any(not any(arg.uid == i.uid for i in self._encoder_inputs)
+                            for arg in self._initial_state_function.arguments):
+            raise ValueError('the initial state of a recurrence must be constant or computed from the encoder outputs')
+
+        # one step of the decoder, with the states to feed to the next step as additional outputs
+        self._state_inputs = [C.input_variable(d.output.shape, d.output.dtype, dynamic_axes=d.output.dynamic_axes)
+                              for d in delays]
+        outputs = _unique(list(decoder.outputs) + [d.inputs[0] for d in delays])
+        self._step = C.combine(outputs).clone(C.CloneMethod.share,
+                                              dict(zip([d.output for d in delays], self._state_inputs)))
+        uids = [o.uid for o in outputs]
+        self._state_outputs = [self._step.outputs[uids.index(d.inputs[0].uid)] for d in delays]
+        step_arguments = set(arg.uid for arg in self._step.arguments)
+        self._step_encoder_inputs = [i for i in self._encoder_inputs if i.uid in step_arguments]
+
+        self._sentence_start_index = sentence_start_index
+        self._sentence_end_index = sentence_end_index
+        self._beam_width = beam_width
+        self._length_increase = length_increase
+        self._max_length = max_length
+        self._device = device
+        self._statistics = {'sequences': 0, 'steps': 0, 'beam_tokens': 0, 'tokens': 0, 'seconds': 0.0}
+
+    @property
+    def input(self):
+        '''
+        The input sequence of the model.
+        '''
+        return self._source
+
+    @property
+    def beam_width(self):
+        '''
+        The number of hypotheses kept per sequence.
+        '''
+        return self._beam_width
+
+    def throughput_summary(self):
+        '''
+        Summarizes the decoding speed of all calls to :meth:`decode`.
+
+        Returns:
+            `dict` with the number of sequences, decoder steps, tokens scored
+            over all hypotheses (``beam_tokens``) and output tokens decoded,
+            the total time in seconds, and the number of output and scored
+            tokens per second
+        '''
+        summary = dict(self._statistics)
+        seconds = summary['seconds']
+        summary['tokens_per_second'] = summary['tokens'] / seconds if seconds else 0.0
+        summary['beam_tokens_per_second'] = summary['beam_tokens'] / seconds if seconds else 0.0
+        return summary
+
+    def _source_value(self, sources):
+        # token indices are one-hot encoded, anything else is passed to the encoder as it is
+        if not all(np.ndim(s) == 1 for s in sources):
+            return sources, np.array([np.shape(s)[0] for s in sources])
+        lengths = np.array([len(s) for s in sources])
+        if self._source.is_sparse:
+            return C.Value.one_hot([list(s) for s in sources], self._source.shape, device=self._device), lengths
+        one_hot = np.eye(int(np.prod(self._source.shape)), dtype=self._source.dtype)
+        return [one_hot[np.asarray(s, dtype=np.int64)].reshape((-1,) + self._source.shape) for s in sources], lengths
+
+    def _per_sequence(self, value, var, num_sequences):
+        if _is_sequence(var):
+            return [np.asarray(v, dtype=var.dtype) for v in value]
+        return np.asarray(value, dtype=var.dtype).reshape((num_sequences,) + var.shape)
+
+    def _encode(self, sources):
+        value, lengths = self._source_value(sources)
+        _, values = self._encoder.forward({self._source: value}, self._encoder.outputs, device=self._device)
+        encoded = {i.uid: self._per_sequence(values[o], o, len(sources))
+                   for o, i in zip(self._encoder.outputs, self._encoder_inputs)}
+
+        def _feed(inputs, rows):
+            # the encoder outputs of the given sequences, shared and not copied for sequences
+            return {i: [encoded[i.uid][r] for r in rows] if _is_sequence(i) else encoded[i.uid][rows]
+                    for i in inputs}
+
+        computed = {}
+        if self._initial_state_function is not None:
+            f = self._initial_state_function
+            arguments = _feed(f.arguments, np.arange(len(sources)))
+            _, values = f.forward(arguments, f.outputs, device=self._device)
+            computed = {o.uid: self._per_sequence(values[o], o, len(sources)) for o in f.outputs}
+
+        initial_states = []
+        for var, state in zip(self._initial_states, self._state_inputs):
+            value = _static_value(var)
+            if value is None:
+                value = encoded.get(var.uid, computed.get(var.uid))
+                if _is_sequence(var): # the last item of a sequence is the initial state
+                    value = np.stack([v[-1] for v in value])
+                value = value.reshape((len(sources), 1) + state.shape)
+            else:
+                value = np.zeros((len(sources), 1) + state.shape, dtype=state.dtype) + value
+            initial_states.append(value)
+        return _feed, initial_states, lengths
+
+    def _history_value(self, tokens):
+        if self._history.is_sparse:
+            return C.Value.one_hot(tokens.reshape(-1, 1).tolist(), self._history.shape, device=self._device)
+        one_hot = np.zeros((len(tokens), int(np.prod(self._history.shape))), dtype=self._history.dtype)
+        one_hot[np.arange(len(tokens)), tokens] = 1
+        return one_hot.reshape((len(tokens), 1) + self._history.shape)
+
+    def decode(self, sources):
+        '''
+        Decodes a batch of input sequences.
+
+        Args:
+            sources (list): the input sequences, each one a list of token
+             indices, which are one-hot encoded, or data for the input of the
+             model, e.g. a NumPy array with one row per item
+
+        Returns:
+            tuple of the best hypothesis of every sequence, a list of token
+            indices ending with ``sentence_end_index`` unless it reached the
+            maximum length, and an array with their log probabilities
+        '''
+        start = time.time()
+        sources = list(sources)
+        num_sequences = len(sources)
+        feed, states, lengths = self._encode(sources)
+        if self._max_length is not None:
+            max_lengths = np.full(num_sequences, self._max_length)
+        else:
+            max_lengths = np.maximum(1, (lengths * self._length_increase).astype(np.int64))
+
+        # every sequence starts with a single live hypothesis, repeated to fill its beam
+        k = self._beam_width
+        vocab_dim = int(np.prod(self._history.shape))
+        active = np.arange(num_sequences)
+        rows = np.repeat(active, k)
+        scores = np.tile(np.array([0] + [-np.inf] * (k - 1)), num_sequences)
+        tokens = np.full(len(rows), self._sentence_start_index, dtype=np.int64)
+        hypotheses = np.zeros((len(rows), 0), dtype=np.int64)
+        states = [np.repeat(state, k, axis=0) for state in states]
+        finished = [[] for _ in range(num_sequences)]
+        best = [None] * num_sequences
+        num_steps = 0
+        beam_tokens = 0
+
+        while len(active):
+            arguments = feed(self._step_encoder_inputs, rows)
+            arguments[self._history] = self._history_value(tokens)
+            arguments.update(zip(self._state_inputs, states))
+            _, values = self._step.forward(arguments, self._step.outputs, device=self._device)
+            logp = _log_softmax(np.asarray(values[self._step.outputs[0]], dtype=np.float64).reshape(len(rows), -1))
+            num_steps += 1
+            beam_tokens += len(rows)
+
+            # the 2k best continuations of every sequence, from best to worst
+            candidates = (scores[:, np.newaxis] + logp).reshape(len(active), k * vocab_dim)
+            top = np.argpartition(-candidates, 2 * k - 1, axis=1)[:, :2 * k]
+            sequences = np.arange(len(active))[:, np.newaxis]
+            top = top[sequences, np.argsort(-candidates[sequences, top], axis=1)]
+            top_scores = candidates[sequences, top]
+            origins = sequences * k + top // vocab_dim
+            words = top % vocab_dim
+
+            # hypotheses ending among the k best are complete, the k best others continue
+            ends = words == self._sentence_end_index
+            for i, j in zip(*np.nonzero(ends[:, :k] & np.isfinite(top_scores[:, :k]))):
+                finished[active[i]].append((top_scores[i, j], list(hypotheses[origins[i, j]]) + [words[i, j]]))
+            keep = ~ends & (np.cumsum(~ends, axis=1) <= k)
+            origins = origins[keep]
+            scores = top_scores[keep]
+            tokens = words[keep]
+            hypotheses = np.concatenate([hypotheses[origins], tokens[:, np.newaxis]], axis=1)
+            states = [np.asarray(values[var], dtype=var.dtype).reshape((len(rows), 1) + var.shape)[origins]
+                      for var in self._state_outputs]
+
+            # log probabilities only decrease, so a sequence is done once a complete hypothesis beats all live ones
+            best_live = scores.reshape(len(active), k).max(axis=1)
+            best_finished = np.array([max(f)[0] if f else -np.inf for f in (finished[s] for s in active)])
+            done = (best_finished >= best_live) | (num_steps >= max_lengths[active])
+            for i in np.flatnonzero(done):
+                s = active[i]
+                if finished[s] and best_finished[i] >= best_live[i]:
+                    best[s] = max(finished[s], key=lambda f: f[0])
+                else:
+                    j = i * k + np.argmax(scores[i * k:(i + 1) * k])
+                    best[s] = (scores[j], list(hypotheses[j]))
+            if done.any():
+                live = np.repeat(~done, k)
+                active = active[~done]
+                rows = rows[live]
+                scores = scores[live]
+                tokens = tokens[live]
+                hypotheses = hypotheses[live]
+                states = [state[live] for state in states]
+
+        results = [[int(w) for w in b[1]] for b in best]
+        self._statistics['sequences'] += num_sequences
+        self._statistics['steps'] += num_steps
+        self._statistics['beam_tokens'] += beam_tokens
+        self._statistics['tokens'] += sum(len(r) for r in results)
+        self._statistics['seconds'] += time.time() - start
+        return results, np.array([b[0] for b in best])
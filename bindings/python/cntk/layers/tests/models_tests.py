@@ -4,6 +4,8 @@
 # for full license information.
 # ==============================================================================
 
+import numpy as np
+import pytest
 import cntk as C
 
 
@@ -17,3 +19,70 @@ def test_attention_model():
     expected_num_of_inputs = 142
 
     assert len(att_model.inputs) == expected_num_of_inputs
+
+
+def _seq2seq_model(attention):
+    src = C.sequence.input_variable(5, sequence_axis=C.Axis('src'))
+    tgt = C.sequence.input_variable(6, sequence_axis=C.Axis('tgt'))
+    with C.layers.default_options(init=C.glorot_uniform(seed=1)):
+        if attention:
+            # the decoder sees the whole encoder output sequence
+            h_enc = C.layers.Recurrence(C.layers.GRU(4))(src)
+            context = C.sequence.broadcast_as(C.sequence.last(h_enc), tgt)
+            h_dec = C.layers.Recurrence(C.layers.LSTM(4))(C.splice(tgt, context))
+        else:
+            # the decoder starts from the final encoder state
+            h_enc = C.layers.Fold(C.layers.GRU(4))(src)
+            h_dec = C.layers.RecurrenceFrom(C.layers.GRU(4))(h_enc, tgt)
+        return src, tgt, h_enc, C.layers.Dense(6)(h_dec)
+
+
+def _log_probability(decoder, src, tgt, source, hypothesis, start_index):
+    # log probability of a hypothesis, evaluating the decoder on the whole history
+    one_hot = np.eye(6, dtype=np.float32)
+    z = decoder.eval({src: [np.eye(5, dtype=np.float32)[source]],
+                      tgt: [one_hot[[start_index] + hypothesis[:-1]]]})[0]
+    z = z - z.max(axis=-1, keepdims=True)
+    logp = z - np.log(np.exp(z).sum(axis=-1, keepdims=True))
+    return logp[np.arange(len(hypothesis)), hypothesis].sum()
+
+
+@pytest.mark.parametrize("attention", [False, True])
+def test_beam_search_decoder(attention):
+    src, tgt, h_enc, decoder = _seq2seq_model(attention)
+    sources = [[2, 3, 4, 1], [4, 2], [0, 1, 2, 3, 4, 3]]
+    start_index, end_index = 0, 1
+
+    # a beam of one is greedy decoding
+    greedy = C.layers.BeamSearchDecoder(decoder, tgt, [h_enc], start_index, end_index, beam_width=1,
+                                        length_increase=1.5)
+    hypotheses, _ = greedy.decode(sources)
+    for source, hypothesis in zip(sources, hypotheses):
+        history = [start_index]
+        while len(history) - 1 < int(len(source) * 1.5) and history[-1] != end_index:
+            z = decoder.eval({src: [np.eye(5, dtype=np.float32)[source]],
+                              tgt: [np.eye(6, dtype=np.float32)[history]]})[0]
+            history.append(int(np.argmax(z[-1])))
+        assert hypothesis == history[1:]
+
+    beam_search = C.layers.BeamSearchDecoder(decoder, tgt, [h_enc], start_index, end_index, beam_width=3,
+                                             length_increase=1.5)
+    hypotheses, scores = beam_search.decode(sources)
+    assert len(hypotheses) == len(sources)
+    for source, hypothesis, score in zip(sources, hypotheses, scores):
+        assert 0 < len(hypothesis) <= int(len(source) * 1.5)
+        assert end_index not in hypothesis[:-1]
+        assert np.isclose(score, _log_probability(decoder, src, tgt, source, hypothesis, start_index), atol=1e-4)
+
+    summary = beam_search.throughput_summary()
+    assert summary['sequences'] == len(sources)
+    assert summary['tokens'] == sum(len(h) for h in hypotheses)
+    assert summary['tokens_per_second'] > 0
+
+
+def test_beam_search_decoder_requires_encoder_outputs():
+    src, tgt, h_enc, decoder = _seq2seq_model(attention=True)
+    # the decoder also sees the input sequence besides the encoder outputs
+    decoder = decoder + C.sequence.broadcast_as(C.reduce_sum(C.sequence.last(src)), tgt)
+    with pytest.raises(ValueError):
+        C.layers.BeamSearchDecoder(decoder, tgt, [h_enc], 0, 1)
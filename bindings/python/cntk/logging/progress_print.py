@@ -6,6 +6,9 @@
 from __future__ import print_function
 import sys
 import time
+import atexit
+import threading
+import weakref
 
 from cntk import cntk_py
 
@@ -23,8 +26,120 @@ def _avg(numerator, denominator):
     return (numerator / denominator) if denominator > 0 else 0.0
 
 
+class BufferedProgressWriter(cntk_py.ProgressWriter):
+    '''
+    Base class for progress writers that buffer their output and write it in
+    batches from a background thread, so that logging I/O does not stall
+    the training loop.
+
+    Subclasses call :meth:`buffer_record` for every record they produce
+    and implement :meth:`write_records`, which receives the buffered records
+    in the order they were produced. Records are written every
+    ``flush_interval`` seconds, whenever :meth:`flush_records` is called, at
+    the end of every training summary and at interpreter exit.
+
+    Args:
+        freq, first, test_freq, test_first, distributed_freq, distributed_first (`int`):
+          passed on to :class:`~cntk.cntk_py.ProgressWriter`
+        flush_interval (`float` or `None`, default `None`): interval in seconds at which
+          buffered records are written by the background thread. `None` means that
+          records are written synchronously as they are produced.
+    '''
+
+    def __init__(self, freq, first, test_freq, test_first, distributed_freq, distributed_first,
+                 flush_interval=None):
+        super(BufferedProgressWriter, self).__init__(freq, first, test_freq, test_first,
+                                                     distributed_freq, distributed_first)
+        if flush_interval is not None and flush_interval <= 0:
+            raise ValueError('flush_interval must be positive or None')
+
+        self.flush_interval = flush_interval
+        self._records = []
+        self._records_lock = threading.Lock()
+        # serializes write_records() between the background thread and flushes
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._flush_thread = None
+
+        if flush_interval is not None:
+            self_ref = weakref.ref(self)
+            self._flush_thread = threading.Thread(
+                target=BufferedProgressWriter._flush_loop, args=(self_ref, self._stop_event, flush_interval))
+            self._flush_thread.daemon = True
+            self._flush_thread.start()
+            atexit.register(BufferedProgressWriter._flush_at_exit, self_ref)
+
+    @staticmethod
+    def _flush_loop(self_ref, stop_event, flush_interval):
+        # holds only a weak reference, so that the thread does not keep the writer alive
+        while not stop_event.wait(flush_interval):
+            writer = self_ref()
+            if writer is None:
+                return
+            writer.flush_records()
+            del writer
+
+    @staticmethod
+    def _flush_at_exit(self_ref):
+        writer = self_ref()
+        if writer is not None:
+            writer.stop_buffering()
+
+    @property
+    def is_buffered(self):
+        '''
+        Whether records are buffered and written by a background thread.
+        '''
+        return self._flush_thread is not None and not self._stop_event.is_set()
+
+    def buffer_record(self, record):
+        '''
+        Buffers ``record`` for writing, or writes it immediately if the writer
+        is not buffered.
+
+        Args:
+            record: a subclass-specific record, passed on to :meth:`write_records`
+        '''
+        if not self.is_buffered:
+            with self._write_lock:
+                self.write_records([record])
+            return
+
+        with self._records_lock:
+            self._records.append(record)
+
+    def write_records(self, records):
+        '''
+        Writes a batch of buffered records. Has to be implemented by subclasses.
+
+        Args:
+            records (list): records passed to :meth:`buffer_record`, oldest first
+        '''
+        raise NotImplementedError('write_records has to be overwritten')
+
+    def flush_records(self):
+        '''
+        Writes all buffered records.
+        '''
+        with self._write_lock:
+            with self._records_lock:
+                records, self._records = self._records, []
+            if records:
+                self.write_records(records)
+
+    def stop_buffering(self):
+        '''
+        Stops the background thread and writes all buffered records. Records
+        produced afterwards are written synchronously.
+        '''
+        self._stop_event.set()
+        if self._flush_thread is not None and self._flush_thread is not threading.current_thread():
+            self._flush_thread.join()
+        self.flush_records()
+
+
 # TODO: Let's switch to import logging in the future instead of print. [ebarsoum]
-class ProgressPrinter(cntk_py.ProgressWriter):
+class ProgressPrinter(BufferedProgressWriter):
     '''
     Allows printing various statistics (e.g. loss and metric) as training/evaluation progresses.
 
@@ -52,10 +167,18 @@ class ProgressPrinter(cntk_py.ProgressWriter):
           worker synchronization info.
         distributed_first (`int`, default 0): similar to ``first``, but applies to printing distributed-training 
           worker synchronization info.
+        flush_interval (`float` or `None`, default `None`): if not None, log lines are buffered and written
+          by a background thread every ``flush_interval`` seconds and at the end of every epoch.
+          See :class:`BufferedProgressWriter`.
+        log_step_timings (`bool`, default False): if True, training updates and summaries also report
+          samples/s and the time spent waiting for data, in forward/backward computation, in
+          distributed synchronization and in checkpointing, as collected by the
+          :class:`~cntk.train.trainer.Trainer` this printer is passed to.
     '''
 
     def __init__(self, freq=None, first=0, tag='', log_to_file=None, rank=None, gen_heartbeat=False, num_epochs=300,
-                 test_freq=None, test_first=0, metric_is_pct=True, distributed_freq=None, distributed_first=0):
+                 test_freq=None, test_first=0, metric_is_pct=True, distributed_freq=None, distributed_first=0,
+                 flush_interval=None, log_step_timings=False):
         '''
         Constructor.
         '''
@@ -68,7 +191,8 @@ class ProgressPrinter(cntk_py.ProgressWriter):
         if distributed_freq is None:
             distributed_freq = sys.maxsize
 
-        super(ProgressPrinter, self).__init__(freq, first, test_freq, test_first, distributed_freq, distributed_first)
+        super(ProgressPrinter, self).__init__(freq, first, test_freq, test_first, distributed_freq, distributed_first,
+                                              flush_interval)
 
         self.loss_since_start = 0
         self.metric_since_start = 0
@@ -89,6 +213,8 @@ class ProgressPrinter(cntk_py.ProgressWriter):
         self.gen_heartbeat = gen_heartbeat
         self.num_epochs = num_epochs
         self.metric_is_pct = metric_is_pct
+        self.log_step_timings = log_step_timings
+        self.step_timings = None
         if metric_is_pct:
             self.metric_multiplier = 100.0
         else:
@@ -131,6 +257,7 @@ class ProgressPrinter(cntk_py.ProgressWriter):
         self.___logprint('CNTKCommandTrainEnd: train')
         if msg != "" and self.log_to_file is not None:
             self.___logprint(msg)
+        self.flush_records()
 
     def log(self, message):
         '''
@@ -210,18 +337,50 @@ class ProgressPrinter(cntk_py.ProgressWriter):
         self.samples_since_last = 0
         return ret
 
+    def attach_step_timings(self, step_timings):
+        '''
+        Attaches the :class:`~cntk.train.trainer.StepTimings` of a trainer, so that
+        training updates and summaries can report the time spent in each phase.
+        Called by :class:`~cntk.train.trainer.Trainer` upon construction.
+
+        Args:
+            step_timings (:class:`~cntk.train.trainer.StepTimings`): timings to report from
+        '''
+        self.step_timings = step_timings
+        now = time.time()
+        self._timings_since_update = (step_timings.copy(), now)
+        self._timings_since_summary = (step_timings.copy(), now)
+        self._timings_since_sync = step_timings.copy()
+
+    def ___step_timings_since(self, since):
+        # Returns the timings accumulated since ``since`` and the wall-clock time elapsed.
+        snapshot, start = since
+        now = time.time()
+        current = self.step_timings.copy()
+        return current - snapshot, now - start, (current, now)
+
+    def ___format_step_timings(self, delta, elapsed_seconds):
+        return ("{:0.1f} samples/s, data wait = {:0.3f}s, compute = {:0.3f}s, "
+                "sync = {:0.3f}s, checkpoint = {:0.3f}s").format(
+                    _avg(delta.samples, elapsed_seconds), delta.data_wait, delta.compute,
+                    delta.sync, delta.checkpoint)
+
     def write(self, key, value):
         # Override for ProgressWriter.write method.
         self.___logprint("{}: {}".format(key, value))
 
     def ___logprint(self, logline):
+        self.buffer_record(logline)
+
+    def write_records(self, records):
+        # Override for BufferedProgressWriter.write_records.
         if self.log_to_file == None:
             # to stdout.  if distributed, all ranks merge output into stdout
-            print(logline)
+            print("\n".join(records))
         else:
             # to named file.  if distributed, one file per rank
             with open(self.logfilename, "a") as logfile:
-                logfile.write(logline + "\n")
+                logfile.write("\n".join(records) + "\n")
 
     def epoch_summary(self, with_metric=False):
         '''
@@ -343,7 +502,12 @@ class ProgressPrinter(cntk_py.ProgressWriter):
 
     def on_write_distributed_sync_update(self, samples, updates, aggregate_metric):
         # Override for ProgressWriter.on_write_distributed_sync_update.
-        self.___logprint("Distributed training: #Syncs elapsed = {}, #Samples elapsed = {}".format(updates[1] - updates[0], samples[1] - samples[0]))
+        msg = "Distributed training: #Syncs elapsed = {}, #Samples elapsed = {}".format(updates[1] - updates[0], samples[1] - samples[0])
+        if self.log_step_timings and self.step_timings is not None:
+            current = self.step_timings.copy()
+            msg += ", sync time = {:0.3f}s".format((current - self._timings_since_sync).sync)
+            self._timings_since_sync = current
+        self.___logprint(msg)
 
     def ___write_progress_update(self, samples, updates, aggregate_loss, aggregate_metric, frequency, name):
         format_str = ' '
@@ -386,6 +550,12 @@ class ProgressPrinter(cntk_py.ProgressWriter):
 
             format_str += ';'
 
+            if name == '' and self.log_step_timings and self.step_timings is not None:
+                delta, elapsed_seconds, self._timings_since_update = \
+                    self.___step_timings_since(self._timings_since_update)
+                format_str += ' {}'
+                format_args.append(self.___format_step_timings(delta, elapsed_seconds))
+
         self.___logprint(format_str.format(*format_args))
 
     def on_write_training_summary(self, samples, updates, summaries, aggregate_loss, aggregate_metric,
@@ -393,6 +563,7 @@ class ProgressPrinter(cntk_py.ProgressWriter):
         # Override for ProgressWriter.on_write_training_summary.
         if self.freq == 0:
             # Only log training summary when on arithmetic schedule.
+            self.flush_records()
             return
 
         elapsed_seconds = elapsed_milliseconds / 1000
@@ -411,7 +582,14 @@ class ProgressPrinter(cntk_py.ProgressWriter):
             msg = "Finished Epoch[{} of {}]: {}loss = {:0.6f} * {} {:0.3f}s ({:5.1f} samples/s);".format(
                 summaries, self.num_epochs, self.tag, avg_loss, samples, elapsed_seconds, speed)
 
+        if self.log_step_timings and self.step_timings is not None:
+            delta, timed_seconds, self._timings_since_summary = \
+                self.___step_timings_since(self._timings_since_summary)
+            msg += " {}, cross validation = {:0.3f}s;".format(
+                self.___format_step_timings(delta, timed_seconds), delta.cross_validation)
+
         self.___logprint(msg)
+        self.flush_records()
 
     def on_write_test_summary(self, samples, updates, summaries, aggregate_metric, elapsed_milliseconds):
         # Override for ProgressWriter.on_write_test_summary.
@@ -423,7 +601,7 @@ class ProgressPrinter(cntk_py.ProgressWriter):
                             _avg(aggregate_metric, samples) * self.metric_multiplier, samples))
 
 
-class TensorBoardProgressWriter(cntk_py.ProgressWriter):
+class TensorBoardProgressWriter(BufferedProgressWriter):
     '''
     Allows writing various statistics (e.g. loss and metric) to TensorBoard event files during training/evaluation.
     The generated files can be opened in TensorBoard to visualize the progress.
@@ -436,16 +614,21 @@ class TensorBoardProgressWriter(cntk_py.ProgressWriter):
         rank (`int` or `None`, default `None`): rank of a worker when using distributed training, or `None` if
          training locally. If not `None`, event files will be created only by rank 0.
         model (:class:`cntk.ops.functions.Function` or `None`, default `None`): model graph to plot.
+        flush_interval (`float` or `None`, default `None`): if not None, values are buffered and written
+          by a background thread every ``flush_interval`` seconds and at the end of every epoch.
+          Repeated values for the same name and step within one interval are coalesced.
+          See :class:`BufferedProgressWriter`.
     '''
 
-    def __init__(self, freq=None, log_dir='.', rank=None, model=None):
+    def __init__(self, freq=None, log_dir='.', rank=None, model=None, flush_interval=None):
         '''
         Constructor.
         '''
         if freq is None:
             freq = sys.maxsize
 
-        super(TensorBoardProgressWriter, self).__init__(freq, 0, sys.maxsize, 0, sys.maxsize, 0)
+        super(TensorBoardProgressWriter, self).__init__(freq, 0, sys.maxsize, 0, sys.maxsize, 0,
+                                                        flush_interval)
 
         # Only log either when rank is not specified or when rank is 0.
         self.writer = cntk_py.TensorBoardFileWriter(log_dir, model) if not rank else None
@@ -465,7 +648,20 @@ class TensorBoardProgressWriter(cntk_py.ProgressWriter):
             raise RuntimeError('Attempting to use a closed TensorBoardProgressWriter')
 
         if self.writer:
-            self.writer.write_value(str(name), float(value), int(step))
+            self.buffer_record((str(name), float(value), int(step)))
+
+    def write_records(self, records):
+        # Override for BufferedProgressWriter.write_records.
+        # Keep only the last value per (name, step), in order of first appearance.
+        latest = {}
+        order = []
+        for name, value, step in records:
+            if (name, step) not in latest:
+                order.append((name, step))
+            latest[(name, step)] = value
+
+        for name, step in order:
+            self.writer.write_value(name, latest[(name, step)], step)
 
     def flush(self):
         '''Make sure that any outstanding records are immediately persisted.'''
@@ -473,6 +669,7 @@ class TensorBoardProgressWriter(cntk_py.ProgressWriter):
             raise RuntimeError('Attempting to use a closed TensorBoardProgressWriter')
 
         if self.writer:
+            self.flush_records()
             self.writer.flush()
 
     def close(self):
@@ -484,9 +681,14 @@ class TensorBoardProgressWriter(cntk_py.ProgressWriter):
             raise RuntimeError('Attempting to use a closed TensorBoardProgressWriter')
 
         if self.writer:
+            self.stop_buffering()
             self.writer.close()
             self.closed = True
 
+    def write(self, key, value):
+        # Override for ProgressWriter.write method.
+        self.write_value(key, value, self.total_training_updates())
+
     def on_write_training_update(self, samples, updates, aggregate_loss, aggregate_metric):
         # Override for ProgressWriter.on_write_training_update().
         self.write_value('minibatch/avg_loss', _avg(aggregate_loss, samples), self.total_training_updates())
@@ -504,6 +706,7 @@ class TensorBoardProgressWriter(cntk_py.ProgressWriter):
         # Override for BaseProgressWriter.on_write_training_summary().
         self.write_value('summary/avg_loss', _avg(aggregate_loss, samples), summaries)
         self.write_value('summary/avg_metric', _avg(aggregate_metric, samples), summaries)
+        self.flush_records()
 
     def on_write_test_summary(self, samples, updates, summaries, aggregate_metric, elapsed_milliseconds):
         # Override for BaseProgressWriter.on_write_test_summary().
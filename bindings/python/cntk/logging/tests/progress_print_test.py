@@ -0,0 +1,79 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+import sys
+import time
+import pytest
+from ..progress_print import BufferedProgressWriter, ProgressPrinter
+
+
+class ListWriter(BufferedProgressWriter):
+    def __init__(self, flush_interval=None):
+        super(ListWriter, self).__init__(1, 0, sys.maxsize, 0, sys.maxsize, 0, flush_interval)
+        self.batches = []
+
+    def write_records(self, records):
+        self.batches.append(list(records))
+
+
+def test_unbuffered_writer_writes_immediately():
+    writer = ListWriter()
+    assert not writer.is_buffered
+    writer.buffer_record(1)
+    writer.buffer_record(2)
+    assert writer.batches == [[1], [2]]
+
+
+def test_buffered_writer_coalesces_records():
+    writer = ListWriter(flush_interval=60)
+    assert writer.is_buffered
+    for i in range(5):
+        writer.buffer_record(i)
+    assert writer.batches == []
+
+    writer.flush_records()
+    assert writer.batches == [[0, 1, 2, 3, 4]]
+
+    writer.buffer_record(5)
+    writer.stop_buffering()
+    assert writer.batches == [[0, 1, 2, 3, 4], [5]]
+    assert not writer.is_buffered
+
+    writer.buffer_record(6)
+    assert writer.batches[-1] == [6]
+
+
+def test_buffered_writer_flushes_on_interval():
+    writer = ListWriter(flush_interval=0.01)
+    writer.buffer_record('a')
+    for _ in range(100):
+        if writer.batches:
+            break
+        time.sleep(0.01)
+    assert writer.batches == [['a']]
+    writer.stop_buffering()
+
+
+def test_buffered_writer_invalid_interval():
+    with pytest.raises(ValueError):
+        ListWriter(flush_interval=0)
+
+
+def test_progress_printer_buffered_log_file(tmpdir):
+    logfile = str(tmpdir / 'log.txt')
+    printer = ProgressPrinter(freq=1, log_to_file=logfile, flush_interval=60)
+    printer.log('hello')
+
+    with open(logfile) as f:
+        assert 'hello' not in f.read()
+
+    printer.on_write_training_summary(10, 1, 1, 5.0, 1.0, 1000)
+
+    with open(logfile) as f:
+        content = f.read()
+    assert 'hello' in content
+    assert 'Finished Epoch[1 of 300]' in content
+    printer.stop_buffering()
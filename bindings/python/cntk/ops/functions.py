@@ -2,6 +2,10 @@ from os import path
 from enum import Enum, unique
 import warnings
 import collections
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import numpy as np
 
 import cntk
 from cntk import cntk_py, Value
@@ -11,13 +15,20 @@ from cntk.internal import map_if_possible, typemap, sanitize_var_map,\
                           sanitize_variable_value_dict,\
                           sanitize_Function_attributes,\
                           sanitize_variables_or_functions,\
-                          _value_as_sequence_or_array
+                          _value_as_sequence_or_array, _value_as_array_view,\
+                          _allocate_array_view, _can_view_without_copy, _is_cpu
 from cntk.internal.utils import get_python_function_arguments, \
                                 map_function_arguments, _py_dict_to_cntk_dict, \
                                 _to_cntk_dict_value
-from cntk.internal import _UDFDeserializeCallbackWrapper, _serialize
+from cntk.internal import _UDFDeserializeCallbackWrapper, _serialize, \
+                          _resolve_udf_factory
 from cntk.internal.sanitize import is_byte_buffer
+from cntk.internal.model_cache import model_cache
+from cntk.internal.mapped_model import is_mapped_model, load_mapped_model,\
+                                      save_mapped_model
 from ..variables import Record, Variable
+from ..core import PaddedSequences, _value_as_padded_sequences,\
+                   _padded_sequences_as_value
 
 
 @unique
@@ -1134,7 +1145,7 @@ class Function(cntk_py.Function):
         return graph.find_by_name(self, name, depth)
 
     @typemap
-    def save(self, filename):
+    def save(self, filename, mappable=False):
         '''
         Save this function graph into a model file using protobuf-based
         serialization.
@@ -1144,7 +1155,14 @@ class Function(cntk_py.Function):
 
         Args:
             filename (str): model path
-        '''
+            mappable (bool, default False): if `True`, the parameters and
+             constants are stored as aligned raw blobs next to the graph.
+             :meth:`load` then memory-maps them instead of copying them,
+             which makes loading large models faster and lets processes
+             that load the same model on the CPU share its memory.
+        '''
+        if mappable:
+            return save_mapped_model(self, filename)
         return super(Function, self).save(filename)
 
     def save_model(self, filename): # legacy name
@@ -1198,15 +1216,30 @@ class Function(cntk_py.Function):
 
     @staticmethod
     @typemap
-    def load(model, device=None):
+    def load(model, device=None, cache=None):
         '''
         Load the ``model``, that has been saved using :func:`~cntk.ops.functions.Function.save`.
 
+        The parameters and constants of a model saved with ``mappable=True``
+        are memory-mapped. On the CPU they borrow the memory of a
+        copy-on-write mapping of the file, which stays open for the lifetime
+        of the process.
+
+        If ``cache`` is given, model files are kept in the process-wide
+        least-recently-used cache :data:`cntk.internal.model_cache.model_cache`
+        keyed by path, modification time, size and device, and every load
+        returns a clone of the cached model. With ``'share'`` all clones
+        share the parameters of the cached model, so updating them in one
+        clone affects the others; use ``'freeze'`` for inference.
+
         Args:
             model (str, bytes or bytearray): either a file path of a model file or a byte buffer 
              containing the binary representation of a model.
             device (:class:`~cntk.device.DeviceDescriptor`, defaults to the current globally default device):
              specifies the device to allocate the model on.
+            cache (:class:`CloneMethod`, defaults to `None`): if not `None`,
+             the method used to clone the cached model. Ignored for byte
+             buffers.
 
         Returns:
             root node
@@ -1227,10 +1260,19 @@ class Function(cntk_py.Function):
             return cntk_py.Function.load_from_buffer(model, device)
         
         if is_file:
-            return cntk_py.Function.load(model, device)
+            if cache is not None:
+                return model_cache.load(model, device, Function._load_file,
+                                        CloneMethod(cache))
+            return Function._load_file(model, device)
         
         raise ValueError('Cannot load a model that is neither a file nor a byte buffer.')
 
+    @staticmethod
+    def _load_file(filename, device):
+        if is_mapped_model(filename):
+            return load_mapped_model(filename, device)
+        return cntk_py.Function.load(filename, device)
+
 @typemap
 def register_native_user_function(op_id, module_name, factory_method_name):
     '''
@@ -1275,11 +1317,11 @@ def native_user_function(op_id, operands, attributes=None, user_function_instanc
     return cntk_py.Function_native_user_function(op_id, operands, attributes, user_function_instance_name)
 
 @typemap
-def load_model(model, device=None):
+def load_model(model, device=None, cache=None):
     '''
     Alias for :func:`~cntk.ops.functions.Function.load`.
     '''
-    return Function.load(model, device)
+    return Function.load(model, device, cache)
 
 @typemap
 def save_model(model, filename): # legacy name
@@ -1287,6 +1329,13 @@ def save_model(model, filename): # legacy name
             'model.save(...) instead', DeprecationWarning)
     return model.save(filename)
 
+def _first_mask(values):
+    for v in values:
+        if isinstance(v, PaddedSequences):
+            return v.mask
+    return None
+
+
 class UserFunction(Function):
     '''
     Base class of all user extension functions.
@@ -1294,18 +1343,46 @@ class UserFunction(Function):
     If it has only one output, one can invoke Variable methods on it, which it
     will relay to its only output.
 
+    Subclasses whose :meth:`forward` and :meth:`backward` do not depend on
+    shared mutable state and spend most of their time in code that releases
+    the GIL (e.g. NumPy or SciPy kernels) can set the class attribute
+    ``parallel_safe`` to `True`. Independent instances of such functions can
+    then be evaluated concurrently by :class:`ParallelUserFunctions`.
+
     Args:
         inputs (list): inputs to this function
         as_numpy (bool, optional): whether the data should be automatically
          converted from and to NumPy. Defaults to True. Specifying this as
          `False` passes the data as CNTK Value objects.
         name (str): name of this function
+        zero_copy (bool, optional): only applies if ``as_numpy`` is `True`.
+         If `True`, dense CPU data that has only a batch axis is passed to
+         :meth:`forward` and :meth:`backward` as read-only NumPy views on the
+         CNTK buffers instead of copies. Both methods then always receive a
+         dictionary of results to fill in, whose values are preallocated,
+         uninitialized NumPy arrays where possible and `None` otherwise.
+         Writing into the preallocated arrays in place avoids copying the
+         results back into CNTK. The views are only valid during the call.
+         Defaults to `False`.
+        padded_sequences (bool, optional): only applies if ``as_numpy`` is
+         `True`. If `True`, dense data with a sequence axis is passed as one
+         :class:`~cntk.core.PaddedSequences` batch instead of a list of
+         per-sequence arrays, so that it can be processed with vectorized
+         NumPy operations. Results for such outputs and inputs are either
+         :class:`~cntk.core.PaddedSequences` or padded NumPy arrays, which
+         get the mask of the first padded argument (in :meth:`forward`) or
+         root gradient (in :meth:`backward`). Defaults to `False`.
     '''
 
-    def __init__(self, inputs, as_numpy=True, name=''):
+    parallel_safe = False
+
+    def __init__(self, inputs, as_numpy=True, name='', zero_copy=False,
+                 padded_sequences=False):
         super(UserFunction, self).__init__(inputs, name)
         self.set_native(False)
         self.as_numpy = as_numpy
+        self.zero_copy = zero_copy
+        self.padded_sequences = padded_sequences
 
         # Since the state will frequently not be used, we cache the None-state
         # to speed up.
@@ -1341,16 +1418,23 @@ class UserFunction(Function):
         Returns:
              A BackPropState instance, which is used by :func:`backward`.
         '''
+        zero_copy = self.as_numpy and self.zero_copy
         if self.as_numpy:
             inputs = self.inputs
-            arguments = tuple(_value_as_sequence_or_array(v, inputs[i]) for i, v in enumerate(arguments))
+            arguments = tuple(self._value_to_numpy(v, inputs[i]) for i, v in enumerate(arguments))
 
         map_if_possible(outputs)
         map_if_possible(outputs_to_retain)
 
         args = arguments if len(arguments)>1 else arguments[0]
 
-        if len(outputs) <= 1:
+        buffers = {}
+        if zero_copy:
+            buffers = self._allocate_buffers(zip(self.inputs, arguments), outputs, device)
+            for k, (ndav, view) in buffers.items():
+                outputs[k] = view
+            state = self.forward(args, outputs, device, outputs_to_retain)
+        elif len(outputs) <= 1:
             state, result = self.forward(args, device, outputs_to_retain)
             for k in outputs:
                 outputs[k] = result
@@ -1367,15 +1451,64 @@ class UserFunction(Function):
                 state = cntk_py.UserBackPropState.create(self, device, state)
 
         if self.as_numpy:
+            mask = _first_mask(arguments)
             for k,v in outputs.items():
                 if v is None:
                     raise ValueError('not all outputs have been provided')
 
-                # FIXME: seq_starts
-                outputs[k] = sanitize_batch(k, v, None, device)
+                if k in buffers and v is buffers[k][1]:
+                    # the result was written into the CNTK buffer in place
+                    outputs[k] = cntk_py.Value(buffers[k][0])
+                else:
+                    outputs[k] = self._numpy_to_value(k, v, device, mask)
 
         return state, outputs
 
+    def _is_padded(self, variable):
+        return self.padded_sequences and len(variable.dynamic_axes) > 1 and \
+            not variable.is_sparse
+
+    def _value_to_numpy(self, value, variable):
+        if self._is_padded(variable):
+            return _value_as_padded_sequences(value, self.zero_copy)
+        if self.zero_copy:
+            return _value_as_array_view(value, variable)
+        return _value_as_sequence_or_array(value, variable)
+
+    def _numpy_to_value(self, variable, data, device, mask):
+        if self._is_padded(variable):
+            if not isinstance(data, PaddedSequences):
+                if mask is None:
+                    raise ValueError('the result for %s has to be given as '
+                                     'PaddedSequences since no padded input '
+                                     'provides a mask' % variable)
+                data = PaddedSequences(data, mask)
+            return _padded_sequences_as_value(variable, data, device)
+
+        # FIXME: seq_starts
+        return sanitize_batch(variable, data, None, device)
+
+    def _allocate_buffers(self, values, variables, device):
+        '''
+        Preallocates CPU buffers for those ``variables`` that can be exchanged
+        without copying. The batch size is taken from ``values``, a sequence
+        of (variable, array) pairs.
+
+        Returns:
+            dict: mapping of variables to (NDArrayView, NumPy view) pairs
+        '''
+        if device is None or not _is_cpu(device):
+            return {}
+
+        batch_sizes = set(a.shape[0] for var, a in values
+                          if len(var.dynamic_axes) == 1 and isinstance(a, np.ndarray))
+        if len(batch_sizes) != 1:
+            return {}
+
+        batch_size = batch_sizes.pop()
+        return dict((var, _allocate_array_view(var, batch_size))
+                    for var in variables if _can_view_without_copy(var))
+
     def _backward(self, state, root_gradients, variables):
         '''
         Backpropagates supplied ``root_gradients`` for one or more of the output
@@ -1399,12 +1532,13 @@ class UserFunction(Function):
             dict: mapping of ``variables`` to NumPy arrays
         '''
         device = state.device()
+        zero_copy = self.as_numpy and self.zero_copy
 
         if self.as_numpy:
             map_if_possible(root_gradients)
             for v in root_gradients:
                 if v.needs_gradient:
-                    root_gradients[v] = _value_as_sequence_or_array(root_gradients[v], v)
+                    root_gradients[v] = self._value_to_numpy(root_gradients[v], v)
 
         if not isinstance(state, cntk_py.BackPropState):
             raise ValueError('state must be of type BackPropState')
@@ -1414,12 +1548,20 @@ class UserFunction(Function):
 
         map_if_possible(variables)
 
+        mask = _first_mask(root_gradients.values())
+
+        buffers = {}
+        if zero_copy:
+            buffers = self._allocate_buffers(root_gradients.items(), variables, device)
+            for k, (ndav, view) in buffers.items():
+                variables[k] = view
+
         if len(root_gradients) == 1:
             for rg in root_gradients.values():
                 break
             root_gradients = rg
 
-        if len(self.inputs) > 1:
+        if zero_copy or len(self.inputs) > 1:
             self.backward(state, root_gradients, variables)
         else:
             result = self.backward(state, root_gradients)
@@ -1428,8 +1570,10 @@ class UserFunction(Function):
 
         if self.as_numpy:
             for k, v in variables.items():
-                if v is not None:
-                    variables[k] = sanitize_batch(k, v, None, device)
+                if k in buffers and v is buffers[k][1]:
+                    variables[k] = cntk_py.Value(buffers[k][0])
+                elif v is not None:
+                    variables[k] = self._numpy_to_value(k, v, device, mask)
 
     def _infer_outputs(self, outputs):
         outputs.extend(self.infer_outputs())
@@ -1504,3 +1648,195 @@ class UserFunction(Function):
     @classmethod
     def _op_name(cls):
         return cls.__module__ + '.' + cls.__name__
+
+
+_thread_pool = None
+_thread_pool_lock = threading.Lock()
+
+
+def _user_function_thread_pool():
+    '''
+    The process-wide thread pool on which parallel-safe user functions are
+    evaluated. It is created on first use with one thread per CPU core.
+    '''
+    global _thread_pool
+    with _thread_pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPool(multiprocessing.cpu_count())
+    return _thread_pool
+
+
+def _sum_values(values, device):
+    '''
+    Sums dense Values of identical shape and layout, e.g. the gradients of an
+    input shared by several functions.
+    '''
+    if len(values) == 1:
+        return values[0]
+
+    total = sum(cntk_py.Value.data(v).to_ndarray() for v in values)
+    data = cntk.NDArrayView.from_dense(total, device)
+    mask = cntk_py.Value.mask(values[0])
+    if mask is None:
+        return cntk_py.Value(data)
+    return cntk_py.Value(data, mask.deep_clone(device))
+
+
+class ParallelUserFunctions(UserFunction):
+    '''
+    Combines independent, parallel-safe user-defined functions into a single
+    node whose outputs are the outputs of all combined functions in order.
+    During forward and backward the combined functions are evaluated
+    concurrently on a process-wide thread pool, which speeds up graphs with
+    several branches of custom ops, e.g. per-head attention implemented in
+    NumPy.
+
+    Only functions whose class sets ``parallel_safe`` to `True` can be
+    combined. The data conversions of every function, i.e. its ``as_numpy``,
+    ``zero_copy`` and ``padded_sequences`` settings, are preserved.
+
+    Example:
+        >>> heads = C.user_function(ParallelUserFunctions(
+        ...     [MyHead(q, k, v) for _ in range(8)])) # doctest: +SKIP
+        >>> outputs = heads.outputs # doctest: +SKIP
+
+    Args:
+        functions (list): instances of :class:`UserFunction` with
+         ``parallel_safe`` set to `True`
+        name (str): name of this function
+    '''
+
+    def __init__(self, functions, name=''):
+        functions = list(functions)
+        if not functions:
+            raise ValueError('at least one function has to be given')
+
+        for f in functions:
+            if not isinstance(f, UserFunction) or not f.parallel_safe:
+                raise ValueError('%s is not a parallel-safe user function' % f)
+
+        if len(set(id(f) for f in functions)) != len(functions):
+            raise ValueError('every function instance can only be combined once')
+
+        inputs = []
+        input_indices = []
+        for f in functions:
+            indices = []
+            for var in f.inputs:
+                if var not in inputs:
+                    inputs.append(var)
+                indices.append(inputs.index(var))
+            input_indices.append(indices)
+
+        # set before calling the base constructor, which infers the outputs
+        self.functions = functions
+        self._input_indices = input_indices
+        self._output_indices = [(j, k) for j, f in enumerate(functions)
+                                for k in range(len(f.outputs))]
+
+        super(ParallelUserFunctions, self).__init__(inputs, as_numpy=False, name=name)
+
+    def infer_outputs(self):
+        return [cntk.output_variable(o.shape, o.dtype, o.dynamic_axes,
+                                     o.needs_gradient, o.name)
+                for f in self.functions for o in f.outputs]
+
+    def _function_outputs(self, variables):
+        '''
+        Maps output variables of this function to those of the combined
+        functions and returns a list of dicts, one per combined function.
+        '''
+        positions = dict((o, i) for i, o in enumerate(self.outputs))
+        mapped = [{} for _ in self.functions]
+        for var in variables:
+            j, k = self._output_indices[positions[var]]
+            mapped[j][self.functions[j].outputs[k]] = var
+        return mapped
+
+    def _run(self, tasks):
+        if len(tasks) == 1:
+            return [tasks[0]()]
+        return _user_function_thread_pool().map(lambda task: task(), tasks, chunksize=1)
+
+    def _forward(self, arguments, outputs, device=None, outputs_to_retain=None):
+        map_if_possible(outputs)
+        map_if_possible(outputs_to_retain)
+
+        requested = self._function_outputs(outputs)
+        retained = self._function_outputs(outputs_to_retain or [])
+
+        def task(j):
+            f = self.functions[j]
+            function_arguments = tuple(arguments[i] for i in self._input_indices[j])
+            function_outputs = dict((o, None) for o in requested[j])
+            return f._forward(function_arguments, function_outputs, device,
+                              set(retained[j]))
+
+        active = [j for j, r in enumerate(requested) if r]
+        results = self._run([lambda j=j: task(j) for j in active])
+
+        states = [None] * len(self.functions)
+        for j, (state, function_outputs) in zip(active, results):
+            states[j] = state
+            for o, value in function_outputs.items():
+                outputs[requested[j][o]] = value
+
+        return cntk_py.UserBackPropState.create(self, device, states), outputs
+
+    def _backward(self, state, root_gradients, variables):
+        device = state.device()
+        states = cntk_py.UserBackPropState.data(state)
+
+        map_if_possible(root_gradients)
+        map_if_possible(variables)
+
+        gradients = self._function_outputs(root_gradients)
+        inputs = self.inputs
+
+        def task(j):
+            f = self.functions[j]
+            function_gradients = dict((o, root_gradients[var])
+                                      for o, var in gradients[j].items())
+            function_variables = dict((f.inputs[k], None)
+                                      for k, i in enumerate(self._input_indices[j])
+                                      if inputs[i] in variables)
+            if function_variables:
+                f._backward(states[j], function_gradients, function_variables)
+            return function_variables
+
+        active = [j for j, g in enumerate(gradients) if g and states[j] is not None]
+        results = self._run([lambda j=j: task(j) for j in active])
+
+        contributions = dict((var, []) for var in variables)
+        for j, function_variables in zip(active, results):
+            f = self.functions[j]
+            for k, i in enumerate(self._input_indices[j]):
+                value = function_variables.get(f.inputs[k])
+                if value is not None:
+                    contributions[inputs[i]].append(value)
+
+        for var, values in contributions.items():
+            if values:
+                variables[var] = _sum_values(values, device)
+
+    def clone(self, cloned_inputs):
+        functions = [f.clone([cloned_inputs[i] for i in indices])
+                     for f, indices in zip(self.functions, self._input_indices)]
+        return ParallelUserFunctions(functions, name=self.name)
+
+    def serialize(self):
+        return {'functions': [_serialize(f) for f in self.functions],
+                'inputs': self._input_indices}
+
+    @staticmethod
+    def deserialize(inputs, name, state):
+        functions = []
+        for dictionary, indices in zip(state['functions'], state['inputs']):
+            factory = _resolve_udf_factory(dictionary['module'], dictionary['class'])
+            if factory is None:
+                raise ValueError("Cannot deserialize user function '{}.{}'. "
+                    "It does not have a static 'deserialize' method."
+                    .format(dictionary['module'], dictionary['class']))
+            functions.append(factory([inputs[int(i)] for i in indices],
+                                     '', dictionary['state']))
+        return ParallelUserFunctions(functions, name)
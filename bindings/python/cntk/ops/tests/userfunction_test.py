@@ -677,3 +677,220 @@ def test_udf_input_values_no_sharing():
 
     grad_value, result = m4.grad({i : np.asarray([2], dtype=np.float32)}, outputs=[m4], wrt=[w, i])
     assert np.array_equal(result, [[8,  8,  8,  8,  8,  8,  8,  8]])
+
+
+class MyZeroCopySigmoid(UserFunction):
+    def __init__(self, arg, name='zero_copy_sigmoid'):
+        super(MyZeroCopySigmoid, self).__init__([arg], name=name, zero_copy=True)
+        self.views = []
+
+    def infer_outputs(self):
+        return [C.output_variable(self.inputs[0].shape, self.inputs[0].dtype,
+                                  self.inputs[0].dynamic_axes)]
+
+    def forward(self, argument, outputs, device=None, outputs_to_retain=None):
+        out = outputs[self.outputs[0]]
+        self.views.append((argument, out))
+        np.negative(argument, out=out)
+        np.exp(out, out=out)
+        np.add(out, 1, out=out)
+        np.reciprocal(out, out=out)
+        return out.copy()
+
+    def backward(self, state, root_gradients, variables):
+        self.views.append((root_gradients, variables[self.inputs[0]]))
+        grad = variables[self.inputs[0]]
+        np.subtract(1, state, out=grad)
+        np.multiply(grad, state, out=grad)
+        np.multiply(grad, root_gradients, out=grad)
+
+
+def test_udf_zero_copy():
+    dev = C.cpu()
+    i = C.input_variable(3, needs_gradient=True)
+    udf = MyZeroCopySigmoid(i)
+    f = C.user_function(udf)
+
+    x = np.asarray([[-1, 0, 1], [2, 3, 4]], dtype=np.float32)
+    gradient, result = f.grad({i: x}, wrt=[i], outputs=[f.output], device=dev)
+
+    s = 1 / (1 + np.exp(-x))
+    assert np.allclose(result, s)
+    assert np.allclose(gradient, s * (1 - s))
+
+    (arg, out), (root_gradients, grad) = udf.views
+    # inputs and root gradients are read-only views, the results are
+    # preallocated buffers owned by CNTK
+    for view in (arg, out, root_gradients, grad):
+        assert isinstance(view, np.ndarray)
+        assert not view.flags.owndata
+    assert not arg.flags.writeable
+    assert not root_gradients.flags.writeable
+    assert out.flags.writeable and grad.flags.writeable
+    assert out.shape == grad.shape == (2, 3)
+
+
+def test_udf_zero_copy_sequence_fallback():
+    dev = C.cpu()
+    i = C.sequence.input_variable(3)
+
+    class CopyingSigmoid(MyZeroCopySigmoid):
+        def forward(self, argument, outputs, device=None, outputs_to_retain=None):
+            # sequence data is copied and no buffers can be preallocated
+            assert outputs[self.outputs[0]] is None
+            outputs[self.outputs[0]] = [1 / (1 + np.exp(-seq)) for seq in argument]
+
+    f = C.user_function(CopyingSigmoid(i))
+    x = [np.asarray([[-1, 0, 1], [2, 3, 4]], dtype=np.float32)]
+    result = f.eval({i: x}, device=dev)
+    assert np.allclose(result[0], 1 / (1 + np.exp(-x[0])))
+
+
+def test_ndarray_view_shares_memory():
+    data = np.arange(6, dtype=np.float32).reshape(2, 3)
+    nd = C.NDArrayView.from_dense(data, device=C.cpu())
+
+    view = nd.as_array_view()
+    assert not view.flags.writeable
+    assert np.array_equal(view, data)
+
+    writable = nd.as_array_view(read_only=False)
+    writable[1, 2] = -1
+    assert view[1, 2] == -1
+    assert nd.asarray()[1, 2] == -1
+
+    # the view keeps the NDArrayView alive
+    del nd
+    assert view[1, 2] == -1
+
+
+class MyPaddedCumSum(UserFunction):
+    def __init__(self, arg, name='padded_cumsum'):
+        super(MyPaddedCumSum, self).__init__([arg], name=name, padded_sequences=True)
+        self.arguments_seen = []
+
+    def infer_outputs(self):
+        return [C.output_variable(self.inputs[0].shape, self.inputs[0].dtype,
+                                  self.inputs[0].dynamic_axes)]
+
+    def forward(self, argument, device=None, outputs_to_retain=None):
+        self.arguments_seen.append(argument)
+        valid = (argument.mask != 0)[..., np.newaxis]
+        return None, np.cumsum(argument.data * valid, axis=1)
+
+    def backward(self, state, root_gradients):
+        valid = (root_gradients.mask != 0)[..., np.newaxis]
+        reversed_sum = np.cumsum((root_gradients.data * valid)[:, ::-1], axis=1)
+        return C.PaddedSequences(reversed_sum[:, ::-1], root_gradients.mask)
+
+
+def test_udf_padded_sequences():
+    dev = C.cpu()
+    i = C.sequence.input_variable(2, needs_gradient=True)
+    udf = MyPaddedCumSum(i)
+    f = C.user_function(udf)
+
+    x = [np.arange(6, dtype=np.float32).reshape(3, 2),
+         np.ones((1, 2), dtype=np.float32)]
+    gradient, result = f.grad({i: x}, wrt=[i], outputs=[f.output], device=dev)
+
+    argument = udf.arguments_seen[0]
+    assert isinstance(argument, C.PaddedSequences)
+    assert argument.data.shape == (2, 3, 2)
+    assert np.array_equal(argument.lengths, [3, 1])
+    assert np.array_equal(argument.mask, [[2, 1, 1], [2, 0, 0]])
+
+    for seq, res, grad in zip(x, result, gradient):
+        assert np.allclose(res, np.cumsum(seq, axis=0))
+        steps = len(seq)
+        assert np.allclose(grad, np.arange(steps, 0, -1)[:, np.newaxis] * np.ones_like(seq))
+
+
+def test_padded_sequences_from_lengths():
+    data = np.zeros((3, 4, 2), dtype=np.float32)
+    p = C.PaddedSequences.from_lengths(data, [4, 2, 0])
+    assert p.mask.dtype == np.int8
+    assert np.array_equal(p.mask, [[2, 1, 1, 1], [2, 1, 0, 0], [0, 0, 0, 0]])
+    assert np.array_equal(p.lengths, [4, 2, 0])
+
+    with pytest.raises(ValueError):
+        C.PaddedSequences.from_lengths(data, [1, 2])
+
+
+class MyParallelScale(UserFunction):
+    parallel_safe = True
+
+    def __init__(self, arg, scale, name='parallel_scale'):
+        self.scale = scale
+        super(MyParallelScale, self).__init__([arg], name=name)
+
+    def infer_outputs(self):
+        return [C.output_variable(self.inputs[0].shape, self.inputs[0].dtype,
+                                  self.inputs[0].dynamic_axes)]
+
+    def forward(self, argument, device=None, outputs_to_retain=None):
+        return None, argument * self.scale
+
+    def backward(self, state, root_gradients):
+        return root_gradients * self.scale
+
+    def clone(self, cloned_inputs):
+        return MyParallelScale(cloned_inputs[0], self.scale, self.name)
+
+
+def test_parallel_user_functions():
+    from cntk.ops.functions import ParallelUserFunctions
+    dev = C.cpu()
+    i = C.input_variable(3, needs_gradient=True)
+    j = C.input_variable(3, needs_gradient=True)
+
+    branches = [MyParallelScale(i, 2), MyParallelScale(j, 3), MyParallelScale(i, 5)]
+    f = C.user_function(ParallelUserFunctions(branches))
+    assert len(f.outputs) == 3
+
+    x = np.asarray([[1, 2, 3]], dtype=np.float32)
+    y = np.asarray([[4, 5, 6]], dtype=np.float32)
+    results = f.eval({i: x, j: y}, device=dev)
+    assert np.allclose(results[f.outputs[0]], 2 * x)
+    assert np.allclose(results[f.outputs[1]], 3 * y)
+    assert np.allclose(results[f.outputs[2]], 5 * x)
+
+    # the gradients of the input shared by two branches are summed
+    z = C.splice(*f.outputs)
+    gradients = z.grad({i: x, j: y}, wrt=[i, j], device=dev)
+    assert np.allclose(gradients[i], 7 * np.ones_like(x))
+    assert np.allclose(gradients[j], 3 * np.ones_like(y))
+
+
+def test_parallel_user_functions_requires_parallel_safe():
+    from cntk.ops.functions import ParallelUserFunctions
+    i = C.input_variable(3)
+    with pytest.raises(ValueError):
+        ParallelUserFunctions([MyParallelScale(i, 2), MyPlus(i, C.constant(3))])
+
+    f = MyParallelScale(i, 2)
+    with pytest.raises(ValueError):
+        ParallelUserFunctions([f, f])
+
+
+def test_parallel_user_function_benchmark():
+    from cntk.ops.user_function_benchmark import run_benchmark
+    result = run_benchmark(input_dim=8, hidden_dim=8, num_branches=3,
+                           minibatch_size=4, repeats=2)
+    assert result['serial'] > 0 and result['parallel'] > 0
+
+
+def test_resolve_udf_factory():
+    from cntk.internal import _resolve_udf_factory
+    assert _resolve_udf_factory(MyPlus.__module__, 'MyPlus') == MyPlus.deserialize
+    assert _resolve_udf_factory(MyPlus.__module__, 'MyPlus') is \
+        _resolve_udf_factory(MyPlus.__module__, 'MyPlus')
+    with pytest.raises(ImportError):
+        _resolve_udf_factory(MyPlus.__module__, 'NoSuchUserFunction')
+
+
+def test_user_function_load_benchmark():
+    from cntk.ops.user_function_load_benchmark import run_benchmark
+    result = run_benchmark(num_nodes=10, repeats=1)
+    assert result['load'] > 0
+    assert result['cached_resolution'] >= 0 and result['exec_resolution'] >= 0
@@ -0,0 +1,124 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+from __future__ import print_function
+import sys
+import time
+import numpy as np
+
+from .functions import UserFunction, ParallelUserFunctions
+
+__doc__ = '''\
+Benchmark of :class:`~cntk.ops.functions.ParallelUserFunctions` on a
+multi-branch graph.
+
+The graph applies ``num_branches`` independent NumPy-based user functions to
+the same input and splices their outputs. It is evaluated once with one
+user function node per branch, which the engine runs one after the other,
+and once with all branches combined into a single
+:class:`~cntk.ops.functions.ParallelUserFunctions` node. Run it with::
+
+    python -m cntk.ops.user_function_benchmark
+'''
+
+
+class DenseTanhBranch(UserFunction):
+    '''
+    A parallel-safe user function computing ``tanh(x W)`` with NumPy.
+    '''
+    parallel_safe = True
+
+    def __init__(self, arg, weights, name='dense_tanh_branch'):
+        self.weights = weights
+        super(DenseTanhBranch, self).__init__([arg], name=name)
+
+    def infer_outputs(self):
+        from cntk import output_variable
+        return [output_variable((self.weights.shape[1],), self.inputs[0].dtype,
+                                self.inputs[0].dynamic_axes)]
+
+    def forward(self, argument, device=None, outputs_to_retain=None):
+        result = np.tanh(np.dot(argument, self.weights))
+        return result, result
+
+    def backward(self, state, root_gradients):
+        return np.dot(root_gradients * (1 - state * state), self.weights.T)
+
+    def clone(self, cloned_inputs):
+        return DenseTanhBranch(cloned_inputs[0], self.weights, self.name)
+
+
+def _branches(x, num_branches, hidden_dim, seed):
+    rng = np.random.RandomState(seed)
+    dtype = np.dtype(x.dtype)
+    return [DenseTanhBranch(x, rng.randn(x.shape[0], hidden_dim).astype(dtype) * 0.01)
+            for _ in range(num_branches)]
+
+
+def create_graphs(input_dim=1024, hidden_dim=1024, num_branches=8, seed=0):
+    '''
+    Creates the serial and the parallel variant of the benchmark graph.
+
+    Returns:
+        tuple: the input variable, the serial graph and the parallel graph
+    '''
+    import cntk as C
+    x = C.input_variable(input_dim, needs_gradient=True)
+
+    serial = C.splice(*[C.user_function(b) for b in _branches(x, num_branches, hidden_dim, seed)])
+    parallel = C.user_function(ParallelUserFunctions(_branches(x, num_branches, hidden_dim, seed)))
+    parallel = C.splice(*parallel.outputs)
+    return x, serial, parallel
+
+
+def time_graph(x, graph, data, repeats, device):
+    '''
+    Average wall-clock time in seconds of one forward and backward pass.
+    '''
+    # the first pass includes graph compilation and memory allocation
+    graph.grad({x: data}, wrt=[x], device=device)
+    start = time.time()
+    for _ in range(repeats):
+        graph.grad({x: data}, wrt=[x], device=device)
+    return (time.time() - start) / repeats
+
+
+def run_benchmark(input_dim=1024, hidden_dim=1024, num_branches=8,
+                  minibatch_size=256, repeats=10, seed=0):
+    '''
+    Times the serial and the parallel graph on the CPU.
+
+    Returns:
+        `dict` with the keys ``'serial'`` and ``'parallel'`` (seconds per
+        forward and backward pass) and ``'speedup'``
+    '''
+    from cntk.device import cpu
+    x, serial, parallel = create_graphs(input_dim, hidden_dim, num_branches, seed)
+    data = np.random.RandomState(seed).randn(minibatch_size, input_dim).astype(np.float32)
+
+    serial_time = time_graph(x, serial, data, repeats, cpu())
+    parallel_time = time_graph(x, parallel, data, repeats, cpu())
+    return {'serial': serial_time, 'parallel': parallel_time,
+            'speedup': serial_time / parallel_time if parallel_time > 0 else 0.0}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="CNTK parallel user function benchmark")
+    parser.add_argument('-b', '--num_branches', type=int, default=8,
+                        help='number of user function branches (default: %(default)s)')
+    parser.add_argument('-d', '--dim', type=int, default=1024,
+                        help='input and hidden dimension (default: %(default)s)')
+    parser.add_argument('-m', '--minibatch_size', type=int, default=256,
+                        help='minibatch size (default: %(default)s)')
+    parser.add_argument('-r', '--repeats', type=int, default=10,
+                        help='number of timed passes (default: %(default)s)')
+
+    args = parser.parse_args(sys.argv[1:])
+    result = run_benchmark(args.dim, args.dim, args.num_branches,
+                           args.minibatch_size, args.repeats)
+    print("{} branches: serial {:0.2f} ms, parallel {:0.2f} ms, speedup {:0.2f}x".format(
+        args.num_branches, result['serial'] * 1000, result['parallel'] * 1000,
+        result['speedup']))
@@ -0,0 +1,139 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from .functions import Function, UserFunction
+from ..internal import _resolve_udf_factory
+
+__doc__ = '''\
+Benchmark of loading a model with many user function nodes.
+
+The model is a chain of ``num_nodes`` user functions. The benchmark reports
+the time of :func:`~cntk.ops.functions.Function.load` for the whole model,
+as well as the time spent resolving the deserialize factories of the nodes,
+once with the cached importlib-based resolver and once with the
+``exec``/``eval`` based resolution it replaced. Run it with::
+
+    python -m cntk.ops.user_function_load_benchmark
+'''
+
+
+class ScaleUserFunction(UserFunction):
+    '''
+    A serializable user function multiplying its input by a constant.
+    '''
+
+    def __init__(self, arg, scale, name='scale_user_function'):
+        self.scale = scale
+        super(ScaleUserFunction, self).__init__([arg], name=name)
+
+    def infer_outputs(self):
+        from cntk import output_variable
+        return [output_variable(self.inputs[0].shape, self.inputs[0].dtype,
+                                self.inputs[0].dynamic_axes)]
+
+    def forward(self, argument, device=None, outputs_to_retain=None):
+        return None, argument * self.scale
+
+    def backward(self, state, root_gradients):
+        return root_gradients * self.scale
+
+    def clone(self, cloned_inputs):
+        return ScaleUserFunction(cloned_inputs[0], self.scale, self.name)
+
+    def serialize(self):
+        return {'scale': self.scale}
+
+    @staticmethod
+    def deserialize(inputs, name, state):
+        return ScaleUserFunction(inputs[0], state['scale'], name)
+
+
+def create_model(num_nodes=500, input_dim=16):
+    '''
+    Creates a chain of ``num_nodes`` user function nodes.
+    '''
+    import cntk as C
+    z = C.input_variable(input_dim)
+    for _ in range(num_nodes):
+        z = C.user_function(ScaleUserFunction(z, 1.0))
+    return z
+
+
+def _exec_resolve(module, cls):
+    namespace = {}
+    exec("from {} import {}".format(module, cls), namespace)
+    eval_str = "{0}.{1} if hasattr({0}, '{1}') else None"
+    return eval(eval_str.format(cls, 'deserialize'), namespace)
+
+
+def time_resolution(resolver, num_nodes, repeats):
+    '''
+    Average wall-clock time in seconds of resolving the deserialize factory
+    of ``num_nodes`` user function nodes with ``resolver``.
+    '''
+    module = ScaleUserFunction.__module__
+    cls = ScaleUserFunction.__name__
+    start = time.time()
+    for _ in range(repeats):
+        for _ in range(num_nodes):
+            resolver(module, cls)
+    return (time.time() - start) / repeats
+
+
+def time_load(filename, repeats, device):
+    '''
+    Average wall-clock time in seconds of loading the model in ``filename``.
+    '''
+    start = time.time()
+    for _ in range(repeats):
+        Function.load(filename, device=device)
+    return (time.time() - start) / repeats
+
+
+def run_benchmark(num_nodes=500, repeats=5):
+    '''
+    Saves a model with ``num_nodes`` user function nodes and times loading
+    it on the CPU.
+
+    Returns:
+        `dict` with the keys ``'load'`` (seconds per model load),
+        ``'cached_resolution'`` and ``'exec_resolution'`` (seconds spent
+        resolving the factories of all nodes of one model)
+    '''
+    from cntk.device import cpu
+    model_dir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(model_dir, 'user_functions.model')
+        create_model(num_nodes).save(filename)
+        load_time = time_load(filename, repeats, cpu())
+    finally:
+        shutil.rmtree(model_dir)
+
+    return {'load': load_time,
+            'cached_resolution': time_resolution(_resolve_udf_factory, num_nodes, repeats),
+            'exec_resolution': time_resolution(_exec_resolve, num_nodes, repeats)}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="CNTK user function load benchmark")
+    parser.add_argument('-n', '--num_nodes', type=int, default=500,
+                        help='number of user function nodes (default: %(default)s)')
+    parser.add_argument('-r', '--repeats', type=int, default=5,
+                        help='number of timed loads (default: %(default)s)')
+
+    args = parser.parse_args(sys.argv[1:])
+    result = run_benchmark(args.num_nodes, args.repeats)
+    print("{} nodes: load {:0.2f} ms, factory resolution {:0.2f} ms "
+          "(exec/eval: {:0.2f} ms)".format(
+        args.num_nodes, result['load'] * 1000,
+        result['cached_resolution'] * 1000, result['exec_resolution'] * 1000))
@@ -104,3 +104,95 @@ def test_load_save_unique_input(tmpdir):
     loaded_node = C.Function.load(filename)
     loaded_result = loaded_node.eval(input1)
     assert np.allclose(loaded_result, expected)
+
+def test_load_save_mappable(tmpdir):
+    i1 = C.input_variable(3, name='i1')
+    with C.layers.default_options(init=C.glorot_uniform(seed=1)):
+        z = C.layers.Dense(4, name='dense')(i1) + C.constant(np.arange(4, dtype=np.float32))
+
+    input1 = np.asarray([[1, 2, 3]], dtype=np.float32)
+    expected = z.eval({i1: input1}, device=C.cpu())
+
+    filename = str(tmpdir / 'dense_plus_c.mod')
+    z.save(filename, mappable=True)
+
+    from cntk.internal.mapped_model import is_mapped_model
+    assert is_mapped_model(filename)
+
+    loaded_node = C.Function.load(filename, device=C.cpu())
+    assert not loaded_node.placeholders
+    assert len(loaded_node.parameters) == 2
+    assert len(loaded_node.constants) == 1
+    assert np.allclose(loaded_node.eval({loaded_node.arguments[0]: input1}, device=C.cpu()), expected)
+
+    # a second load maps the file again and updating one model's parameters
+    # does not affect the other nor the file
+    other_node = C.Function.load(filename, device=C.cpu())
+    for p in loaded_node.parameters:
+        p.value = np.zeros(p.shape, dtype=np.float32)
+    assert np.allclose(other_node.eval({other_node.arguments[0]: input1}, device=C.cpu()), expected)
+
+    reloaded_node = C.Function.load(filename, device=C.cpu())
+    assert np.allclose(reloaded_node.eval({reloaded_node.arguments[0]: input1}, device=C.cpu()), expected)
+
+def test_load_mappable_uids_and_lifetime(tmpdir):
+    import gc
+
+    i1 = C.input_variable(3, name='i1')
+    with C.layers.default_options(init=C.glorot_uniform(seed=1)):
+        z = C.layers.Dense(4, name='dense')(i1) + C.constant(np.arange(4, dtype=np.float32))
+
+    input1 = np.asarray([[1, 2, 3]], dtype=np.float32)
+    expected = C.softmax(z).eval({i1: input1}, device=C.cpu())
+
+    filename = str(tmpdir / 'dense_plus_c.mod')
+    z.save(filename, mappable=True)
+
+    loaded_node = C.Function.load(filename, device=C.cpu())
+    assert set(p.uid for p in loaded_node.parameters) == set(p.uid for p in z.parameters)
+    assert set(c.uid for c in loaded_node.constants) == set(c.uid for c in z.constants)
+
+    # constants can be updated, e.g. the running statistics of batch normalization
+    c = loaded_node.constants[0]
+    c.value = np.arange(4, dtype=np.float32)
+
+    # a graph built from the loaded model outlives it
+    composed = C.softmax(loaded_node)
+    del loaded_node, c
+    gc.collect()
+    assert np.allclose(composed.eval({composed.arguments[0]: input1}, device=C.cpu()), expected)
+
+def test_load_cache(tmpdir):
+    from cntk.internal.model_cache import model_cache
+    model_cache.clear()
+
+    i1 = C.input_variable(3, name='i1')
+    with C.layers.default_options(init=C.glorot_uniform(seed=1)):
+        z = C.layers.Dense(4, name='dense')(i1)
+
+    input1 = np.asarray([[1, 2, 3]], dtype=np.float32)
+    expected = z.eval({i1: input1}, device=C.cpu())
+
+    filename = str(tmpdir / 'dense.mod')
+    z.save(filename)
+
+    frozen = C.Function.load(filename, device=C.cpu(), cache='freeze')
+    assert len(model_cache) == 1
+    assert not frozen.parameters
+    assert np.allclose(frozen.eval({frozen.arguments[0]: input1}, device=C.cpu()), expected)
+
+    # clones with shared parameters see each other's updates
+    shared1 = C.load_model(filename, device=C.cpu(), cache=C.CloneMethod.share)
+    shared2 = C.load_model(filename, device=C.cpu(), cache=C.CloneMethod.share)
+    assert len(model_cache) == 1
+    shared1.parameters[0].value = np.zeros(shared1.parameters[0].shape, dtype=np.float32)
+    assert np.allclose(shared2.parameters[0].value, 0)
+
+    # the frozen clone is not affected
+    assert np.allclose(frozen.eval({frozen.arguments[0]: input1}, device=C.cpu()), expected)
+
+    model_cache.capacity = 0
+    assert len(model_cache) == 0
+    C.Function.load(filename, device=C.cpu(), cache='freeze')
+    assert len(model_cache) == 0
+    model_cache.capacity = 8
@@ -7,3 +7,4 @@
 from .trainer import *
 from .training_session import *
 from .distributed import *
+from .pipeline import *
@@ -0,0 +1,301 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+from __future__ import print_function
+import sys
+import time
+import numpy as np
+
+from . import distributed
+from .trainer import Trainer
+
+__doc__ = '''\
+Benchmark harness for the distributed learners in :mod:`cntk.train.distributed`.
+
+A fixed, synthetic model is trained under each distributed learner
+configuration and for every step the harness reports the number of bytes each
+worker exchanges, the wall-clock step time and the training loss. Run it on a
+single machine with a local multi-process communicator, e.g.::
+
+    mpiexec -n 4 python -m cntk.train.distributed_benchmark
+'''
+
+_FLOAT_BYTES = 4
+
+
+def gradient_bytes(parameters, num_quantization_bits=32):
+    '''
+    Estimates the size in bytes of one gradient payload for ``parameters``.
+
+    With 32 bits the gradient is sent at full precision. With fewer bits the
+    payload follows the column-wise quantization used by 1-bit SGD: every
+    column is packed into 32-bit words holding ``num_quantization_bits`` per
+    element and carries two float quantization bounds.
+
+    Args:
+        parameters (list): list of :class:`~cntk.variables.Parameter`
+        num_quantization_bits (int): number of bits per gradient element (1 to 32)
+
+    Returns:
+        `int`: the number of bytes in one gradient payload
+    '''
+    if num_quantization_bits < 1 or num_quantization_bits > 32:
+        raise ValueError('num_quantization_bits must be between 1 and 32, '
+                         'got %s' % num_quantization_bits)
+
+    total = 0
+    for p in parameters:
+        shape = tuple(p.shape)
+        if any(dim < 0 for dim in shape):
+            raise ValueError('parameter %s has an inferred shape' % p.name)
+
+        # The C++ side views a tensor as a matrix whose rows are the
+        # fastest-changing (last Python) axis.
+        rows = shape[-1] if shape else 1
+        cols = int(np.prod(shape[:-1])) if len(shape) > 1 else 1
+
+        if num_quantization_bits == 32:
+            total += rows * cols * _FLOAT_BYTES
+        else:
+            words_per_column = (rows * num_quantization_bits + 31) // 32
+            total += cols * (words_per_column * 4 + 2 * _FLOAT_BYTES)
+    return total
+
+
+def allreduce_bytes(payload_bytes, num_workers):
+    '''
+    Number of bytes each worker sends when all-reducing ``payload_bytes``
+    with a ring reduce-scatter followed by an all-gather.
+
+    Args:
+        payload_bytes (int): size of the reduced buffer in bytes
+        num_workers (int): number of participating workers
+
+    Returns:
+        `int`: bytes sent per worker
+    '''
+    if num_workers <= 1:
+        return 0
+    return int(2 * (num_workers - 1) * payload_bytes // num_workers)
+
+
+class LearnerConfiguration(object):
+    '''
+    A named distributed learner configuration to be benchmarked.
+
+    Args:
+        name (str): name reported in the benchmark results
+        kind (str): either ``'data_parallel'`` or ``'block_momentum'``
+        num_quantization_bits (int): bits per gradient element for
+         ``'data_parallel'`` (1 to 32)
+        block_size (int): block size in samples for ``'block_momentum'``
+        distributed_after (int): number of samples after which distributed
+         training starts
+    '''
+
+    def __init__(self, name, kind='data_parallel', num_quantization_bits=32,
+                 block_size=None, distributed_after=0):
+        if kind not in ('data_parallel', 'block_momentum'):
+            raise ValueError('unsupported learner kind "%s"' % kind)
+        if kind == 'block_momentum' and not block_size:
+            raise ValueError('block_size must be specified for block momentum')
+
+        self.name = name
+        self.kind = kind
+        self.num_quantization_bits = num_quantization_bits
+        self.block_size = block_size
+        self.distributed_after = distributed_after
+
+    def create_learner(self, learner):
+        '''
+        Wraps the local ``learner`` into the distributed learner described
+        by this configuration.
+        '''
+        if self.kind == 'data_parallel':
+            return distributed.data_parallel_distributed_learner(
+                learner,
+                distributed_after=self.distributed_after,
+                num_quantization_bits=self.num_quantization_bits)
+        return distributed.block_momentum_distributed_learner(
+            learner,
+            block_size=self.block_size,
+            distributed_after=self.distributed_after)
+
+    def bytes_per_step(self, parameters, num_workers, samples_before, samples_after):
+        '''
+        Bytes sent by one worker for a step that moved the global sample
+        count from ``samples_before`` to ``samples_after``.
+        '''
+        if samples_after <= self.distributed_after:
+            return 0
+
+        if self.kind == 'data_parallel':
+            payload = gradient_bytes(parameters, self.num_quantization_bits)
+            return allreduce_bytes(payload, num_workers)
+
+        # block momentum exchanges full precision models once per block
+        syncs = samples_after // self.block_size - samples_before // self.block_size
+        return syncs * allreduce_bytes(gradient_bytes(parameters), num_workers)
+
+
+def default_configurations(block_size=3200):
+    '''
+    The distributed learner configurations benchmarked by default: full
+    precision and 1-bit data parallel SGD, and block momentum.
+
+    Args:
+        block_size (int): block size in samples for block momentum
+
+    Returns:
+        list of :class:`LearnerConfiguration`
+    '''
+    return [
+        LearnerConfiguration('data_parallel_32bit'),
+        LearnerConfiguration('data_parallel_1bit', num_quantization_bits=1),
+        LearnerConfiguration('block_momentum', kind='block_momentum',
+                             block_size=block_size),
+    ]
+
+
+def _create_model(input_dim, hidden_dim, num_classes):
+    import cntk as C
+    features = C.input_variable(input_dim)
+    labels = C.input_variable(num_classes)
+    with C.layers.default_options(init=C.glorot_uniform(seed=1)):
+        z = C.layers.Sequential([
+            C.layers.Dense(hidden_dim, activation=C.relu),
+            C.layers.Dense(hidden_dim, activation=C.relu),
+            C.layers.Dense(num_classes)])(features)
+    ce = C.cross_entropy_with_softmax(z, labels)
+    errs = C.classification_error(z, labels)
+    return features, labels, z, ce, errs
+
+
+def _synthetic_data(rng, minibatch_size, input_dim, num_classes):
+    # linearly separable classes around fixed centroids
+    centroids = np.random.RandomState(0).randn(num_classes, input_dim)
+    classes = rng.randint(num_classes, size=minibatch_size)
+    x = centroids[classes] + rng.randn(minibatch_size, input_dim)
+    y = np.eye(num_classes)[classes]
+    return x.astype(np.float32), y.astype(np.float32)
+
+
+def run_configuration(config, num_steps=100, minibatch_size=64, input_dim=256,
+                      hidden_dim=512, num_classes=10, learning_rate=0.01, seed=0):
+    '''
+    Trains the benchmark model for ``num_steps`` minibatches under ``config``.
+
+    Every worker draws its own partition of the synthetic data, so the global
+    minibatch size is ``minibatch_size`` times the number of workers.
+
+    Args:
+        config (:class:`LearnerConfiguration`): the configuration to run
+        num_steps (int): number of minibatches to train
+        minibatch_size (int): number of samples per worker and step
+        input_dim (int): input dimension of the model
+        hidden_dim (int): dimension of the two hidden layers
+        num_classes (int): number of output classes
+        learning_rate (float): per-sample learning rate
+        seed (int): seed of the synthetic data; offset by the worker rank
+
+    Returns:
+        `dict` with the keys ``'name'``, ``'step_times'`` (seconds),
+        ``'bytes_per_step'`` and ``'losses'``, each a list with one entry
+        per step, and ``'num_workers'``
+    '''
+    import cntk as C
+    features, labels, z, ce, errs = _create_model(input_dim, hidden_dim, num_classes)
+
+    lr = C.learning_rate_schedule(learning_rate, C.UnitType.sample)
+    local_learner = C.momentum_sgd(z.parameters, lr,
+                                   C.momentum_as_time_constant_schedule(1100))
+    learner = config.create_learner(local_learner)
+    trainer = Trainer(z, (ce, errs), [learner])
+
+    communicator = learner.communicator()
+    num_workers = len(communicator.workers())
+    rng = np.random.RandomState(seed + distributed.Communicator.rank())
+
+    result = {'name': config.name, 'num_workers': num_workers,
+              'step_times': [], 'bytes_per_step': [], 'losses': []}
+
+    communicator.barrier()
+    for _ in range(num_steps):
+        x, y = _synthetic_data(rng, minibatch_size, input_dim, num_classes)
+        samples_before = trainer.total_number_of_samples_seen
+
+        start = time.time()
+        trainer.train_minibatch({features: x, labels: y})
+        result['step_times'].append(time.time() - start)
+
+        samples_after = trainer.total_number_of_samples_seen
+        result['bytes_per_step'].append(config.bytes_per_step(
+            z.parameters, num_workers, samples_before, samples_after))
+        result['losses'].append(trainer.previous_minibatch_loss_average)
+    communicator.barrier()
+
+    return result
+
+
+def benchmark_distributed_learners(configurations=None, **kwargs):
+    '''
+    Runs :func:`run_configuration` for every configuration.
+
+    Args:
+        configurations (list): list of :class:`LearnerConfiguration`, defaults
+         to :func:`default_configurations`
+        kwargs: passed on to :func:`run_configuration`
+
+    Returns:
+        list of result dictionaries, see :func:`run_configuration`
+    '''
+    if configurations is None:
+        configurations = default_configurations()
+    return [run_configuration(config, **kwargs) for config in configurations]
+
+
+def summarize(result, file=sys.stdout):
+    '''
+    Prints a one-line summary and the loss trajectory of a benchmark result.
+    '''
+    step_times = result['step_times']
+    # the first step includes graph compilation and memory allocation
+    timed = step_times[1:] if len(step_times) > 1 else step_times
+    avg_time = sum(timed) / len(timed) if timed else 0.0
+    avg_bytes = sum(result['bytes_per_step']) / float(max(len(result['bytes_per_step']), 1))
+
+    print("{}: {} workers, {:0.3f} ms/step, {:0.0f} bytes/step sent per worker".format(
+        result['name'], result['num_workers'], avg_time * 1000, avg_bytes), file=file)
+    losses = result['losses']
+    stride = max(len(losses) // 10, 1)
+    print("  loss: " + " ".join("{:0.4f}".format(l) for l in losses[::stride]), file=file)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="CNTK distributed learner benchmark")
+    parser.add_argument('-n', '--num_steps', type=int, default=100,
+                        help='number of minibatches per configuration (default: %(default)s)')
+    parser.add_argument('-m', '--minibatch_size', type=int, default=64,
+                        help='minibatch size per worker (default: %(default)s)')
+    parser.add_argument('-b', '--block_size', type=int, default=3200,
+                        help='block size in samples for block momentum (default: %(default)s)')
+    parser.add_argument('-q', '--quantized_only', action='store_true', default=False,
+                        help='only benchmark the 1-bit configuration (default: %(default)s)')
+
+    args = parser.parse_args(sys.argv[1:])
+
+    configurations = default_configurations(args.block_size)
+    if args.quantized_only:
+        configurations = [c for c in configurations if c.num_quantization_bits < 32]
+
+    try:
+        results = benchmark_distributed_learners(
+            configurations, num_steps=args.num_steps, minibatch_size=args.minibatch_size)
+        if distributed.Communicator.rank() == 0:
+            for result in results:
+                summarize(result)
+    finally:
+        distributed.Communicator.finalize()
@@ -0,0 +1,317 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+import sys
+import time
+import threading
+from .. import cntk_py
+from ..device import use_default_device
+from .distributed import DistributedLearner
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+__doc__ = '''\
+A pipelined training driver that overlaps reading the next minibatch with the
+training step of the current one and reports how much time is spent in each
+phase.
+'''
+
+_END_OF_DATA = object()
+
+if sys.version_info[0] >= 3:
+    def _reraise(exc_info):
+        raise exc_info[1].with_traceback(exc_info[2])
+else:  # Python 2, where the three-argument raise is a syntax error in Python 3
+    exec('def _reraise(exc_info):\n'
+         '    raise exc_info[0], exc_info[1], exc_info[2]\n')
+
+
+class PhaseTimings(object):
+    '''
+    Accumulated wall-clock times (in seconds) of the phases of a pipelined
+    training loop.
+
+    Attributes:
+        data_wait (float): time the training loop was blocked waiting for a minibatch
+        prefetch (float): time the background reader spent in ``next_minibatch``
+        train (float): time spent in :meth:`~cntk.train.trainer.Trainer.train_minibatch`,
+         i.e. forward, backward, gradient aggregation and parameter update
+        total (float): wall-clock time of the whole training loop
+        minibatches (int): number of minibatches trained
+        samples (int): number of samples trained on by this worker
+    '''
+
+    def __init__(self):
+        self.data_wait = 0.0
+        self.prefetch = 0.0
+        self.train = 0.0
+        self.total = 0.0
+        self.minibatches = 0
+        self.samples = 0
+
+    @property
+    def overlap(self):
+        '''
+        Fraction of the reader time hidden behind training, between 0 and 1.
+        '''
+        if self.prefetch <= 0:
+            return 0.0
+        return max(0.0, min(1.0, 1.0 - self.data_wait / self.prefetch))
+
+    @property
+    def samples_per_second(self):
+        '''
+        Training throughput of this worker.
+        '''
+        return self.samples / self.total if self.total > 0 else 0.0
+
+    def __str__(self):
+        return ('{} minibatches, {} samples in {:0.3f}s ({:0.1f} samples/s): '
+                'train {:0.3f}s, data wait {:0.3f}s, prefetch {:0.3f}s ({:0.0f}% overlapped)').format(
+                    self.minibatches, self.samples, self.total, self.samples_per_second,
+                    self.train, self.data_wait, self.prefetch, self.overlap * 100)
+
+
+class _MinibatchPrefetcher(threading.Thread):
+    '''
+    Background thread reading minibatches into a bounded queue. Calls into
+    the C++ minibatch source release the GIL, so reading proceeds while
+    the training thread is inside ``train_minibatch``.
+    '''
+
+    def __init__(self, mb_source, schedule, input_map, max_samples, depth,
+                 num_data_partitions, partition_index, device, timings):
+        super(_MinibatchPrefetcher, self).__init__()
+        self.daemon = True
+        self.mb_source = mb_source
+        self.schedule = schedule
+        self.input_map = input_map
+        self.max_samples = max_samples
+        self.num_data_partitions = num_data_partitions
+        self.partition_index = partition_index
+        self.device = device
+        self.timings = timings
+        self.queue = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.error = None
+
+    def _put(self, item):
+        # retry so that a stop request is noticed even if the queue is full
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(self):
+        samples = 0
+        try:
+            while samples < self.max_samples and not self.stopped.is_set():
+                mb_size = self.schedule[samples]
+                start = time.time()
+                mb = self.mb_source.next_minibatch(
+                    mb_size, input_map=self.input_map, device=self.device,
+                    num_data_partitions=self.num_data_partitions,
+                    partition_index=self.partition_index)
+                self.timings.prefetch += time.time() - start
+
+                if not mb:
+                    break
+
+                samples += max(v.num_samples for v in mb.values())
+                if not self._put(mb):
+                    return
+        except Exception:
+            self.error = sys.exc_info()
+        self._put(_END_OF_DATA)
+
+    def _drain(self):
+        # drop the minibatches read ahead, which hold device memory
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def stop(self):
+        '''
+        Stops reading, waits for the thread to finish and empties the queue.
+        '''
+        self.stopped.set()
+        # unblock a pending put right away instead of waiting for its timeout
+        self._drain()
+        self.join()
+        self._drain()
+
+
+class PipelinedTrainer(object):
+    '''
+    The instance of the class should be created by using
+    :func:`~cntk.train.pipeline.pipelined_training` function.
+
+    Drives a :class:`~cntk.train.trainer.Trainer` from a minibatch source
+    while a background thread reads up to ``prefetch_depth`` minibatches
+    ahead, so that reading, deserialization and host-to-device transfer of
+    the next minibatch overlap with the forward, backward and aggregation
+    work of the current one.
+
+    Gradient aggregation itself happens inside the native ``train_minibatch``
+    call and is not overlapped by this driver.
+
+    The time spent waiting for data is also added to the trainer's
+    :class:`~cntk.train.trainer.StepTimings`.
+
+    Args:
+        trainer (:class:`~cntk.train.trainer.Trainer`): trainer
+        mb_source (:class:`~cntk.io.MinibatchSource`): minibatch source used for training
+        mb_size (:class:`~cntk.cntk_py.minibatch_size_schedule` or int): minibatch size schedule for training
+        model_inputs_to_streams (dict): mapping between input variables and input streams
+        max_samples (int): maximum number of samples this worker trains on
+        prefetch_depth (int): number of minibatches read ahead
+        num_data_partitions (int): number of data partitions, usually the number of workers
+        partition_index (int): index of the partition read by this worker
+    '''
+
+    def __init__(self, trainer, mb_source, mb_size, model_inputs_to_streams,
+                 max_samples, prefetch_depth, num_data_partitions, partition_index):
+        if trainer is None:
+            raise ValueError("Trainer must not be None.")
+
+        if mb_source is None:
+            raise ValueError("Training minibatch source must not be None.")
+
+        if model_inputs_to_streams is None or len(model_inputs_to_streams) == 0:
+            raise ValueError(
+                "Mapping between input vars and streams should not be empty.")
+
+        if prefetch_depth < 1:
+            raise ValueError("prefetch_depth must be at least 1.")
+
+        schedule = mb_size
+        if isinstance(mb_size, int):
+            schedule = cntk_py.minibatch_size_schedule(mb_size)
+
+        if not isinstance(schedule, cntk_py.minibatch_size_schedule):
+            raise ValueError('mb_size of type (%s) not supported. '
+                             'it must be an output of minibatch_size_schedule() function'
+                             % type(schedule))
+
+        self.trainer = trainer
+        self.mb_source = mb_source
+        self.schedule = schedule
+        self.model_inputs_to_streams = model_inputs_to_streams
+        self.max_samples = sys.maxsize if max_samples is None else max_samples
+        self.prefetch_depth = prefetch_depth
+        self.num_data_partitions = num_data_partitions
+        self.partition_index = partition_index
+        self.timings = PhaseTimings()
+
+    def train(self, device=None, callback=None):
+        '''
+        Perform training on a specified device.
+
+        Args:
+            device (:class:`~cntk.device.DeviceDescriptor`): the device descriptor containing
+               the type and id of the device where training takes place.
+            callback (func (minibatch_index, timings)): optional function called
+               after every minibatch; training stops early if it returns `False`.
+
+        Returns:
+            :class:`PhaseTimings`: the accumulated timings of this call
+        '''
+        if not device:
+            device = use_default_device()
+
+        timings = PhaseTimings()
+        prefetcher = _MinibatchPrefetcher(
+            self.mb_source, self.schedule, self.model_inputs_to_streams,
+            self.max_samples, self.prefetch_depth, self.num_data_partitions,
+            self.partition_index, device, timings)
+
+        step_timings = getattr(self.trainer, 'step_timings', None)
+
+        start = time.time()
+        prefetcher.start()
+        try:
+            while True:
+                wait_start = time.time()
+                mb = prefetcher.queue.get()
+                wait = time.time() - wait_start
+                timings.data_wait += wait
+                if step_timings is not None:
+                    step_timings.data_wait += wait
+
+                if mb is _END_OF_DATA:
+                    break
+
+                train_start = time.time()
+                self.trainer.train_minibatch(mb, device=device)
+                timings.train += time.time() - train_start
+
+                timings.minibatches += 1
+                timings.samples += self.trainer.previous_minibatch_sample_count
+
+                if callback is not None and callback(timings.minibatches - 1, timings) == False:
+                    break
+        finally:
+            prefetcher.stop()
+            timings.total = time.time() - start
+
+        if prefetcher.error is not None:
+            # keep the traceback of the reader thread
+            _reraise(prefetcher.error)
+
+        self.timings = timings
+        return timings
+
+
+def _data_partition(trainer):
+    for learner in trainer.parameter_learners:
+        if isinstance(learner, DistributedLearner):
+            communicator = learner.communicator()
+            return len(communicator.workers()), communicator.current_worker().global_rank
+    return 1, 0
+
+
+def pipelined_training(trainer, mb_source, mb_size, model_inputs_to_streams,
+                       max_samples=None, prefetch_depth=2,
+                       num_data_partitions=None, partition_index=None):
+    '''
+    A factory function to create a pipelined training driver.
+
+    Example:
+        >>> # assuming trainer, reader and input_map have been set up
+        >>> session = pipelined_training(trainer, reader, 64, input_map) # doctest: +SKIP
+        >>> print(session.train()) # doctest: +SKIP
+
+    Args:
+        trainer (:class:`~cntk.train.trainer.Trainer`): trainer
+        mb_source (:class:`~cntk.io.MinibatchSource`): minibatch source used for training
+        mb_size (:class:`~cntk.cntk_py.minibatch_size_schedule` or int): minibatch schedule for training
+        model_inputs_to_streams (dict): mapping between input variables and input streams
+        max_samples (int): maximum number of samples this worker trains on
+        prefetch_depth (int): number of minibatches read ahead of training
+        num_data_partitions (int): number of data partitions; defaults to the
+         number of workers of the trainer's distributed learner, if any
+        partition_index (int): partition read by this worker; defaults to the
+         rank of this worker in the distributed learner's communicator
+
+    Returns:
+        Instance of :class:`~PipelinedTrainer`
+    '''
+    workers, rank = _data_partition(trainer)
+    if num_data_partitions is None:
+        num_data_partitions = workers
+
+    if partition_index is None:
+        partition_index = rank
+
+    return PipelinedTrainer(trainer, mb_source, mb_size, model_inputs_to_streams,
+                            max_samples, prefetch_depth, num_data_partitions, partition_index)
@@ -0,0 +1,46 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+import pytest
+from cntk import parameter
+from .. import distributed_benchmark as bench
+
+
+def test_gradient_bytes():
+    params = [parameter(shape=(3, 64)), parameter(shape=(64,))]
+    assert bench.gradient_bytes(params) == (3 * 64 + 64) * 4
+    # 64 rows at one bit fit in two words, plus two float bounds per column
+    assert bench.gradient_bytes(params, 1) == 3 * (2 * 4 + 8) + (2 * 4 + 8)
+
+    with pytest.raises(ValueError):
+        bench.gradient_bytes(params, 0)
+
+
+def test_bytes_per_step():
+    params = [parameter(shape=(10, 10))]
+    full = bench.gradient_bytes(params)
+
+    data_parallel = bench.LearnerConfiguration('dp', distributed_after=100)
+    assert data_parallel.bytes_per_step(params, 2, 0, 64) == 0
+    assert data_parallel.bytes_per_step(params, 2, 64, 128) == full
+    assert data_parallel.bytes_per_step(params, 1, 64, 128) == 0
+
+    block_momentum = bench.LearnerConfiguration('bm', kind='block_momentum', block_size=100)
+    assert block_momentum.bytes_per_step(params, 4, 0, 64) == 0
+    assert block_momentum.bytes_per_step(params, 4, 64, 128) == 3 * full // 2
+
+    with pytest.raises(ValueError):
+        bench.LearnerConfiguration('bm', kind='block_momentum')
+
+
+def test_run_configuration():
+    result = bench.run_configuration(bench.LearnerConfiguration('dp'),
+                                     num_steps=3, minibatch_size=8,
+                                     input_dim=4, hidden_dim=8, num_classes=2)
+    assert result['name'] == 'dp'
+    assert len(result['step_times']) == 3
+    assert len(result['losses']) == 3
+    assert len(result['bytes_per_step']) == 3
@@ -0,0 +1,104 @@
+# Copyright (c) Microsoft. All rights reserved.
+
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+import threading
+import pytest
+from cntk.ops.tests.ops_test_utils import cntk_device
+from cntk.io import INFINITELY_REPEAT
+from .training_session_test import mb_source, create_sample_model
+import cntk as C
+
+
+def test_pipelined_training_max_samples(tmpdir, device_id):
+    device = cntk_device(device_id)
+    t, feature, label = create_sample_model(device)
+    mbs = mb_source(tmpdir, "training", max_samples=INFINITELY_REPEAT)
+
+    input_map = {
+        feature: mbs.streams.features,
+        label: mbs.streams.labels
+    }
+
+    timings = C.pipelined_training(
+        trainer=t, mb_source=mbs,
+        model_inputs_to_streams=input_map,
+        mb_size=4, max_samples=20
+    ).train(device)
+
+    assert(t.total_number_of_samples_seen == 21)
+    assert(timings.samples == 21)
+    assert(timings.minibatches > 0)
+    assert(timings.total >= timings.train)
+
+
+def test_pipelined_training_full_sweep(tmpdir, device_id):
+    device = cntk_device(device_id)
+    t, feature, label = create_sample_model(device)
+    mbs = mb_source(tmpdir, "training")
+
+    input_map = {
+        feature: mbs.streams.features,
+        label: mbs.streams.labels
+    }
+
+    session = C.pipelined_training(t, mbs, 4, input_map, prefetch_depth=3)
+    session.train(device)
+
+    # a full sweep over the 25 samples of the test data
+    assert(t.total_number_of_samples_seen == 25)
+    assert(session.timings.samples == 25)
+
+
+def test_pipelined_training_callback_stops(tmpdir, device_id):
+    device = cntk_device(device_id)
+    t, feature, label = create_sample_model(device)
+    mbs = mb_source(tmpdir, "training", max_samples=INFINITELY_REPEAT)
+
+    input_map = {
+        feature: mbs.streams.features,
+        label: mbs.streams.labels
+    }
+
+    indices = []
+    def callback(index, timings):
+        indices.append(index)
+        return index < 2
+
+    timings = C.pipelined_training(t, mbs, 4, input_map).train(device, callback)
+
+    assert(indices == [0, 1, 2])
+    assert(timings.minibatches == 3)
+
+    # the reader thread has finished although the queue was full
+    from cntk.train.pipeline import _MinibatchPrefetcher
+    assert(not any(isinstance(thread, _MinibatchPrefetcher) for thread in threading.enumerate()))
+
+
+def test_pipelined_training_reader_error(tmpdir, device_id):
+    device = cntk_device(device_id)
+    t, feature, label = create_sample_model(device)
+    mbs = mb_source(tmpdir, "training")
+
+    class FailingSource(object):
+        def next_minibatch(self, *args, **kwargs):
+            raise RuntimeError('reader failed')
+
+    with pytest.raises(RuntimeError) as info:
+        C.pipelined_training(t, FailingSource(), 4, {feature: mbs.streams.features}).train(device)
+
+    # the traceback ends where the reader thread raised
+    assert(info.traceback[-1].name == 'next_minibatch')
+
+
+def test_pipelined_training_invalid_args(tmpdir):
+    t, feature, label = create_sample_model(cntk_device(-1))
+    mbs = mb_source(tmpdir, "training")
+
+    with pytest.raises(ValueError):
+        C.pipelined_training(t, mbs, 4, {})
+
+    with pytest.raises(ValueError):
+        C.pipelined_training(t, mbs, 4, {feature: mbs.streams.features}, prefetch_depth=0)
@@ -47,6 +47,34 @@ def test_trainer(tmpdir, no_eval_function):
     assert trainer.model.__doc__
     assert isinstance(trainer.parameter_learners[0], C.Learner)
 
+def test_trainer_step_timings(tmpdir):
+    in1 = C.input_variable(shape=(1,))
+    labels = C.input_variable(shape=(1,))
+    p = parameter(shape=(2,), init=10)
+    z = plus(in1, reduce_sum(p), name='z')
+    ce = cross_entropy_with_softmax(z, labels)
+    lr_per_sample = C.learning_rate_schedule(0.007, C.UnitType.sample)
+    trainer = C.Trainer(z, (ce, None), [C.sgd(z.parameters, lr_per_sample)])
+    arguments = {in1: [[1], [2]], labels: [[0], [1]]}
+
+    for _ in range(3):
+        trainer.train_minibatch(arguments)
+
+    timings = trainer.step_timings
+    assert timings.minibatches == 3
+    assert timings.samples == 6
+    assert timings.compute > 0
+    assert 0 <= trainer.previous_minibatch_update_time <= timings.sync
+
+    snapshot = timings.copy()
+    trainer.save_checkpoint(str(tmpdir / 'checkpoint.dat'))
+    delta = timings - snapshot
+    assert delta.checkpoint > 0
+    assert delta.minibatches == 0
+
+    timings.reset()
+    assert timings.samples == 0 and timings.compute == 0
+
 def test_output_to_retain():
     in1 = C.input_variable(shape=(1,))
     labels = C.input_variable(shape=(1,))
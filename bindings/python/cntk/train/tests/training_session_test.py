@@ -5,6 +5,7 @@
 # ==============================================================================
 
 import os
+import pytest
 
 from os import listdir
 from os.path import isfile, join
@@ -244,6 +245,68 @@ def test_session_progress_print(tmpdir, device_id):
     assert(writer.training_summary_counter == 6)
 
 
+def test_session_step_timings(tmpdir, device_id):
+    device = cntk_device(device_id)
+    t, feature, label = create_sample_model(device)
+    mbs = mb_source(tmpdir, "training", max_samples=INFINITELY_REPEAT)
+    mbs1 = mb_source(tmpdir, "cv")
+
+    input_map = {
+        feature: mbs.streams.features,
+        label: mbs.streams.labels
+    }
+
+    C.training_session(
+        trainer=t, mb_source=mbs,
+        mb_size=4, model_inputs_to_streams=input_map,
+        max_samples=60,
+        checkpoint_config = C.CheckpointConfig(frequency=35,
+                                             filename=str(tmpdir / "checkpoint_timings")),
+        cv_config = C.CrossValidationConfig(source=mbs1, frequency=20)
+    ).train(device)
+
+    timings = t.step_timings
+    assert(timings.samples == t.total_number_of_samples_seen)
+    assert(timings.minibatches > 0)
+    assert(timings.compute > 0)
+    assert(timings.sync >= 0)
+    assert(timings.data_wait >= 0)
+    assert(timings.checkpoint > 0)
+    assert(timings.cross_validation > 0)
+
+
+def test_session_progress_print_step_timings(tmpdir, device_id):
+    from cntk.logging import ProgressPrinter
+    device = cntk_device(device_id)
+    logfile = str(tmpdir / "timings_log.txt")
+    printer = ProgressPrinter(freq=4, log_to_file=logfile, log_step_timings=True)
+    t, feature, label = create_sample_model(device, printer)
+    mbs = mb_source(tmpdir, "training", max_samples=INFINITELY_REPEAT)
+
+    input_map = {
+        feature: mbs.streams.features,
+        label: mbs.streams.labels
+    }
+
+    C.training_session(
+        trainer=t, mb_source=mbs,
+        mb_size=4, model_inputs_to_streams=input_map,
+        max_samples=60, progress_frequency=20
+    ).train(device)
+
+    with open(logfile) as f:
+        lines = f.read().splitlines()
+
+    updates = [l for l in lines if 'Minibatch[' in l]
+    summaries = [l for l in lines if l.startswith('Finished Epoch')]
+    assert(len(updates) > 0 and len(summaries) > 0)
+    for line in updates + summaries:
+        assert('samples/s, data wait = ' in line)
+        assert('compute = ' in line and 'sync = ' in line and 'checkpoint = ' in line)
+    for line in summaries:
+        assert('cross validation = ' in line)
+
+
 def test_session_restart_from_end_checkpoint(tmpdir, device_id):
     device = cntk_device(device_id)
     writer = MockProgressWriter()
@@ -509,3 +572,98 @@ def test_session_with_test(tmpdir, device_id):
     assert(t.total_number_of_samples_seen == 61)
     assert(writer.test_summary_counter == 1)
 
+
+def test_mb_size_tuner_chooses_fastest():
+    tuner = C.MinibatchSizeTuner([8, 2, 4], updates_per_candidate=3, warmup_updates=1)
+    assert(tuner.candidates == [2, 4, 8])
+
+    writer = MockProgressWriter()
+    written = []
+    writer.write = lambda key, value: written.append((key, value))
+
+    now = 0.0
+    # 2 -> 2 samples/s, 4 -> 8 samples/s, 8 -> 4 samples/s
+    for size, step_time in [(2, 1.0), (4, 0.5), (8, 2.0)]:
+        for _ in range(3):
+            assert(tuner.current_size == size)
+            now += step_time
+            tuner.on_minibatch_end(now, size, [writer])
+
+    assert(tuner.done)
+    assert(tuner.chosen_size == 4)
+    assert(tuner.current_size == 4)
+    assert([m['samples_per_second'] for m in tuner.measurements] == [2.0, 8.0, 4.0])
+    assert(written[-1] == ('mb_size_tuner/chosen_minibatch_size', 4))
+
+
+def test_mb_size_tuner_without_warmup():
+    tuner = C.MinibatchSizeTuner([2, 4], updates_per_candidate=2, warmup_updates=0)
+
+    now = 0.0
+    # 2 -> 2 samples/s, 4 -> 8 samples/s
+    for size, step_time in [(2, 1.0), (4, 0.5)]:
+        for _ in range(2):
+            now += step_time
+            tuner.on_minibatch_end(now, size, start=now - step_time)
+
+    assert(tuner.chosen_size == 4)
+    assert([m['samples_per_second'] for m in tuner.measurements] == [2.0, 8.0])
+
+
+def test_mb_size_tuner_memory_limit(monkeypatch):
+    # peak memory before probing, after the first and after the second candidate
+    peaks = iter([100, 150, 400])
+    monkeypatch.setattr(sys.modules['cntk.train.training_session'], '_peak_memory', lambda: next(peaks))
+    tuner = C.MinibatchSizeTuner([2, 4], updates_per_candidate=2, warmup_updates=0, memory_limit=100)
+
+    now = 0.0
+    # the larger candidate is faster, but grows the peak memory by 300 bytes
+    for size in [2, 2, 4, 4]:
+        now += 1.0
+        tuner.on_minibatch_end(now, size, start=now - 1.0)
+
+    assert([m['memory_increase'] for m in tuner.measurements] == [50, 250])
+    assert([m['memory_growth'] for m in tuner.measurements] == [50, 300])
+    assert(tuner.chosen_size == 2)
+
+
+def test_mb_size_tuner_invalid_args():
+    with pytest.raises(ValueError):
+        C.MinibatchSizeTuner([])
+    with pytest.raises(ValueError):
+        C.MinibatchSizeTuner([4], updates_per_candidate=2, warmup_updates=2)
+    with pytest.raises(ValueError):
+        C.MinibatchSizeTuner([4], warmup_updates=-1)
+    with pytest.raises(ValueError):
+        C.MinibatchSizeTuner([4], lr_unit=C.UnitType.minibatch)
+    with pytest.raises(ValueError):
+        C.MinibatchSizeTuner([4, 2.5])
+
+
+def test_mb_size_tuner_integral_candidates():
+    import numpy as np
+    tuner = C.MinibatchSizeTuner([np.int64(8), np.int32(4)])
+    assert(tuner.candidates == [4, 8])
+    assert(all(type(c) is int for c in tuner.candidates))
+
+
+def test_session_mb_size_tuner(tmpdir, device_id):
+    device = cntk_device(device_id)
+    t, feature, label = create_sample_model(device)
+    mbs = mb_source(tmpdir, "training", max_samples=INFINITELY_REPEAT)
+
+    input_map = {
+        feature: mbs.streams.features,
+        label: mbs.streams.labels
+    }
+
+    tuner = C.MinibatchSizeTuner([2, 4, 8], updates_per_candidate=3, warmup_updates=1)
+    C.training_session(
+        trainer=t, mb_source=mbs,
+        mb_size=4, model_inputs_to_streams=input_map,
+        max_samples=200, mb_size_tuner=tuner
+    ).train(device)
+
+    assert(tuner.done)
+    assert(tuner.chosen_size in [2, 4, 8])
+    assert(len(tuner.measurements) == 3)
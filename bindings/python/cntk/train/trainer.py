@@ -4,6 +4,7 @@
 # for full license information.
 # ==============================================================================
 
+import time
 from .. import cntk_py
 from ..device import use_default_device
 from cntk.internal import sanitize_var_map, sanitize_function, typemap, \
@@ -19,6 +20,73 @@ using gradients of parameters w.r.t. a training objective.
 '''
 
 
+class StepTimings(object):
+    '''
+    Accumulated wall-clock time in seconds spent in the phases of training
+    steps. A :class:`Trainer` owns an instance, which is updated by
+    :meth:`Trainer.train_minibatch`, by :class:`~cntk.train.training_session.TrainingSession`
+    and by :class:`~cntk.train.pipeline.PipelinedTrainer`, and which progress
+    writers can report from (see :class:`~cntk.logging.progress_print.ProgressPrinter`).
+
+    Attributes:
+        data_wait (float): time blocked waiting for the next minibatch
+        compute (float): time in forward and backward passes
+        sync (float): time in the parameter update, including the aggregation
+         of gradients across workers in distributed training
+        checkpoint (float): time spent saving checkpoints
+        cross_validation (float): time spent in cross validation
+        samples (int): number of samples trained on
+        minibatches (int): number of minibatches trained on
+    '''
+
+    _fields = ('data_wait', 'compute', 'sync', 'checkpoint', 'cross_validation', 'samples', 'minibatches')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        '''
+        Sets all accumulators to zero.
+        '''
+        self.data_wait = 0.0
+        self.compute = 0.0
+        self.sync = 0.0
+        self.checkpoint = 0.0
+        self.cross_validation = 0.0
+        self.samples = 0
+        self.minibatches = 0
+
+    def add_minibatch(self, step_time, sync_time, samples):
+        '''
+        Accounts for one trained minibatch.
+
+        Args:
+            step_time (float): wall-clock time of the whole training step
+            sync_time (float): part of ``step_time`` spent in the parameter update
+            samples (int): number of samples in the minibatch
+        '''
+        sync_time = min(sync_time, step_time)
+        self.compute += step_time - sync_time
+        self.sync += sync_time
+        self.samples += samples
+        self.minibatches += 1
+
+    def copy(self):
+        '''
+        Returns a snapshot of the current values.
+        '''
+        result = StepTimings()
+        for field in StepTimings._fields:
+            setattr(result, field, getattr(self, field))
+        return result
+
+    def __sub__(self, other):
+        result = StepTimings()
+        for field in StepTimings._fields:
+            setattr(result, field, getattr(self, field) - getattr(other, field))
+        return result
+
+
 class Trainer(cntk_py.Trainer):
     '''
     Class for training the model parameters of a models' specified loss function, using the
@@ -74,6 +142,12 @@ class Trainer(cntk_py.Trainer):
         # transplant into this class instance
         self.__dict__ = trainer.__dict__
 
+        self._progress_writers = progress_writers
+        self.step_timings = StepTimings()
+        for writer in progress_writers:
+            if hasattr(writer, 'attach_step_timings'):
+                writer.attach_step_timings(self.step_timings)
+
     # TODO: bring this back once the design has been settled
     def _train_test_mb_map_args(self, *args, **kwargs):
         '''helper function for mimicking Python calling convention in train/test_minibatch()'''
@@ -149,6 +223,7 @@ class Trainer(cntk_py.Trainer):
             value = next(iter(arguments.values()))
             contains_minibatch_data = isinstance(value, MinibatchData)
 
+        start = time.time()
         if outputs:
             output_map = {v: None for v in outputs}
 
@@ -158,6 +233,7 @@ class Trainer(cntk_py.Trainer):
             else:
                 updated = super(Trainer, self).train_minibatch(arguments,
                     output_map, device)
+            self._record_step_time(start)
 
             for k, v in output_map.items():
                 output_map[k] = _value_as_sequence_or_array(v, k)
@@ -171,9 +247,16 @@ class Trainer(cntk_py.Trainer):
             else:
                 updated = super(Trainer, self).train_minibatch(arguments,
                     device)
+            self._record_step_time(start)
 
         return updated
 
+    def _record_step_time(self, start):
+        timings = getattr(self, 'step_timings', None)
+        if timings is not None:
+            timings.add_minibatch(time.time() - start, self.previous_minibatch_update_time,
+                                  self.previous_minibatch_sample_count)
+
     def test_minibatch(self, arguments, device=None):
         '''
         Test the model on the specified batch of samples using the evaluation
@@ -234,7 +317,11 @@ class Trainer(cntk_py.Trainer):
             filename (str): filename to store the checkpoint.
         '''
 
+        start = time.time()
         super(Trainer, self).save_checkpoint(filename, _py_dict_to_cntk_dict(external_state))
+        timings = getattr(self, 'step_timings', None)
+        if timings is not None:
+            timings.checkpoint += time.time() - start
 
     def restore_from_checkpoint(self, filename):
         '''
@@ -300,6 +387,14 @@ class Trainer(cntk_py.Trainer):
         '''
         return super(Trainer, self).previous_minibatch_sample_count()
 
+    @property
+    def previous_minibatch_update_time(self):
+        '''
+        The time in seconds the last minibatch spent in the parameter update,
+        including the aggregation of gradients across workers in distributed training
+        '''
+        return super(Trainer, self).previous_minibatch_update_time()
+
     @property
     def total_number_of_samples_seen(self):
         '''
@@ -4,6 +4,8 @@
 # ==============================================================================
 
 import sys
+import time
+import numbers
 from .. import cntk_py
 from ..device import use_default_device
 from cntk.internal import sanitize_var_map, sanitize_function, typemap
@@ -112,6 +114,196 @@ class TestConfig(cntk_py.TestConfig):
 
         super(TestConfig, self).__init__(source, schedule)
 
+class MinibatchSizeTuner(object):
+    '''
+    Automatic minibatch size selection for a :class:`TrainingSession`.
+
+    During the first updates of training, the session trains
+    ``updates_per_candidate`` minibatches with each of the ``candidates`` in
+    ascending order and measures the throughput in samples per second and how
+    much each candidate grows the peak resident memory of the process.
+    Afterwards it settles on the candidate with the highest throughput that
+    stayed within ``memory_limit`` and uses it for the rest of training. Measurements and the chosen size are written to the
+    trainer's progress writers through their ``write`` method.
+
+    Probing starts from the current model parameters, so the probe updates are
+    regular training updates. With learning rates specified per sample
+    (:attr:`~cntk.learners.UnitType.sample`) the per-sample step is the same
+    for every candidate. Learning rates specified per minibatch would change
+    the effective step with the minibatch size; for ``lr_unit=UnitType.minibatch``
+    the current per-minibatch learning rate of every learner is therefore
+    converted into the equivalent per-sample rate at ``reference_size``
+    before probing starts. Note that this replaces a multi-value learning rate
+    schedule by its current value.
+
+    Args:
+        candidates (list of int): minibatch sizes to probe
+        updates_per_candidate (int): number of minibatches trained with each candidate
+        warmup_updates (int): number of the first minibatches of every candidate that
+         are not measured, e.g. to exclude memory allocation
+        memory_limit (int or None): maximum growth in bytes of the peak resident
+         memory of the process since probing started. Since the candidates are
+         probed in ascending order, this is the additional host memory needed by
+         the largest candidate probed so far. Candidates exceeding it are not
+         chosen. Only measured on platforms providing the ``resource`` module;
+         device (GPU) memory cannot be queried from Python and is not accounted for.
+        lr_unit (:class:`~cntk.learners.UnitType`): unit of the learners' learning rates
+        reference_size (int or None): minibatch size the learning rates were tuned for;
+         required if ``lr_unit`` is :attr:`~cntk.learners.UnitType.minibatch`
+    '''
+
+    def __init__(self, candidates, updates_per_candidate=10, warmup_updates=2,
+                 memory_limit=None, lr_unit=None, reference_size=None):
+        from ..learners import UnitType
+        if not candidates:
+            raise ValueError("At least one candidate minibatch size must be specified.")
+
+        if any(not isinstance(c, numbers.Integral) or c <= 0 for c in candidates):
+            raise ValueError("Candidate minibatch sizes must be positive integers.")
+
+        if warmup_updates < 0:
+            raise ValueError("warmup_updates must not be negative.")
+
+        if warmup_updates >= updates_per_candidate:
+            raise ValueError("updates_per_candidate must be larger than warmup_updates.")
+
+        if lr_unit is None:
+            lr_unit = UnitType.sample
+
+        if UnitType(lr_unit) is UnitType.minibatch and not reference_size:
+            raise ValueError("reference_size must be specified for per-minibatch learning rates.")
+
+        self.candidates = sorted(set(int(c) for c in candidates))
+        self.updates_per_candidate = updates_per_candidate
+        self.warmup_updates = warmup_updates
+        self.memory_limit = memory_limit
+        self.lr_unit = UnitType(lr_unit)
+        self.reference_size = reference_size
+        self.measurements = []
+        self.chosen_size = None
+
+        self._index = 0
+        self._updates = 0
+        self._start = None
+        self._samples = 0
+        self._last_end = None
+        self._memory_baseline = None
+        self._candidate_memory = None
+
+    @property
+    def done(self):
+        '''
+        Whether probing has finished and :attr:`chosen_size` is set.
+        '''
+        return self.chosen_size is not None
+
+    @property
+    def current_size(self):
+        '''
+        The minibatch size to use for the next minibatch.
+        '''
+        if self.done:
+            return self.chosen_size
+        return self.candidates[self._index]
+
+    def start(self, trainer):
+        '''
+        Prepares the learners of ``trainer`` for probing. Called by the
+        training session before training starts.
+        '''
+        from ..learners import UnitType, learning_rate_schedule
+        if self.lr_unit is UnitType.minibatch:
+            for learner in trainer.parameter_learners:
+                per_sample = learner.learning_rate() / self.reference_size
+                learner.reset_learning_rate(learning_rate_schedule(per_sample, UnitType.sample))
+        self._memory_baseline = _peak_memory()
+        self._candidate_memory = self._memory_baseline
+
+    def on_minibatch_end(self, now, samples, writers=(), start=None):
+        '''
+        Accounts for one trained minibatch of the current candidate.
+
+        Args:
+            now (float): time at which the minibatch finished
+            samples (int): number of samples in the minibatch
+            writers (list): progress writers to report measurements to
+            start (float or None): time at which the minibatch started. If not
+             given, the end of the previous minibatch is used instead.
+        '''
+        if self.done:
+            return
+
+        if self._memory_baseline is None and self._index == 0 and self._updates == 0:
+            # start() was not called, the first minibatch is already included
+            self._memory_baseline = _peak_memory()
+            self._candidate_memory = self._memory_baseline
+
+        if self._updates == self.warmup_updates:
+            # the clock starts with the first measured minibatch
+            self._start = start if start is not None else self._last_end
+            self._samples = 0
+        self._updates += 1
+        self._last_end = now
+        if self._updates > self.warmup_updates:
+            if self._start is None:
+                # the start of the very first minibatch is unknown, measure from its end
+                self._start = now
+            else:
+                self._samples += samples
+
+        if self._updates == self.updates_per_candidate:
+            elapsed = now - self._start
+            peak = _peak_memory()
+            measurement = {
+                'minibatch_size': self.candidates[self._index],
+                'samples_per_second': self._samples / elapsed if elapsed > 0 else 0.0,
+                # growth of the process peak during this candidate, and since probing started
+                'memory_increase': _difference(peak, self._candidate_memory),
+                'memory_growth': _difference(peak, self._memory_baseline)
+            }
+            self._candidate_memory = peak
+            self.measurements.append(measurement)
+            for writer in writers:
+                writer.write('mb_size_tuner/samples_per_second[{}]'.format(measurement['minibatch_size']),
+                             measurement['samples_per_second'])
+
+            self._index += 1
+            self._updates = 0
+            self._start = None
+            if self._index == len(self.candidates):
+                self._choose(writers)
+
+    def _choose(self, writers):
+        admissible = [m for m in self.measurements
+                      if self.memory_limit is None or m['memory_growth'] is None
+                      or m['memory_growth'] <= self.memory_limit]
+        if not admissible:
+            # nothing fits, fall back to the smallest candidate
+            admissible = self.measurements[:1]
+        best = max(admissible, key=lambda m: m['samples_per_second'])
+        self.chosen_size = best['minibatch_size']
+        for writer in writers:
+            writer.write('mb_size_tuner/chosen_minibatch_size', self.chosen_size)
+
+
+def _difference(peak, baseline):
+    if peak is None or baseline is None:
+        return None
+    return peak - baseline
+
+
+def _peak_memory():
+    # peak resident set size of this process in bytes over its whole lifetime, None if unavailable.
+    # It never decreases, so only differences between two calls describe a part of training.
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
 class TrainingSession(cntk_py.TrainingSession):
     '''
     The instance of the class should be created by using :func:`~cntk.train.training_session.training_session` function.
@@ -130,13 +322,17 @@ class TrainingSession(cntk_py.TrainingSession):
         checkpoint_config (:class:`CheckpointConfig`): checkpoint configuration
         cv_config (:class:`CrossValidationConfig`): cross validation configuration
         test_config (:class:`TestConfig`): test configuration
+        mb_size_tuner (:class:`MinibatchSizeTuner` or `None`): if given, the minibatch size is chosen
+          automatically during the first updates and ``mb_size`` is not used. Requires a
+          session created by :func:`training_session`.
     '''
     def __init__(self, trainer, mb_source, mb_size,
                  model_inputs_to_streams, max_samples,
                  progress_frequency, 
                  checkpoint_config,
                  cv_config,
-                 test_config):
+                 test_config,
+                 mb_size_tuner=None):
 
         if trainer is None:
             raise ValueError("Trainer must not be None.")
@@ -148,6 +344,9 @@ class TrainingSession(cntk_py.TrainingSession):
             raise ValueError(
                 "Mapping between input vars and streams should not be empty.")
 
+        if mb_size_tuner is not None and not isinstance(self, cntk_py.TunableTrainingSession):
+            raise ValueError("A minibatch size tuner requires a session created by training_session().")
+
         if max_samples is None:
             max_samples = sys.maxsize
 
@@ -167,6 +366,14 @@ class TrainingSession(cntk_py.TrainingSession):
         if cv_config is not None:
             self.cv_callback = cv_config.callback
 
+        self._trainer = trainer
+        self.mb_size_tuner = mb_size_tuner
+        self.step_timings = getattr(trainer, 'step_timings', None)
+        self._minibatch_start = None
+        self._last_minibatch_end = None
+        self._action_start = None
+        self._action_time = 0.0
+
         super(TrainingSession, self).__init__(trainer, mb_source, schedule,
             model_inputs_to_streams, max_samples,  
             progress_frequency, 
@@ -187,8 +394,81 @@ class TrainingSession(cntk_py.TrainingSession):
         if not device:
             device = use_default_device()
 
+        if self.mb_size_tuner is not None:
+            self.mb_size_tuner.start(self._trainer)
+
+        self._last_minibatch_end = time.time()
+        self._action_time = 0.0
         super(TrainingSession, self).train(device)
 
+    def on_minibatch_start(self):
+        '''
+        Callback that gets executed before training on every minibatch.
+        '''
+        self._minibatch_start = time.time()
+        if self.step_timings is not None and self._last_minibatch_end is not None:
+            # everything since the previous minibatch that was neither a
+            # checkpoint nor cross validation was spent reading data
+            self.step_timings.data_wait += max(0.0,
+                self._minibatch_start - self._last_minibatch_end - self._action_time)
+        self._action_time = 0.0
+
+    def on_minibatch_end(self):
+        '''
+        Callback that gets executed after training on every minibatch.
+
+        Returns:
+            True if training should continue, False otherwise.
+        '''
+        self._last_minibatch_end = time.time()
+        if self.step_timings is not None and self._minibatch_start is not None:
+            self.step_timings.add_minibatch(self._last_minibatch_end - self._minibatch_start,
+                                            self._trainer.previous_minibatch_update_time,
+                                            self._trainer.previous_minibatch_sample_count)
+        if self.mb_size_tuner is not None:
+            self.mb_size_tuner.on_minibatch_end(self._last_minibatch_end,
+                                                self._trainer.previous_minibatch_sample_count,
+                                                getattr(self._trainer, '_progress_writers', []),
+                                                self._minibatch_start)
+        return True
+
+    def on_checkpoint_start(self, index):
+        '''
+        Callback that gets executed before saving a checkpoint.
+
+        Args:
+            index (int): index of the current checkpoint.
+        '''
+        self._action_start = time.time()
+
+    def on_checkpoint_end(self, index):
+        '''
+        Callback that gets executed after saving a checkpoint.
+
+        Args:
+            index (int): index of the current checkpoint.
+        '''
+        elapsed = self._end_action()
+        if self.step_timings is not None:
+            self.step_timings.checkpoint += elapsed
+
+    def on_cross_validation_start(self, index):
+        '''
+        Callback that gets executed at the start of cross validation.
+
+        Args:
+            index (int): index of the current callback.
+        '''
+        self._action_start = time.time()
+
+    def _end_action(self):
+        if self._action_start is None:
+            return 0.0
+        elapsed = time.time() - self._action_start
+        self._action_start = None
+        self._action_time += elapsed
+        return elapsed
+
     def on_cross_validation_end(self, index, average_error, num_samples, num_minibatches):
         '''
         Callback that gets executed at the end of cross validation.
@@ -202,6 +482,10 @@ class TrainingSession(cntk_py.TrainingSession):
         Returns:
             True if training should continue, False otherwise.
         '''
+        elapsed = self._end_action()
+        if self.step_timings is not None:
+            self.step_timings.cross_validation += elapsed
+
         if self.cv_callback is not None:
             return self.cv_callback(index, average_error, num_samples, num_minibatches)
         else:
@@ -250,6 +534,20 @@ def minibatch_size_schedule(schedule, epoch_size=1):
     raise ValueError(
         'schedule must be either a float or a list, not %s' % type(schedule))
 
+class _TunedTrainingSession(TrainingSession, cntk_py.TunableTrainingSession):
+    '''
+    Training session that takes the size of every minibatch from its
+    :class:`MinibatchSizeTuner`. Only this session calls into Python for the
+    minibatch size, a plain :class:`TrainingSession` reads it from its schedule.
+    '''
+
+    def get_minibatch_size(self):
+        '''
+        Returns the size of the next minibatch from the minibatch size tuner.
+        '''
+        return self.mb_size_tuner.current_size
+
+
 @typemap
 def training_session(trainer,                          
                      mb_source, 
@@ -259,7 +557,8 @@ def training_session(trainer,
                      max_samples=None,
                      checkpoint_config=None,
                      cv_config=None,
-                     test_config=None):
+                     test_config=None,
+                     mb_size_tuner=None):
     '''
     A factory function to create a training session object.
 
@@ -273,6 +572,7 @@ def training_session(trainer,
         checkpoint_config (:class:`~CheckpointConfig`): checkpoint configuration
         cv_config (:class:`~CrossValidationConfig`): cross validation configuration
         test_config (:class:`~TestConfig`): test configuration
+        mb_size_tuner (:class:`~MinibatchSizeTuner`): optional automatic minibatch size selection
 
     Returns:
         Instance of :class:`~TrainingSession`
@@ -286,5 +586,7 @@ def training_session(trainer,
     if test_config is None:
        test_config = TestConfig(source=None)
 
-    return TrainingSession(trainer, mb_source, mb_size, model_inputs_to_streams, max_samples,
-                           progress_frequency, checkpoint_config, cv_config, test_config)
+    session = TrainingSession if mb_size_tuner is None else _TunedTrainingSession
+    return session(trainer, mb_source, mb_size, model_inputs_to_streams, max_samples,
+                   progress_frequency, checkpoint_config, cv_config, test_config,
+                   mb_size_tuner)
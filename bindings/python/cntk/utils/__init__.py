@@ -3,4 +3,9 @@
 # for full license information.
 # ==============================================================================
 
-from .optimized_rnnstack_converter import *
\ No newline at end of file
+from .optimized_rnnstack_converter import *
+from .constant_folding import *
+from .batch_normalization_folding import *
+from .quantization import *
+from .fused_recurrence import *
+from .incremental_decoding import *
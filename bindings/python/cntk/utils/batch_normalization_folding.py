@@ -0,0 +1,200 @@
+# ==============================================================================
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+import numpy as np
+import cntk as C
+from .constant_folding import _verify
+
+
+def _inner_functions(func):
+    '''
+    The functions ``func`` consists of, looking through blocks and ignoring
+    the combine nodes ``identity`` activations create.
+    '''
+    if not func.is_block:
+        return [func]
+    functions = C.logging.graph.depth_first_search(func.block_root,
+            lambda x: isinstance(x, C.Function) and not x.is_block, depth=-1)
+    return [f for f in functions if f.op_name != 'Combine']
+
+
+def _constant_value(var):
+    return var.as_constant().value
+
+
+def _batch_normalization(func):
+    '''
+    Returns the batch normalization primitive ``func`` consists of, or
+    ``None``.
+    '''
+    inner = _inner_functions(func)
+    if len(inner) == 1 and inner[0].op_name == 'BatchNormalization' and \
+            all(i.is_constant for i in inner[0].inputs[1:]):
+        return inner[0]
+    return None
+
+
+def _affine(func):
+    '''
+    If ``func`` is a ``Times`` or ``Convolution`` by constant weights,
+    optionally followed by the addition of a constant bias, as created by
+    :func:`~cntk.layers.layers.Dense` and
+    :func:`~cntk.layers.layers.Convolution` without activation, returns
+    the ``Times`` or ``Convolution`` primitive, its operand, its weights and
+    its bias (or ``None``). Otherwise returns ``None``.
+    '''
+    inner = _inner_functions(func)
+    ops = [f for f in inner if f.op_name in ('Times', 'Convolution')]
+    if len(ops) != 1:
+        return None
+    op = ops[0]
+    if op.op_name == 'Convolution' and op.attributes.get('transpose', False):
+        return None
+
+    # Function.inputs lists the operands of times in Python order, so that
+    # the weights of x @ W come last, while they come first for convolution
+    if op.op_name == 'Times':
+        operand, weights = op.inputs
+    else:
+        weights, operand = op.inputs
+    if not weights.is_constant or operand.is_constant:
+        return None
+
+    bias = None
+    rest = [f for f in inner if f.uid != op.uid]
+    if len(rest) == 1 and rest[0].op_name == 'Plus':
+        operands = rest[0].inputs
+        if operands[0].uid == op.output.uid and operands[1].is_constant:
+            bias = operands[1]
+        elif operands[1].uid == op.output.uid and operands[0].is_constant:
+            bias = operands[0]
+        else:
+            return None
+    elif rest:
+        return None
+
+    return op, operand, weights, bias
+
+
+def _find_foldable(model):
+    '''
+    Finds a batch normalization of ``model`` fed by a function
+    :func:`_affine` accepts.
+    '''
+    for func in C.logging.graph.depth_first_search(model,
+            lambda x: isinstance(x, C.Function), depth=0):
+        bn = _batch_normalization(func)
+        if bn is None:
+            continue
+        operands = [i for i in func.inputs if not i.is_constant]
+        if len(operands) != 1 or not operands[0].is_output:
+            continue
+        producer = operands[0].owner
+        affine = _affine(producer)
+        if affine is None:
+            continue
+        producer_inputs = [i for i in producer.inputs if not i.is_constant]
+        if len(producer_inputs) != 1 or not _shapes(bn, *affine):
+            continue
+        return func, bn, producer_inputs[0], affine
+    return None
+
+
+def _shapes(bn, op, operand, weights, bias):
+    '''
+    Returns the shapes the normalization statistics and the weights of
+    ``op`` are reshaped to for folding ``bn`` into ``op``, or ``None`` if
+    the normalization cannot be expressed by scaling the weights.
+    '''
+    spatial = bn.attributes['spatial']
+    norm_size = int(np.prod(bn.inputs[1].shape))
+    output_shape = op.output.shape
+    if op.op_name == 'Convolution':
+        # only a normalization per output channel scales the kernels
+        if not spatial or norm_size != output_shape[0]:
+            return None
+        norm_shape = (output_shape[0],) + (1,) * (len(output_shape) - 1)
+        weights_shape = (output_shape[0],) + (1,) * (len(weights.shape) - 1)
+    else:
+        if spatial or norm_size != int(np.prod(output_shape)) or \
+                weights.shape[len(weights.shape) - len(output_shape):] != output_shape:
+            return None
+        norm_shape = weights_shape = output_shape
+
+    if bias is not None and int(np.prod(bias.shape)) != int(np.prod(norm_shape)):
+        return None
+    return norm_shape, weights_shape
+
+
+def _folded_parameters(bn, op, operand, weights, bias):
+    '''
+    Computes the weights and the bias of the affine function equivalent to
+    ``op`` followed by ``bn`` in inference mode.
+    '''
+    norm_shape, weights_shape = _shapes(bn, op, operand, weights, bias)
+    scale, beta, mean, variance = [_constant_value(i).astype(np.float64).reshape(norm_shape)
+                                   for i in bn.inputs[1:5]]
+    W = _constant_value(weights)
+    b = 0 if bias is None else _constant_value(bias).reshape(norm_shape)
+
+    k = scale / np.sqrt(variance + bn.attributes['epsilon'])
+    new_weights = W * k.reshape(weights_shape)
+    new_bias = (b - mean) * k + beta
+    return new_weights.astype(W.dtype), new_bias.astype(W.dtype)
+
+
+def fold_batch_normalization(model, arguments=None, device=None,
+                             rtol=1e-4, atol=1e-5):
+    '''
+    Creates an inference-only clone of ``model`` in which every batch
+    normalization that directly follows a ``Times`` or ``Convolution``
+    with constant weights, such as a :func:`~cntk.layers.layers.Dense` or
+    :func:`~cntk.layers.layers.Convolution` layer without activation, is
+    folded into the weights and the bias of that layer.
+
+    In inference mode a batch normalization applies
+    ``(y - mean) / sqrt(variance + epsilon) * scale + bias`` with its
+    aggregate statistics, which is affine in ``y``. Folding it saves a full
+    pass over the activations. Convolutions can only absorb spatial
+    (``map_rank=1``) batch normalization. All parameters of the clone are
+    frozen.
+
+    Args:
+        model (:class:`~cntk.ops.functions.Function`): the model to optimize
+        arguments: if given, the clone is evaluated on these arguments of
+         ``model`` and compared to ``model`` in inference mode. A
+         ``ValueError`` is raised if the outputs differ.
+        device (:class:`~cntk.device.DeviceDescriptor`): device of the
+         verification
+        rtol (float): relative tolerance of the verification
+        atol (float): absolute tolerance of the verification
+
+    Returns:
+        :class:`~cntk.ops.functions.Function`: the optimized clone
+    '''
+    optimized = model.clone(C.CloneMethod.freeze)
+
+    # rewrite one normalization at a time, since cloning creates new nodes
+    # for all the ones found before the rewrite
+    while True:
+        found = _find_foldable(optimized)
+        if found is None:
+            break
+
+        func, bn, producer_input, affine = found
+        op, operand, weights, _ = affine
+        new_weights, new_bias = _folded_parameters(bn, *affine)
+
+        ph = C.placeholder()
+        folded = C.as_composite(op).clone(C.CloneMethod.share,
+                {weights: C.constant(new_weights, name=weights.name), operand: ph})
+        folded.replace_placeholders({ph: producer_input})
+        folded = C.plus(folded, C.constant(new_bias, name='folded_bias'), name=func.name)
+        optimized = optimized.clone(C.CloneMethod.share, {func.output: folded.output})
+
+    if arguments is not None:
+        _verify(model, optimized, arguments, device, rtol, atol)
+
+    return optimized
@@ -0,0 +1,146 @@
+# ==============================================================================
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+import numpy as np
+import cntk as C
+
+# ops whose output is not a pure function of their inputs
+_NON_FOLDABLE_OPS = set(['Dropout', 'RandomSample', 'RandomSampleInclusionFrequency',
+                         'Assign', 'BatchNormalization', 'Combine'])
+
+
+def _is_foldable_op(func):
+    '''
+    Whether ``func`` is a deterministic built-in function, including blocks
+    that only contain such functions. User functions are never folded.
+    '''
+    if func.is_block:
+        inner = C.logging.graph.depth_first_search(func.block_root,
+                lambda x: isinstance(x, C.Function) and not _is_foldable_op(x), depth=-1)
+        return not inner
+    return func.is_primitive and func.op_name not in _NON_FOLDABLE_OPS
+
+
+def _constant_outputs(model):
+    '''
+    Finds the outputs of the maximal subgraphs of ``model`` that only depend
+    on constants and that are consumed by a function which does not.
+    '''
+    functions = C.logging.graph.depth_first_search(model,
+            lambda x: isinstance(x, C.Function), depth=0)
+
+    # resolve the producers of the inputs of every function before the
+    # function itself, without recursion since models can be deep
+    constant = {}
+    for func in functions:
+        stack = [func]
+        while stack:
+            f = stack[-1]
+            if f.uid in constant:
+                stack.pop()
+                continue
+            pending = [i.owner for i in f.inputs
+                       if i.is_output and i.owner.uid not in constant]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            constant[f.uid] = _is_foldable_op(f) and \
+                all(not o.dynamic_axes for o in f.outputs) and \
+                all(i.is_constant or (i.is_output and constant[i.owner.uid])
+                    for i in f.inputs)
+
+    outputs = {}
+    for func in functions:
+        if constant[func.uid]:
+            continue
+        for i in func.inputs:
+            if i.is_output and constant[i.owner.uid]:
+                outputs[i.uid] = i
+    return list(outputs.values())
+
+
+def _eval(model, arguments, device):
+    result = model.eval(arguments, outputs=model.outputs, device=device)
+    if not isinstance(result, dict):
+        result = {model.outputs[0]: result}
+    return result
+
+
+def _verify(model, optimized, arguments, device, rtol, atol):
+    expected = _eval(model, arguments, device)
+    if isinstance(arguments, dict):
+        # folding does not touch the arguments nor the order they are found in
+        arguments = dict((new, arguments[original]) for original, new in
+                         zip(model.arguments, optimized.arguments))
+    actual = _eval(optimized, arguments, device)
+
+    for original, new in zip(model.outputs, optimized.outputs):
+        e, a = expected[original], actual[new]
+        if isinstance(e, list):
+            same = len(e) == len(a) and all(np.allclose(x, y, rtol=rtol, atol=atol)
+                                            for x, y in zip(e, a))
+        else:
+            same = np.allclose(e, a, rtol=rtol, atol=atol)
+        if not same:
+            raise ValueError('the optimized model differs from the original '
+                             'in output "%s"' % original.name)
+
+
+def fold_constants(model, outputs=None, arguments=None, device=None,
+                   rtol=1e-5, atol=1e-6):
+    '''
+    Optimizes ``model`` for inference by precomputing every subgraph that
+    only depends on constants (including parameters frozen with
+    :attr:`~cntk.ops.functions.CloneMethod.freeze`) into a single
+    :class:`~cntk.variables.Constant`, and by dropping the outputs that are
+    not in ``outputs`` together with all nodes only they depend on.
+
+    Random, stateful and user functions are never folded. The parameters
+    and the remaining constants are shared with ``model``.
+
+    Args:
+        model (:class:`~cntk.ops.functions.Function`): the model to optimize
+        outputs (list, defaults to all outputs of ``model``): the outputs
+         to keep, given as output variables or by name
+        arguments: if given, the optimized model is evaluated on these
+         arguments of ``model`` (in any form accepted by
+         :meth:`~cntk.ops.functions.Function.eval`) and compared to
+         ``model``. A ``ValueError`` is raised if the outputs differ.
+        device (:class:`~cntk.device.DeviceDescriptor`): device to compute
+         the folded constants and the verification on
+        rtol (float): relative tolerance of the verification
+        atol (float): absolute tolerance of the verification
+
+    Returns:
+        :class:`~cntk.ops.functions.Function`: the optimized model
+    '''
+    if outputs is not None:
+        kept = []
+        for o in outputs:
+            if isinstance(o, str):
+                matches = [x for x in model.outputs if x.name == o]
+                if len(matches) != 1:
+                    raise ValueError('model has %d outputs named "%s"' % (len(matches), o))
+                o = matches[0]
+            elif o not in model.outputs:
+                raise ValueError('%s is not an output of the model' % o)
+            kept.append(o)
+        model = C.combine(kept)
+
+    substitutions = {}
+    for output in _constant_outputs(model):
+        value = C.as_composite(output.owner).eval({}, outputs=[output], device=device)
+        value = np.asarray(value[output] if isinstance(value, dict) else value)
+        substitutions[output] = C.constant(value.reshape(output.shape),
+                                           dtype=output.dtype,
+                                           name=output.owner.name)
+
+    optimized = model.clone(C.CloneMethod.share, substitutions) if substitutions else model
+
+    if arguments is not None:
+        _verify(model, optimized, arguments, device, rtol, atol)
+
+    return optimized
@@ -0,0 +1,261 @@
+# ==============================================================================
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+import numpy as np
+import cntk as C
+from cntk.ops.functions import UserFunction
+
+# primitives of the LSTM and GRU blocks of cntk.layers with tanh activation,
+# without stabilizers
+_RECURRENT_BLOCK_OPS = set(['Times', 'Plus', 'Minus', 'Slice', 'Sigmoid', 'StableSigmoid',
+                            'Tanh', 'ElementTimes', 'Combine'])
+_RECURRENT_BLOCK_PARAMETERS = {
+    'LSTM': set(['W', 'H', 'b', 'Ci', 'Cf', 'Co', 'P']),
+    'GRU': set(['W', 'H', 'b', 'H1', 'P']),
+}
+# the tanh activations in a step, which tells them apart from other activations
+_RECURRENT_BLOCK_TANH = {'LSTM': 2, 'GRU': 1}
+
+
+def _sigmoid(x):
+    # tanh based, which cannot overflow
+    return 0.5 * np.tanh(0.5 * x) + 0.5
+
+
+def _reversal(lengths, steps):
+    '''
+    Indices that reverse the valid steps of every padded sequence.
+    '''
+    t = np.arange(steps)
+    lengths = np.asarray(lengths)[:, np.newaxis]
+    return np.where(t < lengths, lengths - 1 - t, t)
+
+
+class FusedRecurrence(UserFunction):
+    '''
+    The CPU recurrence of an LSTM or GRU step function of
+    :mod:`cntk.layers`, evaluated as a whole instead of one step of
+    primitive operations at a time.
+
+    The input projections of all steps of all sequences are computed with
+    a single matrix product. Each step then needs one matrix product of the
+    hidden state with all packed gate matrices, followed by the gate
+    nonlinearities computed on the whole batch of sequences at once.
+
+    This function is meant for inference and does not compute gradients.
+    Use :func:`convert_to_fused_recurrence` to create it from a model.
+
+    Args:
+        x (:class:`~cntk.variables.Variable`): the input sequence
+        cell_type (str): ``'LSTM'`` or ``'GRU'``
+        weights (dict): values of the parameters of the step function by
+         their name in :func:`~cntk.layers.blocks.LSTM` or
+         :func:`~cntk.layers.blocks.GRU`
+        initial_state (list): initial value of every state variable
+        go_backwards (bool): whether the recurrence runs from the end of
+         the sequences
+        name (str): the name of the function
+    '''
+    parallel_safe = True
+
+    def __init__(self, x, cell_type, weights, initial_state, go_backwards=False,
+                 name='fused_recurrence'):
+        if cell_type not in _RECURRENT_BLOCK_PARAMETERS:
+            raise ValueError('unsupported recurrent cell type "%s"' % cell_type)
+        self.cell_type = cell_type
+        self.weights = weights
+        self.initial_state = initial_state
+        self.go_backwards = go_backwards
+        super(FusedRecurrence, self).__init__([x], name=name, padded_sequences=True)
+
+    def infer_outputs(self):
+        x = self.inputs[0]
+        return [C.output_variable(self.weights['H'].shape[:1], x.dtype, x.dynamic_axes)]
+
+    def _lstm(self, projections, h, c, out):
+        w = self.weights
+        H = w['H']
+        dim = H.shape[1] // 4
+        Ci, Cf, Co, P = w.get('Ci'), w.get('Cf'), w.get('Co'), w.get('P')
+        for t in range(projections.shape[1]):
+            proj = projections[:, t] + h.dot(H)
+            i = proj[:, 0:dim]
+            f = proj[:, 2*dim:3*dim]
+            if Ci is not None:
+                i = i + Ci * c
+                f = f + Cf * c
+            c = _sigmoid(f) * c + _sigmoid(i) * np.tanh(proj[:, dim:2*dim])
+            o = proj[:, 3*dim:4*dim]
+            if Co is not None:
+                o = o + Co * c
+            h = _sigmoid(o) * np.tanh(c)
+            if P is not None:
+                h = h.dot(P)
+            out[:, t] = h
+
+    def _gru(self, projections, h, out):
+        w = self.weights
+        H, H1, P = w['H'], w['H1'], w.get('P')
+        dim = H1.shape[1]
+        for t in range(projections.shape[1]):
+            proj = projections[:, t]
+            proj_h = h.dot(H)
+            z = _sigmoid(proj[:, 0:dim] + proj_h[:, 0:dim])
+            r = _sigmoid(proj[:, dim:2*dim] + proj_h[:, dim:2*dim])
+            c = np.tanh(proj[:, 2*dim:3*dim] + (h * r).dot(H1))
+            h = (1 - z) * c + z * h
+            if P is not None:
+                h = h.dot(P)
+            out[:, t] = h
+
+    def forward(self, argument, device=None, outputs_to_retain=None):
+        data = argument.data
+        num_sequences, steps = argument.mask.shape
+        dtype = np.dtype(self.inputs[0].dtype)
+
+        rows = np.arange(num_sequences)[:, np.newaxis]
+        if self.go_backwards:
+            order = _reversal(argument.lengths, steps)
+            data = data[rows, order]
+
+        # one matrix product for the input contribution of all steps
+        W = self.weights['W']
+        projections = data.reshape(num_sequences * steps, -1).dot(
+            W.reshape(-1, W.shape[-1])) + self.weights['b']
+        projections = projections.reshape(num_sequences, steps, -1).astype(dtype)
+
+        out = np.empty((num_sequences, steps) + self.outputs[0].shape, dtype=dtype)
+        h = np.zeros((num_sequences, self.weights['H'].shape[0]), dtype=dtype) + \
+            self.initial_state[0]
+        if self.cell_type == 'LSTM':
+            c = np.zeros((num_sequences, self.weights['H'].shape[1] // 4), dtype=dtype) + \
+                self.initial_state[1]
+            self._lstm(projections, h, c, out)
+        else:
+            self._gru(projections, h, out)
+
+        if self.go_backwards:
+            out = out[rows, order]
+        return None, out
+
+    def backward(self, state, root_gradients):
+        raise ValueError('FusedRecurrence is for inference only and has no gradient')
+
+    def clone(self, cloned_inputs):
+        return FusedRecurrence(cloned_inputs[0], self.cell_type, self.weights,
+                               self.initial_state, self.go_backwards, self.name)
+
+    def serialize(self):
+        return {'cell_type': self.cell_type,
+                'weights': dict(self.weights),
+                'initial_state': [np.asarray(s) for s in self.initial_state],
+                'go_backwards': self.go_backwards}
+
+    @staticmethod
+    def deserialize(inputs, name, state):
+        def _array(value):
+            return value.asarray() if hasattr(value, 'asarray') else np.asarray(value)
+        weights = dict((k, _array(v)) for k, v in state['weights'].items())
+        initial_state = [_array(s) for s in state['initial_state']]
+        return FusedRecurrence(inputs[0], state['cell_type'], weights, initial_state,
+                               bool(state['go_backwards']), name)
+
+
+def _consumers(model):
+    '''
+    Maps the uid of every variable of ``model`` to the functions consuming it.
+    '''
+    consumers = {}
+    for func in C.logging.graph.depth_first_search(model,
+            lambda x: isinstance(x, C.Function), depth=0):
+        for i in func.inputs:
+            consumers.setdefault(i.uid, []).append(func)
+    return consumers
+
+
+def _find_recurrence(model):
+    '''
+    Finds an LSTM or GRU block of ``model`` that runs in a
+    :func:`~cntk.layers.sequence.Recurrence` and can be fused. Returns the
+    block, its input and its initial states and direction.
+    '''
+    consumers = _consumers(model)
+    model_outputs = set(o.uid for o in model.outputs)
+    for func in C.logging.graph.depth_first_search(model,
+            lambda x: isinstance(x, C.Function) and x.is_block and \
+                      x.op_name in _RECURRENT_BLOCK_PARAMETERS, depth=0):
+        inner = C.logging.graph.depth_first_search(func.block_root,
+                lambda x: isinstance(x, C.Function), depth=-1)
+        if any(f.op_name not in _RECURRENT_BLOCK_OPS for f in inner) or \
+                len([f for f in inner if f.op_name == 'Tanh']) != \
+                _RECURRENT_BLOCK_TANH[func.op_name]:
+            continue
+        # unnamed constants are literals like the 1 in 1 - z
+        names = [c.name for c in func.constants if c.name]
+        if len(set(names)) != len(names) or \
+                not set(names) <= _RECURRENT_BLOCK_PARAMETERS[func.op_name]:
+            continue
+
+        arguments = [actual for _, actual in func.block_arguments_mapping
+                     if not actual.is_constant]
+        states, x = arguments[:-1], arguments[-1]
+        if len(states) != len(func.outputs) or x.is_sparse:
+            continue
+
+        # every state has to be the delayed output of the same index
+        initial_state = []
+        directions = set()
+        delays = set()
+        for state, output in zip(states, func.outputs):
+            delay = state.owner if state.is_output else None
+            if delay is None or delay.op_name not in ('PastValue', 'FutureValue') or \
+                    delay.inputs[0].uid != output.uid or not delay.inputs[1].is_constant or \
+                    delay.attributes.get('offset', 1) != 1:
+                break
+            directions.add(delay.op_name)
+            delays.add(delay.uid)
+            initial_state.append(delay.inputs[1].as_constant().value)
+        else:
+            # only the first output of the fused recurrence is available
+            if len(directions) == 1 and all(
+                    all(c.uid in delays for c in consumers.get(o.uid, []))
+                    and o.uid not in model_outputs for o in func.outputs[1:]):
+                return func, x, initial_state, directions.pop() == 'FutureValue'
+    return None
+
+
+def convert_to_fused_recurrence(model):
+    '''
+    Creates a frozen inference clone of ``model`` in which every
+    :func:`~cntk.layers.sequence.Recurrence` of an
+    :func:`~cntk.layers.blocks.LSTM` or :func:`~cntk.layers.blocks.GRU`
+    with ``tanh`` activation, without self-stabilization and with constant
+    initial states is replaced by a :class:`FusedRecurrence`.
+
+    This is the opposite direction of
+    :func:`~cntk.utils.optimized_rnnstack_converter.convert_optimized_rnnstack`
+    for CPU inference.
+
+    Args:
+        model (:class:`~cntk.ops.functions.Function`): the model to convert
+
+    Returns:
+        :class:`~cntk.ops.functions.Function`: the converted clone
+    '''
+    converted = model.clone(C.CloneMethod.freeze)
+
+    # rewrite one recurrence at a time, since cloning creates new nodes
+    while True:
+        found = _find_recurrence(converted)
+        if found is None:
+            break
+        func, x, initial_state, go_backwards = found
+
+        weights = dict((c.name, c.value) for c in func.constants if c.name)
+        fused = C.user_function(FusedRecurrence(x, func.op_name, weights, initial_state,
+                                                go_backwards, name=func.name))
+        converted = converted.clone(C.CloneMethod.share, {func.outputs[0]: fused.output})
+
+    return converted
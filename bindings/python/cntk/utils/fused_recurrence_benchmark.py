@@ -0,0 +1,113 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+from __future__ import print_function
+import sys
+import time
+import numpy as np
+
+from .fused_recurrence import convert_to_fused_recurrence
+
+__doc__ = '''\
+Throughput benchmark of :func:`~cntk.utils.fused_recurrence.convert_to_fused_recurrence`
+on a text model.
+
+The model embeds one-hot encoded words, runs them through a recurrence of an
+LSTM or GRU and predicts the next word with a dense layer. It is evaluated on
+the CPU as built with :mod:`cntk.layers` and after the conversion. Run it
+with::
+
+    python -m cntk.utils.fused_recurrence_benchmark
+'''
+
+
+def create_text_model(vocab_dim=2000, embedding_dim=128, hidden_dim=256, cell_type='LSTM'):
+    '''
+    Creates the benchmark model.
+
+    Returns:
+        tuple: the input variable and the model
+    '''
+    import cntk as C
+    cell = {'LSTM': C.layers.LSTM, 'GRU': C.layers.GRU}[cell_type]
+    x = C.sequence.input_variable(vocab_dim, is_sparse=True)
+    with C.layers.default_options(init=C.glorot_uniform(seed=1)):
+        model = C.layers.Sequential([
+            C.layers.Embedding(embedding_dim),
+            C.layers.Recurrence(cell(hidden_dim)),
+            C.layers.Dense(vocab_dim)])(x)
+    return x, model
+
+
+def time_model(x, model, data, repeats, device):
+    '''
+    Number of sequence steps per second evaluated by ``model``.
+    '''
+    # the first pass includes graph compilation and memory allocation
+    model.eval({x: data}, device=device)
+    start = time.time()
+    for _ in range(repeats):
+        model.eval({x: data}, device=device)
+    elapsed = (time.time() - start) / repeats
+    return sum(len(seq) for seq in data) / elapsed
+
+
+def run_benchmark(vocab_dim=2000, embedding_dim=128, hidden_dim=256, cell_type='LSTM',
+                  num_sequences=32, sequence_length=50, repeats=5, seed=0):
+    '''
+    Measures the throughput of the text model before and after the
+    conversion on the CPU.
+
+    Returns:
+        `dict` with the keys ``'primitive'`` and ``'fused'`` (sequence steps
+        per second), ``'speedup'`` and ``'max_abs_error'`` between the
+        outputs of both models
+    '''
+    from cntk import Value
+    from cntk.device import cpu
+    x, model = create_text_model(vocab_dim, embedding_dim, hidden_dim, cell_type)
+    fused = convert_to_fused_recurrence(model)
+
+    rng = np.random.RandomState(seed)
+    lengths = rng.randint(sequence_length // 2, sequence_length + 1, size=num_sequences)
+    data = Value.one_hot([rng.randint(vocab_dim, size=l).tolist() for l in lengths],
+                         vocab_dim, device=cpu())
+
+    fused_x = fused.arguments[0]
+    expected = model.eval({x: data}, device=cpu())
+    actual = fused.eval({fused_x: data}, device=cpu())
+    error = max(float(np.abs(e - a).max()) for e, a in zip(expected, actual))
+
+    primitive_time = time_model(x, model, data, repeats, cpu())
+    fused_time = time_model(fused_x, fused, data, repeats, cpu())
+    return {'primitive': primitive_time, 'fused': fused_time,
+            'speedup': fused_time / primitive_time if primitive_time > 0 else 0.0,
+            'max_abs_error': error}
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="CNTK fused recurrence benchmark")
+    parser.add_argument('-c', '--cell', choices=['LSTM', 'GRU'], default='LSTM',
+                        help='recurrent cell (default: %(default)s)')
+    parser.add_argument('-v', '--vocab_dim', type=int, default=2000,
+                        help='vocabulary size (default: %(default)s)')
+    parser.add_argument('-d', '--hidden_dim', type=int, default=256,
+                        help='hidden dimension (default: %(default)s)')
+    parser.add_argument('-n', '--num_sequences', type=int, default=32,
+                        help='sequences per minibatch (default: %(default)s)')
+    parser.add_argument('-l', '--sequence_length', type=int, default=50,
+                        help='maximum sequence length (default: %(default)s)')
+    parser.add_argument('-r', '--repeats', type=int, default=5,
+                        help='number of timed passes (default: %(default)s)')
+
+    args = parser.parse_args(sys.argv[1:])
+    result = run_benchmark(args.vocab_dim, hidden_dim=args.hidden_dim, cell_type=args.cell,
+                           num_sequences=args.num_sequences,
+                           sequence_length=args.sequence_length, repeats=args.repeats)
+    print("{}: primitive {:0.0f} steps/s, fused {:0.0f} steps/s, speedup {:0.2f}x "
+          "(max abs error {:0.2e})".format(
+        args.cell, result['primitive'], result['fused'], result['speedup'],
+        result['max_abs_error']))
@@ -0,0 +1,227 @@
+# ==============================================================================
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+import time
+import numpy as np
+import cntk as C
+
+
+def _recurrence_delays(model):
+    '''
+    Finds the delays that feed the state of every
+    :func:`~cntk.layers.sequence.Recurrence` of ``model`` back to its next
+    step, and checks that they can be decoded one step at a time.
+    '''
+    delays = C.logging.graph.depth_first_search(model,
+            lambda x: isinstance(x, C.Function) and x.op_name in ('PastValue', 'FutureValue'), depth=0)
+    if not delays:
+        raise ValueError('the model has no recurrence to decode')
+    for delay in delays:
+        if delay.op_name == 'FutureValue':
+            raise ValueError('a recurrence running backwards cannot be decoded incrementally')
+        if delay.attributes.get('offset', 1) != 1:
+            raise ValueError('only delays of one step can be decoded incrementally, found %d' %
+                             delay.attributes['offset'])
+        if not delay.inputs[1].is_constant:
+            raise ValueError('the initial state of a recurrence to decode incrementally must be constant')
+    return delays
+
+
+class DecodingSession(object):
+    '''
+    Runs a model made of :func:`~cntk.layers.sequence.Recurrence` layers
+    one token at a time, on a batch of independent streams, keeping the
+    recurrent state between the calls.
+
+    The delays that feed the state of each recurrence back to its next step
+    are replaced by inputs, and the states they delay become additional
+    outputs. Every call to :meth:`step` then evaluates a single step of all
+    streams with one ``forward``, and the session feeds the new states to
+    the next call. The states are NumPy arrays, which allows to reset or
+    reorder the streams, e.g. for beam search.
+
+    Example:
+     >>> x = C.sequence.input_variable(4)
+     >>> model = C.layers.Sequential([C.layers.Recurrence(C.layers.GRU(3)),
+     ...                              C.layers.Dense(4)])(x)
+     >>> session = DecodingSession(model, num_streams=2)
+     >>> session.step([1, 3]).shape
+     (2, 4)
+     >>> len(session.latencies)
+     1
+
+    Args:
+        model (:class:`~cntk.ops.functions.Function`): a model with a single
+         sequence input, whose recurrences run forward with constant initial
+         states. The model is shared, not copied, so the session sees the
+         current values of its parameters.
+        num_streams (int): number of streams decoded together
+        sparse_input (bool): whether the tokens are fed as sparse one-hot
+         vectors. By default the input is sparse if the input of ``model``
+         is. A dense input of ``model`` can be replaced by a sparse one if
+         the model only multiplies it with weights, e.g. in an
+         :func:`~cntk.layers.layers.Embedding`.
+        device (:class:`~cntk.device.DeviceDescriptor`): the device to
+         evaluate the model on
+    '''
+
+    def __init__(self, model, num_streams=1, sparse_input=None, device=None):
+        if len(model.arguments) != 1:
+            raise ValueError('DecodingSession requires a model with a single input, found %d' %
+                             len(model.arguments))
+        x = model.arguments[0]
+        if sparse_input is None:
+            sparse_input = x.is_sparse
+        delays = _recurrence_delays(model)
+
+        self._input = C.input_variable(x.shape, x.dtype, is_sparse=sparse_input,
+                                       dynamic_axes=x.dynamic_axes, name=x.name)
+        self._state_inputs = [C.input_variable(d.output.shape, d.output.dtype,
+                                               dynamic_axes=d.output.dynamic_axes)
+                              for d in delays]
+        self._initial_states = [np.asarray(d.inputs[1].as_constant().value, dtype=d.output.dtype)
+                                for d in delays]
+
+        # the outputs of the model, followed by the states to feed to the next step
+        outputs = []
+        uids = {}
+        for var in list(model.outputs) + [d.inputs[0] for d in delays]:
+            uids.setdefault(var.uid, len(outputs))
+            if uids[var.uid] == len(outputs):
+                outputs.append(var)
+        substitutions = {x: self._input}
+        substitutions.update(zip([d.output for d in delays], self._state_inputs))
+        self._step = C.combine(outputs).clone(C.CloneMethod.share, substitutions)
+        self._model_outputs = [self._step.outputs[uids[o.uid]] for o in model.outputs]
+        self._state_outputs = [self._step.outputs[uids[d.inputs[0].uid]] for d in delays]
+
+        self._device = device
+        self._latencies = []
+        self._num_streams = 0
+        self._states = []
+        self.reset(num_streams=num_streams)
+
+    @property
+    def num_streams(self):
+        '''
+        The number of streams decoded together.
+        '''
+        return self._num_streams
+
+    @property
+    def states(self):
+        '''
+        The current recurrent states, one array of shape
+        ``(num_streams, 1) + state shape`` per delayed state of the model.
+        '''
+        return self._states
+
+    @property
+    def latencies(self):
+        '''
+        The duration in seconds of every call to :meth:`step` since the
+        last :meth:`reset`, each of which decodes one token of every stream.
+        '''
+        return np.array(self._latencies)
+
+    def latency_summary(self):
+        '''
+        Summarizes :attr:`latencies`.
+
+        Returns:
+            `dict` with the mean, median, 90th and 99th percentile and maximum
+            latency per token in milliseconds, and the number of tokens
+            decoded per second over all streams
+        '''
+        latencies = self.latencies * 1000
+        if not len(latencies):
+            return {}
+        return {'mean_ms': float(latencies.mean()),
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p90_ms': float(np.percentile(latencies, 90)),
+                'p99_ms': float(np.percentile(latencies, 99)),
+                'max_ms': float(latencies.max()),
+                'tokens_per_second': 1000.0 * len(latencies) * self._num_streams / latencies.sum()}
+
+    def _initial_state(self, index, num_streams):
+        var = self._state_inputs[index]
+        return np.zeros((num_streams, 1) + var.shape, dtype=var.dtype) + self._initial_states[index]
+
+    def reset(self, streams=None, num_streams=None):
+        '''
+        Restarts streams from the initial states of the recurrences.
+
+        Args:
+            streams (list): indices of the streams to restart. All streams
+             are restarted if not given.
+            num_streams (int): new number of streams. If given, all streams
+             are restarted and the latencies are cleared.
+        '''
+        if num_streams is not None:
+            self._num_streams = num_streams
+            self._states = [self._initial_state(i, num_streams) for i in range(len(self._state_inputs))]
+            self._latencies = []
+            self._dense_input = None
+            return
+
+        if streams is None:
+            streams = np.arange(self._num_streams)
+        for i, state in enumerate(self._states):
+            state[streams] = self._initial_state(i, 1)
+
+    def reorder(self, streams):
+        '''
+        Continues the decoding from the states of the given streams. Stream
+        ``i`` continues from stream ``streams[i]``, so streams can be
+        dropped or duplicated, like the hypotheses of a beam search.
+
+        Args:
+            streams (list): indices of the streams to continue from
+        '''
+        streams = np.asarray(streams, dtype=np.int64)
+        self._states = [state[streams] for state in self._states]
+        if len(streams) != self._num_streams:
+            self._num_streams = len(streams)
+            self._dense_input = None
+
+    def _input_value(self, tokens):
+        if self._input.is_sparse:
+            return C.Value.one_hot(tokens.reshape(-1, 1).tolist(), self._input.shape, device=self._device)
+        if self._dense_input is None:
+            self._dense_input = np.zeros((self._num_streams, 1) + self._input.shape, dtype=self._input.dtype)
+        else:
+            self._dense_input.fill(0)
+        self._dense_input.reshape(self._num_streams, -1)[np.arange(self._num_streams), tokens] = 1
+        return self._dense_input
+
+    def step(self, tokens):
+        '''
+        Feeds one token to every stream and advances the recurrent states.
+
+        Args:
+            tokens (list): the index of the token of every stream in the
+             one-hot encoded input of the model
+
+        Returns:
+            NumPy array of shape ``(num_streams,) + output shape`` with the
+            first output of the model for the tokens, or a list with all
+            outputs if the model has several
+        '''
+        start = time.time()
+        tokens = np.asarray(tokens, dtype=np.int64).reshape(-1)
+        if len(tokens) != self._num_streams:
+            raise ValueError('expected one token per stream (%d), got %d' % (self._num_streams, len(tokens)))
+
+        arguments = {self._input: self._input_value(tokens)}
+        arguments.update(zip(self._state_inputs, self._states))
+        _, values = self._step.forward(arguments, self._step.outputs, device=self._device)
+
+        def _value(var):
+            return np.asarray(values[var], dtype=var.dtype).reshape((self._num_streams, 1) + var.shape)
+
+        self._states = [_value(var) for var in self._state_outputs]
+        outputs = [_value(var)[:, 0] for var in self._model_outputs]
+        self._latencies.append(time.time() - start)
+        return outputs[0] if len(outputs) == 1 else outputs
@@ -0,0 +1,317 @@
+# ==============================================================================
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+import numpy as np
+import cntk as C
+from cntk.ops.functions import UserFunction
+
+
+class QuantizedTimes(UserFunction):
+    '''
+    ``times(x, W)`` on the CPU with ``W`` stored as int8 with one scale per
+    output channel, so that it takes a quarter of the memory of float32
+    weights. The weights are dequantized in blocks of ``block_size``
+    output channels while multiplying, which keeps the dequantized block in
+    the cache instead of materializing ``W``.
+
+    CNTK tensors cannot hold int8 values, which is why the weights are kept
+    in NumPy inside a user function. When saving the model, the int8 weights
+    are packed three to a float32, so a saved quantized model takes about a
+    third of the size of the float32 weights.
+
+    Args:
+        arg (:class:`~cntk.variables.Variable`): the left operand ``x``
+        weights (`np.ndarray` of int8): the quantized weights
+        scale (`np.ndarray`): one scale per output channel, so that
+         ``weights * scale`` approximates ``W``
+        output_rank (int): number of trailing axes of ``weights`` that are
+         output axes
+        block_size (int): number of output channels dequantized at once
+        name (str): the name of the function
+    '''
+
+    def __init__(self, arg, weights, scale, output_rank=1, block_size=256,
+                 name='quantized_times'):
+        self.weights = weights
+        self.scale = scale
+        self.output_rank = output_rank
+        self.block_size = block_size
+        super(QuantizedTimes, self).__init__([arg], name=name)
+
+    @property
+    def _input_shape(self):
+        return self.weights.shape[:self.weights.ndim - self.output_rank]
+
+    @property
+    def _output_shape(self):
+        return self.weights.shape[self.weights.ndim - self.output_rank:]
+
+    def infer_outputs(self):
+        arg = self.inputs[0]
+        map_shape = arg.shape[:len(arg.shape) - len(self._input_shape)]
+        return [C.output_variable(map_shape + self._output_shape, arg.dtype,
+                                  arg.dynamic_axes)]
+
+    def _times(self, x):
+        dtype = np.dtype(self.inputs[0].dtype)
+        in_size = int(np.prod(self._input_shape))
+        q = self.weights.reshape(in_size, -1)
+        leading = x.shape[:len(x.shape) - len(self._input_shape)]
+        if hasattr(x, 'tocsr'):
+            # sparse inputs, for instance the one-hot input of an embedding
+            x = x.tocsr()
+        else:
+            x = np.asarray(x, dtype=dtype).reshape(-1, in_size)
+
+        result = np.empty((x.shape[0], q.shape[1]), dtype=dtype)
+        for start in range(0, q.shape[1], self.block_size):
+            end = start + self.block_size
+            result[:, start:end] = x.dot(q[:, start:end].astype(dtype))
+        result *= self.scale.reshape(-1).astype(dtype)
+        return result.reshape(leading + self._output_shape)
+
+    def _times_transpose(self, g):
+        dtype = g.dtype
+        in_size = int(np.prod(self._input_shape))
+        q = self.weights.reshape(in_size, -1)
+        leading = g.shape[:len(g.shape) - len(self._output_shape)]
+        g = g.reshape(-1, q.shape[1]) * self.scale.reshape(-1).astype(dtype)
+
+        result = np.zeros((g.shape[0], in_size), dtype=dtype)
+        for start in range(0, q.shape[1], self.block_size):
+            end = start + self.block_size
+            result += g[:, start:end].dot(q[:, start:end].astype(dtype).T)
+        return result.reshape(leading + self._input_shape)
+
+    def forward(self, argument, device=None, outputs_to_retain=None):
+        if isinstance(argument, list):
+            return None, [self._times(seq) for seq in argument]
+        return None, self._times(argument)
+
+    def backward(self, state, root_gradients):
+        if isinstance(root_gradients, list):
+            return [self._times_transpose(seq) for seq in root_gradients]
+        return self._times_transpose(root_gradients)
+
+    def clone(self, cloned_inputs):
+        return QuantizedTimes(cloned_inputs[0], self.weights, self.scale,
+                              self.output_rank, self.block_size, self.name)
+
+    def serialize(self):
+        return {'weights': _pack(self.weights),
+                'shape': [int(d) for d in self.weights.shape],
+                'scale': self.scale.astype(np.float32),
+                'output_rank': self.output_rank,
+                'block_size': self.block_size}
+
+    @staticmethod
+    def deserialize(inputs, name, state):
+        def _array(value):
+            return value.asarray() if hasattr(value, 'asarray') else np.asarray(value)
+        shape = tuple(int(d) for d in state['shape'])
+        return QuantizedTimes(inputs[0], _unpack(_array(state['weights']), shape),
+                              _array(state['scale']), int(state['output_rank']),
+                              int(state['block_size']), name)
+
+
+def _pack(q):
+    # CNTK dictionaries only hold floating point tensors. Every float32 holds
+    # the bytes of three int8 values as an integer below 2**24, which float32
+    # represents exactly, instead of their bit pattern, which could be a NaN.
+    data = np.frombuffer(np.ascontiguousarray(q, dtype=np.int8).tobytes(), dtype=np.uint8)
+    data = np.concatenate([data, np.zeros(-len(data) % 3, dtype=np.uint8)])
+    data = data.reshape(-1, 3).astype(np.uint32)
+    return (data[:, 0] | data[:, 1] << 8 | data[:, 2] << 16).astype(np.float32)
+
+
+def _unpack(packed, shape):
+    packed = np.asarray(packed).reshape(-1).astype(np.uint32)
+    data = np.stack([packed & 0xff, packed >> 8 & 0xff, packed >> 16 & 0xff], axis=1)
+    data = data.astype(np.uint8).reshape(-1)[:int(np.prod(shape))]
+    return data.view(np.int8).reshape(shape)
+
+
+def quantize(weights, output_rank=1):
+    '''
+    Quantizes ``weights`` symmetrically to int8 with one scale per output
+    channel, that is per element of the trailing ``output_rank`` axes.
+
+    Returns:
+        tuple: the int8 weights and the scales, of the shape of the output
+        axes
+    '''
+    weights = np.asarray(weights)
+    output_shape = weights.shape[weights.ndim - output_rank:]
+    flat = weights.reshape(-1, int(np.prod(output_shape)))
+    scale = np.abs(flat).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.round(flat / scale), -127, 127).astype(np.int8)
+    return q.reshape(weights.shape), scale.reshape(output_shape).astype(weights.dtype)
+
+
+def _quantizable(times, min_size):
+    if times.op_name != 'Times' or \
+            times.attributes.get('inferInputRankToMap', -1) != -1:
+        return False
+    operand, weights = times.inputs
+    return weights.is_constant and not operand.is_constant and \
+        int(np.prod(weights.shape)) >= min_size
+
+
+def _quantized_times(times, operand, block_size):
+    weights = times.inputs[1].as_constant()
+    output_rank = times.attributes['outputRank']
+    q, scale = quantize(weights.value, output_rank)
+    return C.user_function(QuantizedTimes(operand, q, scale, output_rank,
+                                          block_size, name=times.name))
+
+
+def _find_quantizable(model, min_size):
+    '''
+    Finds a top-level function that is, or is a block containing, a
+    ``Times`` of a non-constant operand by constant weights.
+    '''
+    for func in C.logging.graph.depth_first_search(model,
+            lambda x: isinstance(x, C.Function), depth=0):
+        if not func.is_block:
+            if _quantizable(func, min_size):
+                return func, [func]
+            continue
+        arguments = set(ph.uid for ph, _ in func.block_arguments_mapping)
+        inner = C.logging.graph.depth_first_search(func.block_root,
+                lambda x: isinstance(x, C.Function) and _quantizable(x, min_size), depth=0)
+        # only times of the block arguments can be connected to the actual
+        # arguments when inlining the block
+        inner = [t for t in inner if t.inputs[0].uid in arguments]
+        if inner:
+            return func, inner
+    return None
+
+
+def quantize_weights(model, min_size=1024, block_size=256):
+    '''
+    Creates a frozen inference clone of ``model`` in which every ``times``
+    by constant weights of at least ``min_size`` elements, such as the ones
+    of :func:`~cntk.layers.layers.Dense` and
+    :func:`~cntk.layers.layers.Embedding`, is replaced by a
+    :class:`QuantizedTimes` with int8 weights and per-channel scales. Blocks
+    containing such a ``times`` are inlined.
+
+    Use :func:`compare_quantization` to measure the effect on the accuracy.
+
+    Args:
+        model (:class:`~cntk.ops.functions.Function`): the model to quantize
+        min_size (int): smaller weights are kept in floating point
+        block_size (int): number of output channels dequantized at once
+
+    Returns:
+        :class:`~cntk.ops.functions.Function`: the quantized clone
+    '''
+    quantized = model.clone(C.CloneMethod.freeze)
+
+    # rewrite one function at a time, since cloning creates new nodes
+    while True:
+        found = _find_quantizable(quantized, min_size)
+        if found is None:
+            break
+        func, times_nodes = found
+
+        if not func.is_block:
+            times = times_nodes[0]
+            replacement = _quantized_times(times, times.inputs[0], block_size)
+        else:
+            actual = dict((ph.uid, arg) for ph, arg in func.block_arguments_mapping)
+            substitutions = dict((ph, arg) for ph, arg in func.block_arguments_mapping)
+            for times in times_nodes:
+                substitutions[times.output] = _quantized_times(
+                    times, actual[times.inputs[0].uid], block_size).output
+            replacement = C.as_composite(func.block_root).clone(
+                C.CloneMethod.share, substitutions)
+
+        quantized = quantized.clone(C.CloneMethod.share, {func.output: replacement.output})
+
+    return quantized
+
+
+def compare_quantization(model, quantized, minibatch_source, input_map,
+                         label_stream=None, minibatch_size=64, max_samples=None,
+                         device=None):
+    '''
+    Accuracy-comparison harness for :func:`quantize_weights`. Evaluates
+    ``model`` and its quantized clone on the data of a held-out
+    ``minibatch_source`` and compares their outputs.
+
+    Args:
+        model (:class:`~cntk.ops.functions.Function`): the original model
+         with a single output
+        quantized (:class:`~cntk.ops.functions.Function`): its quantized
+         clone
+        minibatch_source (:class:`~cntk.io.MinibatchSource`): the held-out
+         data, which is read until it ends or ``max_samples`` samples have
+         been evaluated
+        input_map (dict): mapping of the arguments of ``model`` to the
+         streams of ``minibatch_source``
+        label_stream (:class:`~cntk.io.StreamInformation`, optional): one-hot
+         labels to compute the classification accuracy of both models
+        minibatch_size (int): number of samples per minibatch
+        max_samples (int, optional): maximum number of samples to evaluate
+        device (:class:`~cntk.device.DeviceDescriptor`): device to evaluate
+         on
+
+    Returns:
+        `dict` with the number of ``'samples'``, the ``'max_abs_error'``
+        and ``'mean_abs_error'`` of the outputs, the fraction of samples
+        (or sequence steps) on which the arg max of the outputs agrees
+        (``'agreement'``) and, given labels, the ``'accuracy'`` and
+        ``'quantized_accuracy'``
+    '''
+    arguments = dict((a.uid, q) for a, q in zip(model.arguments, quantized.arguments))
+    samples = rows = 0
+    max_abs_error = 0.0
+    abs_error_sum = 0.0
+    num_elements = 0
+    agree = correct = quantized_correct = 0
+
+    while max_samples is None or samples < max_samples:
+        size = minibatch_size if max_samples is None else \
+            min(minibatch_size, max_samples - samples)
+        mb = minibatch_source.next_minibatch(size, device=device)
+        if not mb:
+            break
+
+        expected = model.eval(dict((a, mb[s]) for a, s in input_map.items()),
+                              device=device)
+        actual = quantized.eval(dict((arguments[a.uid], mb[s]) for a, s in input_map.items()),
+                                device=device)
+
+        # flatten sequences into their steps
+        expected = np.concatenate([np.reshape(x, (-1, x.shape[-1])) for x in expected])
+        actual = np.concatenate([np.reshape(x, (-1, x.shape[-1])) for x in actual])
+
+        rows += expected.shape[0]
+        error = np.abs(expected - actual)
+        max_abs_error = max(max_abs_error, float(error.max()))
+        abs_error_sum += float(error.sum())
+        num_elements += error.size
+        agree += int(np.sum(expected.argmax(axis=-1) == actual.argmax(axis=-1)))
+
+        if label_stream is not None:
+            labels = mb[label_stream].as_sequences()
+            labels = np.concatenate([np.reshape(x, (-1, x.shape[-1])) for x in labels])
+            labels = labels.argmax(axis=-1)
+            correct += int(np.sum(expected.argmax(axis=-1) == labels))
+            quantized_correct += int(np.sum(actual.argmax(axis=-1) == labels))
+
+        samples += mb[next(iter(input_map.values()))].num_samples
+
+    total = max(1, rows)
+    result = {'samples': samples,
+              'max_abs_error': max_abs_error,
+              'mean_abs_error': abs_error_sum / max(1, num_elements),
+              'agreement': agree / float(total)}
+    if label_stream is not None:
+        result['accuracy'] = correct / float(total)
+        result['quantized_accuracy'] = quantized_correct / float(total)
+    return result
@@ -0,0 +1,54 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+import numpy as np
+import cntk as C
+
+
+def _num_batch_normalizations(model):
+    return len(C.logging.graph.depth_first_search(model,
+        lambda x: isinstance(x, C.Function) and x.op_name == 'BatchNormalization', depth=-1))
+
+
+def _randomize_statistics(model, rng):
+    for c in model.constants:
+        if c.name in ('aggregate_mean', 'aggregate_variance'):
+            c.value = rng.rand(*c.shape).astype(np.float32) + 0.5
+    for p in model.parameters:
+        if p.name in ('scale', 'bias'):
+            p.value = rng.rand(*p.shape).astype(np.float32)
+
+
+def test_fold_batch_normalization_dense():
+    rng = np.random.RandomState(0)
+    x = C.input_variable(5)
+    with C.layers.default_options(init=C.glorot_uniform(seed=1)):
+        model = C.layers.Sequential([
+            C.layers.Dense(4), C.layers.BatchNormalization(), C.relu,
+            C.layers.Dense(3), C.layers.BatchNormalization()])(x)
+    _randomize_statistics(model, rng)
+
+    data = rng.rand(6, 5).astype(np.float32)
+    folded = C.utils.fold_batch_normalization(model, arguments={x: data})
+
+    assert _num_batch_normalizations(model) == 2
+    assert _num_batch_normalizations(folded) == 0
+    assert not folded.parameters
+
+
+def test_fold_batch_normalization_convolution():
+    rng = np.random.RandomState(0)
+    x = C.input_variable((3, 8, 8))
+    with C.layers.default_options(init=C.glorot_uniform(seed=1)):
+        model = C.layers.Sequential([
+            C.layers.Convolution((3, 3), 4, pad=True), C.layers.BatchNormalization(map_rank=1),
+            C.layers.Convolution((3, 3), 2, activation=C.relu), C.layers.BatchNormalization(map_rank=1)])(x)
+    _randomize_statistics(model, rng)
+
+    data = rng.rand(2, 3, 8, 8).astype(np.float32)
+    folded = C.utils.fold_batch_normalization(model, arguments={x: data})
+
+    # the second convolution has an activation and keeps its normalization
+    assert _num_batch_normalizations(folded) == 1
@@ -0,0 +1,47 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+import pytest
+import numpy as np
+import cntk as C
+
+
+def _num_functions(model):
+    return len(C.logging.graph.depth_first_search(model, lambda x: isinstance(x, C.Function)))
+
+
+def test_fold_constants():
+    x = C.input_variable(3, name='x')
+    w = C.parameter((3, 2), init=C.glorot_uniform(seed=1), name='w')
+    b = C.constant(np.arange(2, dtype=np.float32), name='b')
+    z = C.times(x, C.tanh(w) * 2, name='z') + C.exp(b)
+    other = C.reduce_sum(z, name='other')
+    model = C.combine([z, other]).clone(C.CloneMethod.freeze)
+
+    data = np.random.RandomState(0).rand(4, 3).astype(np.float32)
+    folded = C.utils.fold_constants(model, arguments={model.arguments[0]: data})
+
+    assert _num_functions(folded) < _num_functions(model)
+    expected = model.eval({model.arguments[0]: data}, outputs=model.outputs)
+    actual = folded.eval({folded.arguments[0]: data}, outputs=folded.outputs)
+    for original, new in zip(model.outputs, folded.outputs):
+        assert np.allclose(expected[original], actual[new])
+
+    # parameters are not folded unless frozen
+    trainable = C.utils.fold_constants(z)
+    assert len(trainable.parameters) == 1
+
+
+def test_fold_constants_prunes_outputs():
+    x = C.input_variable(3, name='x')
+    z = C.tanh(x, name='z')
+    model = C.combine([z, C.reduce_sum(z, name='other')])
+
+    pruned = C.utils.fold_constants(model, outputs=['z'])
+    assert len(pruned.outputs) == 1
+    assert _num_functions(pruned) < _num_functions(model)
+
+    with pytest.raises(ValueError):
+        C.utils.fold_constants(model, outputs=['missing'])
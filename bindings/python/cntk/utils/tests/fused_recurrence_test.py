@@ -0,0 +1,63 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+import numpy as np
+import pytest
+import cntk as C
+from cntk.utils.fused_recurrence import convert_to_fused_recurrence
+from cntk.utils.fused_recurrence_benchmark import run_benchmark
+
+
+def _num_blocks(model, op_name):
+    return len(C.logging.graph.depth_first_search(model,
+        lambda x: isinstance(x, C.Function) and x.op_name == op_name, depth=0))
+
+
+def _sequences(dim, lengths, seed=0):
+    rng = np.random.RandomState(seed)
+    return [rng.randn(l, dim).astype(np.float32) for l in lengths]
+
+
+@pytest.mark.parametrize("cell, kwargs, go_backwards", [
+    (C.layers.LSTM, {}, False),
+    (C.layers.LSTM, {}, True),
+    (C.layers.LSTM, {'use_peepholes': True, 'cell_shape': 6}, False),
+    (C.layers.GRU, {}, False),
+    (C.layers.GRU, {}, True),
+])
+def test_convert_to_fused_recurrence(cell, kwargs, go_backwards):
+    x = C.sequence.input_variable(5)
+    with C.layers.default_options(init=C.glorot_uniform(seed=1)):
+        model = C.layers.Sequential([
+            C.layers.Recurrence(cell(4, **kwargs), go_backwards=go_backwards),
+            C.layers.Dense(3)])(x)
+    op_name = 'LSTM' if cell is C.layers.LSTM else 'GRU'
+    fused = convert_to_fused_recurrence(model)
+
+    assert _num_blocks(model, op_name) == 1
+    assert _num_blocks(fused, op_name) == 0
+    assert not fused.parameters
+
+    data = _sequences(5, [7, 3, 5])
+    expected = model.eval({x: data})
+    actual = fused.eval({fused.arguments[0]: data})
+    assert len(expected) == len(actual)
+    for e, a in zip(expected, actual):
+        assert np.allclose(e, a, atol=1e-5)
+
+
+def test_convert_to_fused_recurrence_skips_stabilized_cells():
+    x = C.sequence.input_variable(5)
+    model = C.layers.Recurrence(C.layers.LSTM(4, enable_self_stabilization=True))(x)
+    fused = convert_to_fused_recurrence(model)
+
+    assert _num_blocks(fused, 'LSTM') == 1
+
+
+def test_fused_recurrence_benchmark():
+    result = run_benchmark(vocab_dim=50, embedding_dim=8, hidden_dim=16,
+                           num_sequences=4, sequence_length=6, repeats=1)
+    assert result['primitive'] > 0 and result['fused'] > 0
+    assert result['max_abs_error'] < 1e-4
@@ -0,0 +1,74 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+import numpy as np
+import pytest
+import cntk as C
+from cntk.utils.incremental_decoding import DecodingSession
+
+
+def _model(cell, vocab_dim=6, hidden_dim=4, sparse=False):
+    x = C.sequence.input_variable(vocab_dim, is_sparse=sparse)
+    with C.layers.default_options(init=C.glorot_uniform(seed=1)):
+        layers = [C.layers.Recurrence(cell(hidden_dim)), C.layers.Recurrence(cell(hidden_dim)),
+                  C.layers.Dense(vocab_dim)]
+        if sparse:
+            layers = [C.layers.Embedding(5)] + layers
+        return x, C.layers.Sequential(layers)(x)
+
+
+def _decode(session, sequences):
+    # the outputs of every step of every stream
+    return np.stack([session.step(tokens) for tokens in np.transpose(sequences)], axis=1)
+
+
+@pytest.mark.parametrize("cell, sparse", [
+    (C.layers.LSTM, False),
+    (C.layers.GRU, False),
+    (C.layers.RNNUnit, False),
+    (C.layers.LSTM, True),
+])
+def test_decoding_session(cell, sparse):
+    vocab_dim = 6
+    x, model = _model(cell, vocab_dim, sparse=sparse)
+    sequences = np.random.RandomState(0).randint(vocab_dim, size=(3, 5))
+    one_hot = np.eye(vocab_dim, dtype=np.float32)
+    expected = model.eval({x: C.Value.one_hot(sequences.tolist(), vocab_dim) if sparse else
+                              [one_hot[s] for s in sequences]})
+
+    session = DecodingSession(model, num_streams=3)
+    actual = _decode(session, sequences)
+    assert np.allclose(np.asarray(expected), actual, atol=1e-5)
+    assert len(session.latencies) == 5
+    assert session.latency_summary()['tokens_per_second'] > 0
+
+    # restarting a stream decodes it from scratch again, the others continue
+    session.reset(streams=[1])
+    outputs = session.step([sequences[0, 0]] * 3)
+    assert np.allclose(outputs[1], expected[0][0], atol=1e-5)
+    assert not np.allclose(outputs[0], expected[0][0], atol=1e-5)
+
+
+def test_decoding_session_reorder():
+    vocab_dim = 6
+    x, model = _model(C.layers.LSTM, vocab_dim)
+    sequences = np.random.RandomState(1).randint(vocab_dim, size=(2, 4))
+    session = DecodingSession(model, num_streams=2)
+    _decode(session, sequences[:, :2])
+
+    # continue the second stream twice and drop the first one
+    session.reorder([1, 1])
+    actual = _decode(session, [sequences[1, 2:]] * 2)
+    expected = model.eval({x: [np.eye(vocab_dim, dtype=np.float32)[sequences[1]]]})
+    assert session.num_streams == 2
+    for stream in range(2):
+        assert np.allclose(actual[stream], expected[0][2:], atol=1e-5)
+
+
+def test_decoding_session_rejects_backward_recurrence():
+    x = C.sequence.input_variable(3)
+    model = C.layers.Recurrence(C.layers.GRU(2), go_backwards=True)(x)
+    with pytest.raises(ValueError):
+        DecodingSession(model)
@@ -0,0 +1,93 @@
+# Copyright (c) Microsoft. All rights reserved.
+# Licensed under the MIT license. See LICENSE.md file in the project root
+# for full license information.
+# ==============================================================================
+
+import numpy as np
+import cntk as C
+from cntk.io import MinibatchSource, CTFDeserializer, StreamDef, StreamDefs
+from cntk.utils.quantization import quantize, quantize_weights, compare_quantization, _pack, _unpack
+
+
+def _num_times(model):
+    return len(C.logging.graph.depth_first_search(model,
+        lambda x: isinstance(x, C.Function) and x.op_name == 'Times', depth=-1))
+
+
+def test_quantize():
+    w = np.random.RandomState(0).randn(20, 4).astype(np.float32)
+    q, scale = quantize(w)
+    assert q.dtype == np.int8 and scale.shape == (4,)
+    assert np.abs(q).max() <= 127
+    assert np.allclose(q * scale, w, atol=scale.max())
+
+
+def _create_model():
+    x = C.input_variable(8)
+    with C.layers.default_options(init=C.glorot_uniform(seed=1)):
+        model = C.layers.Sequential([C.layers.Dense(32, activation=C.relu),
+                                     C.layers.Dense(3)])(x)
+    return x, model
+
+
+def test_quantize_weights():
+    x, model = _create_model()
+    quantized = quantize_weights(model, min_size=64)
+
+    assert _num_times(model) == 2
+    assert _num_times(quantized) == 0
+    assert not quantized.parameters
+
+    data = np.random.RandomState(0).rand(5, 8).astype(np.float32)
+    expected = model.eval({x: data})
+    actual = quantized.eval({quantized.arguments[0]: data})
+    assert np.allclose(expected, actual, atol=0.05)
+
+    # weights below min_size stay in floating point
+    assert _num_times(quantize_weights(model, min_size=100)) == 1
+
+
+def test_compare_quantization(tmpdir):
+    rng = np.random.RandomState(0)
+    ctf_file = str(tmpdir / 'quantization.ctf')
+    with open(ctf_file, 'w') as f:
+        for _ in range(20):
+            label = np.zeros(3)
+            label[rng.randint(3)] = 1
+            f.write('|x %s |y %s\n' % (' '.join(str(v) for v in rng.rand(8)),
+                                        ' '.join(str(int(v)) for v in label)))
+
+    x, model = _create_model()
+    quantized = quantize_weights(model, min_size=64)
+
+    mbs = MinibatchSource(CTFDeserializer(ctf_file, StreamDefs(
+        x=StreamDef(field='x', shape=8), y=StreamDef(field='y', shape=3))),
+        randomize=False, max_sweeps=1)
+    result = compare_quantization(model, quantized, mbs, {x: mbs.streams.x},
+                                  label_stream=mbs.streams.y, minibatch_size=8)
+
+    assert result['samples'] == 20
+    assert result['max_abs_error'] < 0.05
+    assert result['agreement'] > 0.8
+    assert 0 <= result['accuracy'] <= 1 and 0 <= result['quantized_accuracy'] <= 1
+
+
+def test_pack():
+    q, _ = quantize(np.random.RandomState(0).randn(10, 7))
+    # the int8 weights are saved three per float32
+    packed = _pack(q)
+    assert packed.dtype == np.float32 and packed.shape == (24,)
+    assert np.array_equal(_unpack(packed, q.shape), q)
+
+
+def test_quantized_model_save_load(tmpdir):
+    x, model = _create_model()
+    quantized = quantize_weights(model, min_size=64)
+
+    filename = str(tmpdir / 'quantized.model')
+    quantized.save(filename)
+    loaded = C.load_model(filename)
+
+    data = np.random.RandomState(0).rand(5, 8).astype(np.float32)
+    assert np.array_equal(quantized.eval({quantized.arguments[0]: data}),
+                          loaded.eval({loaded.arguments[0]: data}))